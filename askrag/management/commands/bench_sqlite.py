@@ -0,0 +1,155 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+def _databases(mode, path):
+    if mode == 'default':
+        return {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}}, []
+    return {
+        'default': {'ENGINE': 'askrag.sqlite_wal', 'NAME': path},
+        'default_read': {'ENGINE': 'askrag.sqlite_wal', 'NAME': path, 'OPTIONS': {'read_only': True}},
+    }, ['askrag.sqlite_wal.router.ReadWriteRouter']
+
+
+def _setup(databases, routers):
+    settings.DATABASES = databases
+    settings.DATABASE_ROUTERS = routers
+    django.setup()
+
+
+def _ping(_):
+    return os.getpid()
+
+
+def _run_process(threads, seconds, write_ratio, user_ids):
+    """One "server process": ``threads`` threads doing registration/activation-like writes and profile reads."""
+    from django.db import OperationalError, connections, transaction
+
+    from rag_user.models import CustomUser, OutboundEmail
+
+    deadline = time.monotonic() + seconds
+    totals = {'reads': 0, 'writes': 0, 'locked': 0, 'write_latencies': []}
+    lock = threading.Lock()
+
+    def work():
+        reads = writes = locked = 0
+        latencies = []
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    if random.random() < write_ratio:
+                        start = time.perf_counter()
+                        if random.random() < 0.5:
+                            # Like registration: insert, then queue the confirmation mail.
+                            with transaction.atomic():
+                                email = OutboundEmail.objects.create(subject="bench_sqlite", to=["bench@example.com"])
+                                OutboundEmail.objects.filter(pk=email.pk).update(attempts=1)
+                        else:
+                            # Like activation: a single UPDATE outside a transaction.
+                            CustomUser.objects.filter(pk=random.choice(user_ids)).update(is_active=True)
+                        latencies.append(time.perf_counter() - start)
+                        writes += 1
+                    else:
+                        CustomUser.objects.filter(pk=random.choice(user_ids)).first()
+                        OutboundEmail.objects.filter(subject="bench_sqlite").count()
+                        reads += 1
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    locked += 1
+        finally:
+            connections.close_all()
+        with lock:
+            totals['reads'] += reads
+            totals['writes'] += writes
+            totals['locked'] += locked
+            totals['write_latencies'] += latencies
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent read/write load on a copy of the SQLite database, with the stock backend "
+        "and with askrag.sqlite_wal. The database itself is not modified."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help="Like gunicorn workers.")
+        parser.add_argument('--threads', type=int, default=2, help="Threads per process.")
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--database', default=str(settings.DATABASES['default']['NAME']))
+
+    def handle(self, *args, **options):
+        source = options['database']
+        with sqlite3.connect(source) as conn:
+            user_ids = [row[0] for row in conn.execute("SELECT id FROM rag_user_customuser LIMIT 1000")]
+        if not user_ids:
+            self.stderr.write("The database has no users to read.")
+            return
+
+        self.stdout.write(
+            f"{options['processes']} processes x {options['threads']} threads, {options['seconds']:g}s each, "
+            f"{options['write_ratio']:.0%} writes, copy of {source}"
+        )
+        workdir = tempfile.mkdtemp(prefix="bench_sqlite_")
+        try:
+            for mode in ('default', 'sqlite_wal'):
+                path = os.path.join(workdir, f"{mode}.sqlite3")
+                self._copy(source, path, journal_mode='DELETE' if mode == 'default' else 'WAL')
+                self._run(mode, path, user_ids, options)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _copy(self, source, path, journal_mode):
+        with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+            dst.execute(f"PRAGMA journal_mode = {journal_mode}")
+        dst.close()
+        src.close()
+
+    def _run(self, mode, path, user_ids, options):
+        databases, routers = _databases(mode, path)
+        pool = ProcessPoolExecutor(
+            max_workers=options['processes'], mp_context=get_context('spawn'),
+            initializer=_setup, initargs=(databases, routers),
+        )
+        try:
+            # Start every process before the clock does.
+            list(pool.map(_ping, range(options['processes'])))
+            start = time.perf_counter()
+            futures = [
+                pool.submit(_run_process, options['threads'], options['seconds'], options['write_ratio'], user_ids)
+                for _ in range(options['processes'])
+            ]
+            results = [future.result() for future in futures]
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.shutdown()
+
+        reads = sum(r['reads'] for r in results)
+        writes = sum(r['writes'] for r in results)
+        locked = sum(r['locked'] for r in results)
+        latencies = sorted(latency for r in results for latency in r['write_latencies'])
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0
+        self.stdout.write(
+            f"{mode:<11} {reads / elapsed:8.0f} reads/s  {writes / elapsed:7.0f} writes/s  "
+            f"p95 write {p95:7.1f} ms  'database is locked' errors: {locked}"
+        )
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from askrag.schema import SCHEMA_ROOT, brotli, generate_schema, write_schema
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema once, with gzip/brotli variants, for /api/schema/ to serve from memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=SCHEMA_ROOT, help="Directory to write to (default: SCHEMA_ROOT).")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        representations = {name: r.compress() for name, r in generate_schema().items()}
+        written = write_schema(representations, options['output'])
+        for name, representation in representations.items():
+            sizes = ", ".join(f"{encoding} {len(data)}" for encoding, data in representation.encoded.items())
+            self.stdout.write(f"{name}: {len(representation.body)} bytes ({sizes}), ETag {representation.etag}")
+        if brotli is None:
+            self.stdout.write("brotli is not installed; only gzip variants were written.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(written)} files to {options['output']} in {time.perf_counter() - start:.2f}s"
+        ))
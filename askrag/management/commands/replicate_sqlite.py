@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from askrag.replicas import REPLICAS, replicate_sqlite
+
+
+class Command(BaseCommand):
+    help = (
+        "Stand-in replication for local testing: copy the primary SQLite database onto the "
+        "SQLite replicas in DATABASE_REPLICAS (SQLITE_REPLICAS), with a fresh heartbeat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('replicas', nargs='*', help="Aliases to copy to (default: all replicas).")
+        parser.add_argument('--loop', action='store_true', help="Keep replicating instead of copying once.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds between copies (with --loop).")
+
+    def handle(self, *args, **options):
+        replicas = options['replicas'] or REPLICAS
+        unknown = set(replicas) - set(REPLICAS)
+        if unknown:
+            raise CommandError(f"Not in DATABASE_REPLICAS: {', '.join(sorted(unknown))}")
+        if not replicas:
+            raise CommandError("No replicas configured; set SQLITE_REPLICAS.")
+
+        while True:
+            timings = replicate_sqlite(replicas)
+            self.stdout.write(", ".join(f"{alias} {seconds * 1000:.0f} ms" for alias, seconds in timings.items()))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
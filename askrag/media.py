@@ -0,0 +1,210 @@
+"""
+Serving for user-uploaded media.
+
+Files are streamed with FileResponse, which WSGI servers such as gunicorn
+hand to ``os.sendfile`` via ``wsgi.file_wrapper``. When a fronting web server
+is available, setting ``MEDIA_SENDFILE_HEADER`` (``X-Accel-Redirect`` for
+nginx, ``X-Sendfile`` for Apache/lighttpd) makes Django return headers only
+and lets the web server send the bytes.
+
+Content-addressed names (see rag_user.storage) never change content, so they
+get their digest as a strong ETag and a one-year immutable Cache-Control.
+Other files get an ETag derived from their content, cached per (size, mtime).
+Range requests honour If-Range given either that ETag or the Last-Modified date.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from rag_user.storage import HASHED_NAME_RE
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 300)}"
+
+# Encodings we look for as precompressed siblings, in order of preference.
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+class _ETagCache:
+    """Content digests of non-hashed files, keyed by path, size and mtime."""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, stat):
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            etag = self._entries.get(key)
+            if etag is not None:
+                self._entries.move_to_end(key)
+                return etag
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()[:32]}"'
+
+        with self._lock:
+            self._entries[key] = etag
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+
+_etags = _ETagCache()
+
+
+class _RangeFile:
+    """Read-only view of ``length`` bytes of an open file, for 206 responses."""
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self._file = f
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def _etag_matches(header, etag):
+    if header.strip() == '*':
+        return True
+    # If-None-Match uses weak comparison.
+    candidates = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return etag.removeprefix('W/') in candidates
+
+
+def _if_range_matches(header, etag, mtime):
+    """If-Range holds an entity tag (strong comparison) or an HTTP date (must equal Last-Modified)."""
+    header = header.strip()
+    if header.startswith(('"', 'W/')):
+        return header == etag
+    date = parse_http_date_safe(header)
+    return date is not None and date == int(mtime)
+
+
+def _parse_range(header, size):
+    """Return ``(start, end)`` inclusive, None to serve the full file, or False if unsatisfiable."""
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Malformed or multi-range requests get the whole representation.
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _select_encoding(request, path, etag):
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for encoding, suffix in PRECOMPRESSED:
+        if encoding in accepted and os.path.isfile(path + suffix):
+            return encoding, path + suffix, f'{etag[:-1]}-{encoding}"'
+    return None, path, etag
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found")
+
+    hashed = HASHED_NAME_RE.search(path)
+    if hashed:
+        etag = f'"{hashed.group(1)}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = _etags.get(full_path, os.stat(full_path))
+        cache_control = DEFAULT_CACHE_CONTROL
+
+    encoding, send_path, etag = _select_encoding(request, full_path, etag)
+    stat = os.stat(send_path)
+    size = stat.st_size
+
+    headers = {
+        'ETag': etag,
+        'Cache-Control': cache_control,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Vary': 'Accept-Encoding',
+    }
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and _etag_matches(if_none_match, etag):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (not if_range or _if_range_matches(if_range, etag, stat.st_mtime)):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    sendfile_header = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+    if sendfile_header:
+        # The web server handles ranges and sends the bytes itself.
+        relative = os.path.relpath(send_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response = HttpResponse(content_type=content_type)
+        if sendfile_header == 'X-Accel-Redirect':
+            response[sendfile_header] = getattr(settings, 'MEDIA_SENDFILE_PREFIX', '/protected-media/') + relative
+        else:
+            response[sendfile_header] = send_path
+    elif byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(_RangeFile(open(send_path, 'rb'), start, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    else:
+        response = FileResponse(open(send_path, 'rb'), content_type=content_type)
+
+    for header, value in headers.items():
+        response[header] = value
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,14 @@
+from django.db import models
+
+
+class ReplicationHeartbeat(models.Model):
+    """
+    A single row the primary keeps updating. Replicas copy it like any other
+    row, so its age as read on a replica is that replica's lag
+    (askrag.replicas).
+    """
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+    beat_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"heartbeat at {self.beat_at}"
@@ -0,0 +1,223 @@
+"""
+Read replicas for user lookups.
+
+``ReplicaRouter`` sends reads of the user model to one of the
+``DATABASE_REPLICAS`` aliases, but only where a slightly stale row is
+acceptable: inside ``replica_reads()``, which wraps JWT user lookups and
+the GET requests of views using ``ReplicaReadsMixin``. Everything else, and
+every write, goes to the primary as before. Settings install the router
+only when ``DATABASE_REPLICAS`` is set; without replicas the scope and the
+mixin do nothing.
+
+Replicas lag behind the primary, so:
+
+* After a write by or to a user, that user's reads are pinned to the
+  primary for ``REPLICA_PIN_SECONDS`` (read-your-writes). A user not
+  found on a replica yet is looked up again on the primary. Pins live in
+  Django's cache, which must be shared between processes for them to
+  hold across workers.
+* The primary keeps a ReplicationHeartbeat row up to date; a replica whose
+  copy of it is more than ``REPLICA_MAX_LAG`` seconds old, or which cannot
+  be queried, gets no reads until it catches up. Each process checks a
+  replica at most once every ``LAG_CHECK_INTERVAL`` seconds.
+
+For trying this locally, ``replicate_sqlite()`` (``manage.py
+replicate_sqlite``) stands in for replication between SQLite files: it
+beats the heartbeat and copies the primary onto each replica with the
+SQLite backup API.
+"""
+import contextvars
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS
+
+
+REPLICAS = list(getattr(settings, 'DATABASE_REPLICAS', []))
+MAX_LAG = getattr(settings, 'REPLICA_MAX_LAG', 5)  # seconds
+PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+LAG_CHECK_INTERVAL = 1.0  # seconds
+PRIMARY = 'default'
+
+
+class _Scope:
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+
+
+_scope = contextvars.ContextVar('replica_reads', default=None)
+
+
+@contextmanager
+def replica_reads(user_id=None):
+    """Let user reads in this block go to a replica, unless ``user_id`` is pinned to the primary."""
+    if not REPLICAS:
+        yield None
+        return
+    token = _scope.set(_Scope(user_id))
+    try:
+        yield _scope.get()
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary in this block, even inside ``replica_reads()``."""
+    token = _scope.set(None)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def _pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def pin_to_primary(user_id):
+    """Send the user's reads to the primary for the next ``PIN_SECONDS``."""
+    cache.set(_pin_key(user_id), 1, PIN_SECONDS)
+
+
+def pin_saved_user(user_id):
+    if REPLICAS:
+        pin_to_primary(user_id)
+
+
+def is_pinned(user_id):
+    return cache.get(_pin_key(user_id)) is not None
+
+
+class ReplicaMonitor:
+    """Per-process view of which replicas are close enough behind the primary to read from."""
+
+    def __init__(self, max_lag=MAX_LAG, check_interval=LAG_CHECK_INTERVAL):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._status = {}
+        self._lock = threading.Lock()
+
+    def lag(self, alias):
+        """Seconds the replica is behind, from its copy of the heartbeat; None if unknown."""
+        from .models import ReplicationHeartbeat
+
+        try:
+            beat_at = ReplicationHeartbeat.objects.using(alias).values_list('beat_at', flat=True).first()
+        except DatabaseError:
+            return None
+        if beat_at is None:
+            return None
+        return max(0.0, (timezone.now() - beat_at).total_seconds())
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            status = self._status.get(alias)
+        if status is None or now - status[0] >= self.check_interval:
+            lag = self.lag(alias)
+            status = (now, lag is not None and lag <= self.max_lag, lag)
+            with self._lock:
+                self._status[alias] = status
+        return status[1]
+
+    def healthy(self, aliases):
+        return [alias for alias in aliases if self.is_healthy(alias)]
+
+    def stats(self):
+        with self._lock:
+            return {alias: {'healthy': healthy, 'lag': lag} for alias, (_, healthy, lag) in self._status.items()}
+
+
+monitor = ReplicaMonitor()
+
+
+def _is_user_model(model):
+    return model._meta.label == settings.AUTH_USER_MODEL
+
+
+class ReplicaRouter:
+    """
+    User reads inside ``replica_reads()`` go to a healthy replica; writes
+    to a user pin their reads to the primary. Otherwise this router has no
+    opinion, leaving the choice to the next router or the default database.
+    """
+
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope is None or not REPLICAS or not _is_user_model(model):
+            return None
+        # Reads in a transaction must see its own writes.
+        if connections[PRIMARY].in_atomic_block:
+            return None
+        if scope.user_id is not None and is_pinned(scope.user_id):
+            return None
+        replicas = monitor.healthy(REPLICAS)
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        # Saves of a user row pin that user from a post_save signal (rag_user.signals),
+        # once a new row has its pk; this covers other writes made on a user's behalf.
+        scope = _scope.get()
+        if REPLICAS and scope is not None and scope.user_id is not None:
+            pin_to_primary(scope.user_id)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {PRIMARY, *REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in REPLICAS:
+            return False
+        return None
+
+
+class ReplicaReadsMixin:
+    """For DRF views: user reads of GET/HEAD/OPTIONS requests may come from a replica."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not REPLICAS or request.method not in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        scope = _scope.get() if REPLICAS else None
+        if scope is not None and request.user.is_authenticated:
+            scope.user_id = request.user.pk
+
+
+def beat():
+    """Update the heartbeat on the primary."""
+    from .models import ReplicationHeartbeat
+
+    ReplicationHeartbeat.objects.using(PRIMARY).update_or_create(pk=1, defaults={'beat_at': timezone.now()})
+
+
+def replicate_sqlite(replicas=None):
+    """
+    Stand-in replication for SQLite: beat the heartbeat, then copy the
+    primary file onto each replica's file. Returns ``{alias: seconds}``.
+    """
+    beat()
+    primary = str(settings.DATABASES[PRIMARY]['NAME'])
+    timings = {}
+    for alias in REPLICAS if replicas is None else replicas:
+        start = time.perf_counter()
+        with closing(sqlite3.connect(primary)) as source, \
+                closing(sqlite3.connect(str(settings.DATABASES[alias]['NAME']))) as replica:
+            source.backup(replica)
+        timings[alias] = time.perf_counter() - start
+    return timings
@@ -0,0 +1,169 @@
+"""
+The OpenAPI schema, generated once and served from memory.
+
+drf-spectacular's own view walks every viewset and serializer on each
+request. Here the schema is rendered once per format, at deploy time by
+``manage.py build_schema`` (which writes it to ``SCHEMA_ROOT``) or on the
+first request when no build is found, and then served from memory with a
+content-derived ETag. gzip and, when the ``brotli`` package is installed,
+brotli variants are compressed once alongside. With ``DEBUG`` on, the
+files are ignored and the schema is generated from the code in each
+process, so edits show up after a reload.
+
+As for media (see askrag.media), encoded variants get their own ETag and
+responses carry ``Vary: Accept, Accept-Encoding``.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.views.decorators.http import require_safe
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+from .media import _etag_matches
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+SCHEMA_ROOT = getattr(settings, 'SCHEMA_ROOT', os.path.join(settings.BASE_DIR, "openapi"))
+# Clients revalidate every time; a matching ETag costs a 304 and no body.
+CACHE_CONTROL = "public, no-cache"
+
+# format: (renderer, content type, file name)
+FORMATS = {
+    'yaml': (OpenApiYamlRenderer, 'application/vnd.oai.openapi; charset=utf-8', "openapi.yaml"),
+    'json': (OpenApiJsonRenderer, 'application/vnd.oai.openapi+json', "openapi.json"),
+}
+# Suffixes of precompressed files, in order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+@dataclass
+class Representation:
+    content_type: str
+    body: bytes
+    etag: str = ""
+    encoded: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.etag = self.etag or f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+
+    def compress(self):
+        self.encoded['gzip'] = gzip.compress(self.body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            self.encoded['br'] = brotli.compress(self.body, quality=11)
+        return self
+
+
+def generate_schema():
+    """Render the schema in every format, uncompressed: ``{format: Representation}``."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    return {
+        name: Representation(content_type, renderer().render(schema, renderer_context={}))
+        for name, (renderer, content_type, _) in FORMATS.items()
+    }
+
+
+def write_schema(representations, root=SCHEMA_ROOT):
+    """Write each format and its compressed variants under ``root``; returns the paths written."""
+    os.makedirs(root, exist_ok=True)
+    written = []
+    for name, representation in representations.items():
+        path = os.path.join(root, FORMATS[name][2])
+        files = [(path, representation.body)]
+        files += [(path + suffix, representation.encoded[encoding])
+                  for encoding, suffix in ENCODINGS if encoding in representation.encoded]
+        for file_path, data in files:
+            # Replace atomically, so a running server never reads half a file.
+            with open(file_path + ".tmp", 'wb') as f:
+                f.write(data)
+            os.replace(file_path + ".tmp", file_path)
+            written.append(file_path)
+    return written
+
+
+def read_schema(root=SCHEMA_ROOT):
+    """The formats built by ``build_schema``, or None if any is missing."""
+    representations = {}
+    for name, (_, content_type, file_name) in FORMATS.items():
+        path = os.path.join(root, file_name)
+        try:
+            with open(path, 'rb') as f:
+                representation = Representation(content_type, f.read())
+        except FileNotFoundError:
+            return None
+        for encoding, suffix in ENCODINGS:
+            if os.path.exists(path + suffix):
+                with open(path + suffix, 'rb') as f:
+                    representation.encoded[encoding] = f.read()
+        representations[name] = representation
+    return representations
+
+
+_schema = None
+_schema_lock = threading.Lock()
+
+
+def get_schema():
+    """The process-wide ``{format: Representation}``, loaded or generated on first use."""
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                schema = None if settings.DEBUG else read_schema()
+                if schema is None:
+                    schema = {name: r.compress() for name, r in generate_schema().items()}
+                _schema = schema
+    return _schema
+
+
+def _select_format(request):
+    requested = request.GET.get('format')
+    if requested in ('json', 'openapi-json'):
+        return 'json'
+    if requested in ('yaml', 'openapi'):
+        return 'yaml'
+    return 'json' if 'json' in request.META.get('HTTP_ACCEPT', '') else 'yaml'
+
+
+def _select_encoding(request, representation):
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for encoding, _ in ENCODINGS:
+        if encoding in accepted and encoding in representation.encoded:
+            return encoding, representation.encoded[encoding], f'{representation.etag[:-1]}-{encoding}"'
+    return None, representation.body, representation.etag
+
+
+@require_safe
+def schema_view(request):
+    """
+    The OpenAPI schema, as YAML or (with ``?format=json`` or an Accept
+    header asking for JSON) as JSON, compressed if the client accepts it.
+    """
+    representation = get_schema()[_select_format(request)]
+    encoding, body, etag = _select_encoding(request, representation)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': CACHE_CONTROL,
+        'Vary': 'Accept, Accept-Encoding',
+    }
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and _etag_matches(if_none_match, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type=representation.content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
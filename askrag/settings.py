@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django_filters',
 
 
+    'askrag',  # project-wide management commands and the replication heartbeat
     'rag_service',
     'rag_user',
 
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -100,6 +102,44 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+DATABASE_ROUTERS = []
+
+# SQLITE_WAL=True for several server processes on one SQLite file (askrag.sqlite_wal):
+# WAL and tuned pragmas, writes queued instead of failing with "database is locked",
+# and reads on a separate read-only connection. `manage.py bench_sqlite` compares the two.
+if os.getenv("SQLITE_WAL", "False") == "True":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'askrag.sqlite_wal',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                'write_timeout': int(os.getenv("SQLITE_WRITE_TIMEOUT", "30")),  # seconds
+            },
+        },
+        'default_read': {
+            'ENGINE': 'askrag.sqlite_wal',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {'read_only': True},
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+    DATABASE_ROUTERS = ['askrag.sqlite_wal.router.ReadWriteRouter']
+
+# Read replicas for user lookups (askrag.replicas); each name is a DATABASES alias.
+# Locally, SQLITE_REPLICAS=replica1,... adds SQLite copies of the primary kept in
+# sync by `manage.py replicate_sqlite --loop`. Read-your-writes pins use CACHES,
+# so use a shared cache backend with multiple workers.
+DATABASE_REPLICAS = [name for name in os.getenv("SQLITE_REPLICAS", "").split(",") if name]
+for name in DATABASE_REPLICAS:
+    DATABASES[name] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f"{name}.sqlite3",
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICA_MAX_LAG = int(os.getenv("REPLICA_MAX_LAG", "5"))  # seconds behind before a replica gets no reads
+REPLICA_PIN_SECONDS = 10  # reads on the primary after a user's writes
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['askrag.replicas.ReplicaRouter'] + DATABASE_ROUTERS
 
 
 # Password validation
@@ -120,6 +160,12 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Hashing runs in a process pool (rag_user.hashing); 0 workers hashes inline.
+# Every web process starts its own PASSWORD_HASH_WORKERS processes (default: one per CPU).
+# Past PASSWORD_HASH_MAX_PENDING queued hashes, logins get a 503 with Retry-After.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -141,6 +187,26 @@ STATIC_URL = 'static/'
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = '/media/'
 
+# Static files are served by WhiteNoise: hashed names from the manifest get
+# far-future immutable caching and precompressed .gz/.br variants.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+WHITENOISE_MANIFEST_STRICT = False
+
+# Media is served by askrag.media.serve_media (ETags, ranges, immutable caching).
+# Set MEDIA_SERVE=False when the web server serves MEDIA_ROOT itself.
+MEDIA_SERVE = os.getenv("MEDIA_SERVE", "True") == "True"
+MEDIA_CACHE_MAX_AGE = 300  # seconds, for files without a content hash in the name
+# "X-Accel-Redirect" (nginx) or "X-Sendfile" (Apache) to hand file bodies to the web server.
+MEDIA_SENDFILE_HEADER = os.getenv("MEDIA_SENDFILE_HEADER") or None
+MEDIA_SENDFILE_PREFIX = '/protected-media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -153,12 +219,28 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'rag_user.serializers.ProfileTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'rag_user.serializers.RevocableTokenRefreshSerializer',
 }
 
+# Revoked tokens (rag_user.revocation); expired rows are deleted by `manage.py prune_revoked_tokens`.
+# Each process picks up other processes' revocations this often, in seconds, from a background thread.
+TOKEN_REVOCATION_SYNC_INTERVAL = int(os.getenv("TOKEN_REVOCATION_SYNC_INTERVAL", "5"))
+TOKEN_REVOCATION_REBUILD_INTERVAL = 3600  # seconds between full Bloom filter rebuilds
+
+# Embed a versioned profile in access tokens so /user/profile/ can skip the DB
+# (rag_user.profile_claims). Use a shared CACHES backend with multiple workers.
+JWT_PROFILE_CLAIMS = os.getenv("JWT_PROFILE_CLAIMS", "False") == "True"
+JWT_PROFILE_VERSION_TTL = 300  # seconds
+
+# Per-process cache of authenticated users (rag_user.authentication)
+AUTH_USER_CACHE_TTL = 60  # seconds
+AUTH_USER_CACHE_MAX_ENTRIES = 10000
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rag_user.authentication.CachedJWTAuthentication',
 
         # 'rest_framework.authentication.TokenAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
@@ -198,6 +280,12 @@ SPECTACULAR_SETTINGS = {
         "persistAuthorization": True,  # keeps token after refresh
     },
 
+    # Documents and ingestion jobs both have a "status" field
+    'ENUM_NAME_OVERRIDES': {
+        'DocumentStatusEnum': 'rag_service.models.Document.STATUS_CHOICES',
+        'IngestionJobStatusEnum': 'rag_service.models.IngestionJob.STATUS_CHOICES',
+    },
+
     # Optional: tag-based grouping
     # 'TAGS': [
     #     {'name': 'Auth', 'description': 'Authentication and user APIs'},
@@ -206,10 +294,13 @@ SPECTACULAR_SETTINGS = {
     # ],
 }
 
+# Prebuilt schema served at /api/schema/ (write it with `manage.py build_schema` on deploy)
+SCHEMA_ROOT = os.path.join(BASE_DIR, "openapi")
+
 
 
 # Email Configuration
-EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "rag_user.mail_backends.PooledSMTPBackend")
 
 # Gmail SMTP Configuration
 EMAIL_HOST = 'smtp.gmail.com'
@@ -219,4 +310,67 @@ EMAIL_USE_SSL = os.getenv("EMAIL_PORT", "587") == "465"
 EMAIL_HOST_USER = os.getenv("EMAIL")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_PASSWORD")
 DEFAULT_FROM_EMAIL = os.getenv("EMAIL")
-EMAIL_TIMEOUT = 10  # seconds
\ No newline at end of file
+EMAIL_TIMEOUT = 10  # seconds
+
+# Connection pool for rag_user.mail_backends.PooledSMTPBackend
+EMAIL_POOL_SIZE = 4
+EMAIL_POOL_IDLE_TIMEOUT = 60  # seconds
+EMAIL_COALESCE_WINDOW = float(os.getenv("EMAIL_COALESCE_WINDOW", "0"))  # seconds, 0 disables batching
+EMAIL_COALESCE_MAX_BATCH = 100
+
+# Outbound email queue (delivered by `manage.py send_queued_mail`)
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_BACKOFF_SECONDS = 30
+EMAIL_OUTBOX_BACKOFF_MAX_SECONDS = 3600
+
+# Profile image pipeline (processed by `manage.py process_images`)
+PROFILE_IMAGE_SIZES = (64, 256, 1024)
+PROFILE_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+PROFILE_IMAGE_STAGING_DIR = os.path.join(BASE_DIR, "tmp", "image_uploads")
+
+# Document ingestion (rag_service)
+RAG_DOCUMENT_ROOT = os.path.join(BASE_DIR, "private_media")
+RAG_CHUNK_MAX_CHARS = 1200
+RAG_CHUNK_MIN_CHARS = 300
+RAG_INSERT_BATCH_SIZE = 500
+
+# Background ingestion (run by `manage.py process_ingestion`)
+RAG_INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", str(os.cpu_count() or 1)))
+RAG_INGEST_MAX_PER_USER = 2  # jobs running at once for one user
+RAG_INGEST_LEASE = 300  # seconds; renewed while a job reports progress
+RAG_INGEST_MAX_ATTEMPTS = 3
+RAG_JOB_EVENTS_INTERVAL = 0.5  # seconds between progress checks in /api/jobs/<id>/events/
+
+# Vector index (memory-mapped; compacted by process_ingestion, or with `manage.py compact_vectors`)
+# Each user's vectors and keyword index form a shard under RAG_INDEX_ROOT/shards/
+RAG_INDEX_ROOT = os.path.join(BASE_DIR, "indexes")
+RAG_SHARD_MEMORY_BUDGET = int(os.getenv("RAG_SHARD_MEMORY_BUDGET", str(512 * 1024 * 1024)))  # bytes of open shards per process
+RAG_EMBEDDING_DIM = 384
+RAG_SEARCH_BLOCK_ROWS = 65536
+RAG_ANN_MIN_ROWS = 50000  # stores this large get an IVF index; smaller ones are searched exactly
+RAG_ANN_NLIST = 1024
+RAG_ANN_NPROBE = 16
+RAG_COMPACT_LOG_ROWS = 20000  # process_ingestion compacts a shard's vector log past this many records
+
+# Keyword index (rebuilt by process_ingestion, or with `manage.py build_bm25`) and hybrid ranking
+RAG_BM25_WINDOW = 16384
+RAG_BM25_REBUILD_LOG_BYTES = 4 * 1024 * 1024  # change log size that triggers a rebuild
+RAG_RRF_K = 60
+RAG_HYBRID_CANDIDATES = 50
+
+# Embeddings: cached by content hash, computed in micro-batches in a process pool
+RAG_EMBEDDING_BATCH_SIZE = 32
+RAG_EMBEDDING_MAX_WAIT = 0.005
+RAG_EMBEDDING_WORKERS = int(os.getenv("RAG_EMBEDDING_WORKERS", "2"))
+RAG_EMBEDDING_CACHE_ENTRIES = 20000
+
+# Question answering (streamed from /api/ask/)
+RAG_QA_TOP_K = 5
+RAG_GENERATOR = os.getenv("RAG_GENERATOR", "rag_service.generation.ExtractiveGenerator")
+RAG_GENERATOR_TOKEN_DELAY = 0.02
+RAG_STREAM_QUEUE_SIZE = 64
+
+# Semantic answer cache (rag_service.answer_cache); uses CACHES
+RAG_ANSWER_CACHE_THRESHOLD = 0.95
+RAG_ANSWER_CACHE_TTL = 3600  # seconds
+RAG_ANSWER_CACHE_MAX_ENTRIES = 200  # per user
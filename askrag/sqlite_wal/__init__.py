@@ -0,0 +1,32 @@
+"""
+SQLite tuned for several server processes.
+
+A Django database backend (``'ENGINE': 'askrag.sqlite_wal'``) wrapping the
+stock sqlite3 one. Every connection switches the file to WAL, so readers
+never block the writer or each other, and applies the pragmas in
+``PRAGMAS`` (``synchronous=NORMAL``, a busy timeout, a larger page cache,
+memory-mapped reads), overridable per database through
+``OPTIONS['pragmas']``.
+
+SQLite still allows one writer at a time, and when several processes race
+for the lock the losers poll and can give up with "database is locked".
+Writes through this backend instead queue: threads of a process on a lock,
+processes on ``flock()`` of ``<NAME>.write-lock``, for up to
+``OPTIONS['write_timeout']`` seconds. A transaction (``BEGIN IMMEDIATE``)
+holds its place in the queue until it commits or rolls back; a write
+outside a transaction holds it for that one statement. A write still
+refused by SQLite (another program holding the lock) is retried until the
+same deadline.
+
+Every ``atomic()`` block on a writable alias opens such a transaction, so
+all of them are serialized per database file, read-only ones included:
+keep reads that need no transaction out of them. A thread cannot write
+through a second writable alias to the same file while it is inside an
+atomic block on the first (SQLite would refuse until the first commits);
+that raises "database is locked" straight away instead of waiting.
+
+With ``OPTIONS['read_only']`` the connection is opened with
+``query_only`` and takes no part in the queue; ``router.ReadWriteRouter``
+sends reads to such an alias and writes to the primary one. See the
+``SQLITE_WAL`` block in the settings.
+"""
@@ -0,0 +1,188 @@
+import fcntl
+import os
+import re
+import threading
+import time
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable at checkpoints rather than at every commit; safe against corruption in WAL mode.
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # milliseconds
+    'cache_size': -64000,  # KiB when negative
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+WRITE_TIMEOUT = 30  # seconds
+
+_WRITE_RE = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b', re.IGNORECASE)
+
+
+class WriteQueue:
+    """
+    One writer at a time per database file: a lock between threads, flock() between processes.
+
+    The holder is a connection, so a thread asking again (through another
+    connection to the same file) would wait on itself; that is refused.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._owner = None
+        self._fd = None
+        self.acquired = self.contended = 0
+        self.waited = 0.0
+
+    def acquire(self, timeout):
+        if self._owner == threading.get_ident():
+            raise OperationalError(
+                "database is locked: this thread is in a transaction on another connection to the same file"
+            )
+        start = time.monotonic()
+        deadline = start + timeout
+        if not self._thread_lock.acquire(timeout=timeout):
+            raise OperationalError("database is locked: timed out waiting in the write queue")
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            delay = 0.001
+            while True:
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise OperationalError("database is locked: timed out waiting in the write queue")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.02)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._owner = threading.get_ident()
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.waited += waited
+        self.contended += waited > 0.001
+        return waited
+
+    def release(self):
+        self._owner = None
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def stats(self):
+        return {'acquired': self.acquired, 'contended': self.contended, 'waited': round(self.waited, 3)}
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(name):
+    """The process-wide WriteQueue for the database file ``name``."""
+    path = os.path.abspath(str(name)) + ".write-lock"
+    with _queues_lock:
+        return _queues.setdefault(path, WriteQueue(path))
+
+
+def _retry_locked(func, deadline):
+    """Call ``func``, retrying while SQLite reports the database locked, until ``deadline``."""
+    delay = 0.005
+    while True:
+        try:
+            return func()
+        except OperationalError as e:
+            if 'locked' not in str(e) or time.monotonic() + delay > deadline:
+                raise
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+        self.read_only = options.get('read_only', False)
+        self.write_timeout = options.get('write_timeout', WRITE_TIMEOUT)
+        self.pragmas = {**PRAGMAS, **options.get('pragmas', {})}
+        self._holds_write_lock = False
+        if not self.read_only:
+            self.execute_wrappers.append(self._queue_write)
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        for key in ('read_only', 'write_timeout', 'pragmas'):
+            kwargs.pop(key, None)
+        if 'transaction_mode' not in self.settings_dict['OPTIONS'] and not self.read_only:
+            # Take the write lock at BEGIN: a read transaction upgraded to a write one
+            # fails immediately with "database is locked" when another writer got there first.
+            self.transaction_mode = 'IMMEDIATE'
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        if self.read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @property
+    def write_queue(self):
+        if self.read_only or self.is_in_memory_db():
+            return None
+        return get_write_queue(self.settings_dict['NAME'])
+
+    def _acquire_write_lock(self):
+        queue = self.write_queue
+        if queue is not None and not self._holds_write_lock:
+            queue.acquire(self.write_timeout)
+            self._holds_write_lock = True
+
+    def _release_write_lock(self):
+        if self._holds_write_lock:
+            self._holds_write_lock = False
+            self.write_queue.release()
+
+    def _start_transaction_under_autocommit(self):
+        self._acquire_write_lock()
+        try:
+            _retry_locked(super()._start_transaction_under_autocommit, time.monotonic() + self.write_timeout)
+        except BaseException:
+            self._release_write_lock()
+            raise
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_write_lock()
+
+    def _queue_write(self, execute, sql, params, many, context):
+        # A transaction took its place in the queue at BEGIN.
+        if self._holds_write_lock or self.in_atomic_block or not _WRITE_RE.match(sql):
+            return execute(sql, params, many, context)
+        self._acquire_write_lock()
+        try:
+            return _retry_locked(lambda: execute(sql, params, many, context),
+                                 time.monotonic() + self.write_timeout)
+        finally:
+            self._release_write_lock()
@@ -0,0 +1,33 @@
+from django.db import connections
+
+
+class ReadWriteRouter:
+    """
+    Reads on ``read_alias``, a read-only connection to the same SQLite file,
+    and everything else on ``write_alias``.
+
+    Reads inside a transaction stay on the writer, the only connection that
+    can see its uncommitted rows. Outside one, WAL readers see every commit
+    at once, so there is no replication lag to worry about.
+    """
+    write_alias = 'default'
+    read_alias = 'default_read'
+
+    def db_for_read(self, model, **hints):
+        if connections[self.write_alias].in_atomic_block:
+            return self.write_alias
+        return self.read_alias
+
+    def db_for_write(self, model, **hints):
+        return self.write_alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {self.write_alias, self.read_alias}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == self.read_alias:
+            return False
+        return None
@@ -1,8 +1,9 @@
 from django.contrib import admin
-from django.urls import path,include
+from django.urls import path,include,re_path
 from django.conf import settings
-from django.conf.urls.static import static
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from .media import serve_media
+from .schema import schema_view
+from drf_spectacular.views import SpectacularSwaggerView
 from rest_framework.routers import DefaultRouter
 
 
@@ -13,11 +14,16 @@ router = DefaultRouter()
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    # path('api/',include('rag_service.urls')),
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+    path('api/',include('rag_service.urls')),
+    path('api/schema/', schema_view, name='schema'),  # prebuilt by `manage.py build_schema`
     path('' , SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
 
 
     path('user/',include('rag_user.urls')),
 
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.MEDIA_SERVE:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+    ]
@@ -1,3 +1,22 @@
 from django.contrib import admin
+from .models import Document, Chunk, IngestionJob
 
-# Register your models here.
+
+@admin.register(Document)
+class DocumentAdmin(admin.ModelAdmin):
+    list_display = ('title', 'owner', 'status', 'page_count', 'chunk_count', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('title', 'owner__username')
+
+
+@admin.register(Chunk)
+class ChunkAdmin(admin.ModelAdmin):
+    list_display = ('document', 'ordinal', 'page')
+    raw_id_fields = ('document',)
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('document', 'owner', 'status', 'priority', 'attempts', 'pages_parsed', 'chunks_embedded', 'created_at')
+    list_filter = ('status',)
+    raw_id_fields = ('document', 'owner')
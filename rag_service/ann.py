@@ -0,0 +1,200 @@
+"""
+Approximate nearest-neighbour search with an inverted file (IVF) index.
+
+Vectors are assigned to the nearest of ``nlist`` centroids found by
+spherical k-means; a query only scans the ``nprobe`` lists whose centroids
+are closest to it. ``nprobe`` trades recall for latency: ``nprobe == nlist``
+is an exact search. Inserts go to the nearest list, deletes remove rows from
+their list, and the centroids are left alone until the index is retrained.
+
+Saved indexes are plain ``.npy`` files loaded with ``mmap_mode='r'``, like
+the exact store in ``vectorstore``; lists are copied only when modified.
+
+A VectorStore with at least ``RAG_ANN_MIN_ROWS`` rows keeps one of these
+next to each generation of its matrix (see rag_service.vectorstore), and
+smaller stores are searched exactly.
+"""
+import json
+import os
+
+import numpy as np
+from django.conf import settings
+
+from .vectorstore import normalise_rows, top_k
+
+
+DEFAULT_NLIST = getattr(settings, 'RAG_ANN_NLIST', 1024)
+DEFAULT_NPROBE = getattr(settings, 'RAG_ANN_NPROBE', 16)
+TRAIN_SAMPLE = 50_000
+# Fewer rows per list than this and k-means has too little to go on.
+MIN_LIST_ROWS = 39
+# Retrain rather than update once a store has grown this many times past the rows it was trained on.
+RETRAIN_GROWTH = 2
+ASSIGN_BLOCK_ROWS = 65536
+
+
+def _assign(vectors, centroids):
+    """Index of the closest centroid for each row, computed in blocks."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_ROWS])
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(vectors, k, iterations=20, seed=0):
+    """Spherical k-means (cosine) on unit vectors; returns unit centroids."""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    if n < k:
+        raise ValueError(f"Need at least {k} vectors to train {k} lists, got {n}.")
+
+    # k-means++ seeding on a subsample keeps initialisation cheap.
+    sample = vectors[rng.choice(n, min(n, 20 * k), replace=False)]
+    centroids = np.empty((k, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = sample[rng.integers(len(sample))]
+    closest = 1.0 - sample @ centroids[0]
+    for i in range(1, k):
+        weights = np.maximum(closest, 0)
+        total = weights.sum()
+        pick = rng.choice(len(sample), p=weights / total) if total > 0 else rng.integers(len(sample))
+        centroids[i] = sample[pick]
+        closest = np.minimum(closest, 1.0 - sample @ centroids[i])
+
+    for _ in range(iterations):
+        labels = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists with random points.
+            sums[empty] = vectors[rng.choice(n, int(empty.sum()), replace=False)]
+        centroids = normalise_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over unit vectors keyed by chunk id."""
+
+    def __init__(self, centroids, nprobe=DEFAULT_NPROBE):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        nlist, dim = self.centroids.shape
+        self.dim = dim
+        self._ids = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._vectors = [np.empty((0, dim), dtype=np.float32) for _ in range(nlist)]
+        self._where = {}
+        self.trained_rows = 0
+
+    @classmethod
+    def train(cls, vectors, nlist=DEFAULT_NLIST, nprobe=DEFAULT_NPROBE, iterations=20, seed=0):
+        """Learn centroids from (a sample of) ``vectors``; the index starts empty."""
+        vectors = normalise_rows(vectors)
+        rows = len(vectors)
+        if rows > TRAIN_SAMPLE:
+            rng = np.random.default_rng(seed)
+            vectors = vectors[rng.choice(rows, TRAIN_SAMPLE, replace=False)]
+        index = cls(kmeans(vectors, nlist, iterations, seed), nprobe)
+        index.trained_rows = rows
+        return index
+
+    @classmethod
+    def build(cls, ids, vectors, nlist=DEFAULT_NLIST, nprobe=DEFAULT_NPROBE):
+        """Train on and fill with ``vectors``, with fewer lists than ``nlist`` for a small set."""
+        index = cls.train(vectors, max(1, min(nlist, len(ids) // MIN_LIST_ROWS)), nprobe)
+        index.add(ids, vectors)
+        return index
+
+    @classmethod
+    def from_store(cls, store, nlist=DEFAULT_NLIST, nprobe=DEFAULT_NPROBE):
+        """Train on and fill from every vector in a ``VectorStore``."""
+        ids, matrix = store.export()
+        return cls.build(ids, matrix, nlist, nprobe)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self._where)
+
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = normalise_rows(vectors)
+        # Re-adding an id replaces its vector.
+        self.remove([chunk_id for chunk_id in ids.tolist() if chunk_id in self._where])
+        labels = _assign(vectors, self.centroids)
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(self.nlist + 1))
+        for list_no in np.flatnonzero(np.diff(bounds)):
+            rows = order[bounds[list_no]:bounds[list_no + 1]]
+            self._ids[list_no] = np.concatenate([self._ids[list_no], ids[rows]])
+            self._vectors[list_no] = np.concatenate([self._vectors[list_no], vectors[rows]])
+            for chunk_id in ids[rows].tolist():
+                self._where[chunk_id] = list_no
+
+    def remove(self, ids):
+        by_list = {}
+        for chunk_id in np.asarray(ids, dtype=np.int64).tolist():
+            list_no = self._where.pop(chunk_id, None)
+            if list_no is not None:
+                by_list.setdefault(list_no, []).append(chunk_id)
+        for list_no, removed in by_list.items():
+            keep = ~np.isin(self._ids[list_no], removed)
+            self._ids[list_no] = self._ids[list_no][keep]
+            self._vectors[list_no] = np.asarray(self._vectors[list_no])[keep]
+
+    def search(self, queries, k=10, nprobe=None):
+        """Like ``VectorStore.search``: ``(ids, scores)`` of shape ``(n_queries, <=k)``."""
+        queries = normalise_rows(queries)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes, _ = top_k(queries @ self.centroids.T, np.arange(self.nlist), nprobe)
+
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            ids = np.concatenate([self._ids[i] for i in lists])
+            if not len(ids):
+                continue
+            scores = np.concatenate([self._vectors[i] @ query for i in lists])
+            best, best_scores = top_k(scores[None, :], ids, k)
+            out_ids[row, :best.shape[1]] = best[0]
+            out_scores[row, :best.shape[1]] = best_scores[0]
+        found = int((out_ids >= 0).sum(axis=1).max(initial=0))
+        return out_ids[:, :found], out_scores[:, :found]
+
+    def save(self, path):
+        """Write the index into the directory ``path``, replacing each file atomically."""
+        os.makedirs(path, exist_ok=True)
+        sizes = np.array([len(ids) for ids in self._ids], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        arrays = {
+            'centroids': self.centroids,
+            'offsets': offsets,
+            'ids': np.concatenate(self._ids),
+            'vectors': np.concatenate([np.asarray(v) for v in self._vectors]),
+        }
+        for name, array in arrays.items():
+            tmp = os.path.join(path, f"{name}.npy.tmp")
+            with open(tmp, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp, os.path.join(path, f"{name}.npy"))
+        with open(os.path.join(path, "ivf.json"), 'w') as f:
+            json.dump({'nlist': self.nlist, 'dim': self.dim, 'nprobe': self.nprobe, 'trained_rows': self.trained_rows}, f)
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        with open(os.path.join(path, "ivf.json")) as f:
+            meta = json.load(f)
+        index = cls(np.load(os.path.join(path, "centroids.npy")), nprobe or meta['nprobe'])
+        index.trained_rows = meta.get('trained_rows', 0)
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        ids = np.load(os.path.join(path, "ids.npy"), mmap_mode='r')
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode='r')
+        for list_no in range(index.nlist):
+            start, end = offsets[list_no], offsets[list_no + 1]
+            index._ids[list_no] = np.asarray(ids[start:end])
+            index._vectors[list_no] = vectors[start:end]
+            index._where.update(dict.fromkeys(index._ids[list_no].tolist(), list_no))
+        return index
@@ -0,0 +1,143 @@
+"""
+Semantic cache of answers, in front of retrieval and generation.
+
+Each user's entries are kept under one key in Django's cache: the question's
+normalised embedding, the answer, its sources, and the version of every
+document the sources came from. A question whose embedding has cosine
+similarity of at least ``RAG_ANSWER_CACHE_THRESHOLD`` with a cached one,
+asked over the same scope, gets the cached answer as long as none of those
+documents changed since. Entries expire after ``RAG_ANSWER_CACHE_TTL``
+seconds; beyond ``RAG_ANSWER_CACHE_MAX_ENTRIES`` per user the least
+recently used go first.
+
+Ingestion drops entries citing a document when it is re-ingested or
+deleted, and all of a user's entries when they add a document (it may hold
+a better answer). As with rag_user.profile_claims, use a shared cache
+backend with several workers. Concurrent writers for one user may drop
+each other's updates; that only costs a cache miss.
+"""
+import threading
+import time
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Document
+
+
+THRESHOLD = getattr(settings, 'RAG_ANSWER_CACHE_THRESHOLD', 0.95)
+TTL = getattr(settings, 'RAG_ANSWER_CACHE_TTL', 3600)
+MAX_ENTRIES = getattr(settings, 'RAG_ANSWER_CACHE_MAX_ENTRIES', 200)
+
+
+def _key(user_id):
+    return f"rag_service:answers:{user_id}"
+
+
+def _scope(k, document_ids):
+    return [k, sorted(document_ids) if document_ids else None]
+
+
+class AnswerCache:
+
+    def __init__(self, threshold=THRESHOLD, ttl=TTL, max_entries=MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.stores = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _entries(self, user_id):
+        now = time.time()
+        return [entry for entry in cache.get(_key(user_id), []) if entry['expires'] > now]
+
+    def lookup(self, user_id, vector, k, document_ids=None):
+        """The cached ``{'answer', 'sources', ...}`` for this question, or None."""
+        entries = self._entries(user_id)
+        scope = _scope(k, document_ids)
+        candidates = [entry for entry in entries if entry['scope'] == scope]
+        if not candidates:
+            self._count('misses')
+            return None
+
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        similarities = np.stack([entry['vector'] for entry in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self._count('misses')
+            return None
+
+        entry = candidates[best]
+        versions = dict(Document.objects.filter(pk__in=entry['versions']).values_list('id', 'version'))
+        if versions != {int(doc): version for doc, version in entry['versions'].items()}:
+            # A cited document was re-ingested or deleted since.
+            self._count('stale')
+            self._count('misses')
+            self._save(user_id, [e for e in entries if e is not entry])
+            return None
+
+        self._count('hits')
+        entry['used'] = time.time()
+        self._save(user_id, entries)
+        return {**entry, 'similarity': float(similarities[best])}
+
+    def store(self, user_id, vector, k, document_ids, question, answer, sources):
+        cited = {source['document_id'] for source in sources}
+        versions = dict(Document.objects.filter(pk__in=cited).values_list('id', 'version'))
+        vector = np.asarray(vector, dtype=np.float32)
+        now = time.time()
+        entries = self._entries(user_id)
+        entries.append({
+            'vector': vector / (np.linalg.norm(vector) or 1.0),
+            'scope': _scope(k, document_ids),
+            'question': question,
+            'answer': answer,
+            'sources': sources,
+            'versions': {str(doc): version for doc, version in versions.items()},
+            'expires': now + self.ttl,
+            'used': now,
+        })
+        if len(entries) > self.max_entries:
+            entries.sort(key=lambda entry: entry['used'])
+            entries = entries[-self.max_entries:]
+        self._save(user_id, entries)
+        self._count('stores')
+
+    def invalidate_document(self, user_id, document_id):
+        """Drop the user's entries that cite ``document_id``."""
+        entries = cache.get(_key(user_id))
+        if entries:
+            self._save(user_id, [e for e in entries if str(document_id) not in e['versions']])
+
+    def clear(self, user_id):
+        cache.delete(_key(user_id))
+
+    def _save(self, user_id, entries):
+        if entries:
+            cache.set(_key(user_id), entries, self.ttl)
+        else:
+            cache.delete(_key(user_id))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'stores': self.stores,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    alookup = sync_to_async(lookup)
+    astore = sync_to_async(store)
+
+
+answer_cache = AnswerCache()
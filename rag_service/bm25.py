@@ -0,0 +1,582 @@
+"""
+BM25 keyword index over chunks.
+
+Postings live in flat NumPy arrays: for term ``t`` they are
+``offsets[t]:offsets[t + 1]`` of ``deltas`` (document-number gaps) and
+``tfs``. Postings are cut into fixed blocks of ``BLOCK_SIZE``; for every
+block the index keeps the last document number and the block's maximum
+BM25 contribution. Document numbers are positions in ``chunk_ids``, which
+maps them back to Chunk primary keys.
+
+Queries use those block maxima to skip work, in the spirit of block-max
+WAND: the document space is cut into windows, each window gets an upper
+bound from the blocks overlapping it, windows are visited best-first, and
+the search stops once no remaining window can beat the current k-th score.
+Inside a window, postings are decoded and scored with vector operations.
+"""
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from array import array
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+
+BLOCK_SIZE = 128
+WINDOW_SIZE = getattr(settings, 'RAG_BM25_WINDOW', 16384)
+K1 = 1.2
+B = 0.75
+FLUSH_POSTINGS = 5_000_000
+# Terms with at most this many blocks get exact per-window bounds.
+SHORT_LIST_BLOCKS = 8
+
+TOKEN_RE = re.compile(r"[^\W_]+(?:[-_./][^\W_]+)*")
+SPLIT_RE = re.compile(r"[-_./]")
+
+
+def tokenize(text):
+    """
+    Case-folded alphanumeric tokens.
+
+    Compound tokens such as part numbers (``PN-1234``, ``v2.1``) are kept
+    whole and also split into their parts, so both spellings match.
+    """
+    tokens = []
+    for token in TOKEN_RE.findall(unicodedata.normalize('NFKC', text).casefold()):
+        tokens.append(token)
+        if SPLIT_RE.search(token):
+            tokens.extend(part for part in SPLIT_RE.split(token) if part)
+    return tokens
+
+
+class BM25Builder:
+    """Accumulates documents and produces a BM25Index."""
+
+    def __init__(self, k1=K1, b=B):
+        self.k1, self.b = k1, b
+        self.vocab = {}
+        self.chunk_ids = array('q')
+        self.doc_len = array('I')
+        self._terms = array('i')
+        self._docs = array('i')
+        self._runs = []
+
+    def add(self, chunk_id, text):
+        vocab = self.vocab
+        term_ids = [vocab.setdefault(token, len(vocab)) for token in tokenize(text)]
+        self.add_term_ids(chunk_id, term_ids)
+
+    def add_term_ids(self, chunk_id, term_ids):
+        """Add a document given as term ids (``vocab`` must already cover them)."""
+        doc = len(self.chunk_ids)
+        self.chunk_ids.append(chunk_id)
+        self.doc_len.append(len(term_ids))
+        self._terms.extend(term_ids)
+        self._docs.extend([doc] * len(term_ids))
+        if len(self._terms) >= FLUSH_POSTINGS:
+            self._flush()
+
+    def add_batch(self, chunk_ids, term_ids, lengths):
+        """Add many documents at once: ``term_ids`` is their concatenated tokens."""
+        first = len(self.chunk_ids)
+        lengths = np.asarray(lengths, dtype=np.uint32)
+        self.chunk_ids.frombytes(np.asarray(chunk_ids, dtype=np.int64).tobytes())
+        self.doc_len.frombytes(lengths.tobytes())
+        self._terms.frombytes(np.asarray(term_ids, dtype=np.int32).tobytes())
+        docs = np.repeat(np.arange(first, first + len(lengths), dtype=np.int32), lengths)
+        self._docs.frombytes(docs.tobytes())
+        if len(self._terms) >= FLUSH_POSTINGS:
+            self._flush()
+
+    def _flush(self):
+        """Collapse buffered tokens into sorted (term, doc, tf) runs."""
+        if not self._terms:
+            return
+        keys = (np.frombuffer(self._terms, dtype=np.int32).astype(np.int64) << 32) | np.frombuffer(self._docs, dtype=np.int32)
+        keys, counts = np.unique(keys, return_counts=True)
+        self._runs.append(((keys >> 32).astype(np.int32), (keys & 0xFFFFFFFF).astype(np.int32), counts))
+        self._terms, self._docs = array('i'), array('i')
+
+    def build(self):
+        self._flush()
+        n_docs, n_terms = len(self.chunk_ids), len(self.vocab)
+        if self._runs:
+            terms = np.concatenate([run[0] for run in self._runs])
+            docs = np.concatenate([run[1] for run in self._runs])
+            tfs = np.concatenate([run[2] for run in self._runs])
+            # Each run is sorted by (term, doc) and runs cover increasing
+            # documents, so a stable sort on term keeps documents in order.
+            order = np.argsort(terms, kind='stable')
+            terms, docs, tfs = terms[order], docs[order], tfs[order]
+        else:
+            terms = docs = tfs = np.empty(0, dtype=np.int64)
+        self._runs = []
+
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=n_terms), out=offsets[1:])
+        doc_len = np.frombuffer(self.doc_len, dtype=np.uint32).copy()
+        avgdl = float(doc_len.mean()) if n_docs else 0.0
+        df = np.diff(offsets)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        index = BM25Index(
+            vocab=self.vocab,
+            chunk_ids=np.frombuffer(self.chunk_ids, dtype=np.int64).copy(),
+            doc_len=doc_len,
+            idf=idf,
+            offsets=offsets,
+            deltas=np.empty(0, dtype=np.uint32),
+            tfs=np.minimum(tfs, np.iinfo(np.uint16).max).astype(np.uint16),
+            block_offsets=np.zeros(n_terms + 1, dtype=np.int64),
+            block_last=np.empty(0, dtype=np.uint32),
+            block_max=np.empty(0, dtype=np.float32),
+            k1=self.k1, b=self.b, avgdl=avgdl,
+        )
+        index._encode(docs.astype(np.int64), terms)
+        return index
+
+
+class BM25Index:
+
+    ARRAYS = ('chunk_ids', 'doc_len', 'idf', 'offsets', 'deltas', 'tfs', 'block_offsets', 'block_last', 'block_max')
+
+    def __init__(self, vocab, chunk_ids, doc_len, idf, offsets, deltas, tfs,
+                 block_offsets, block_last, block_max, k1=K1, b=B, avgdl=0.0):
+        self.vocab = vocab
+        self.chunk_ids = chunk_ids
+        self.doc_len = doc_len
+        self.idf = idf
+        self.offsets = offsets
+        self.deltas = deltas
+        self.tfs = tfs
+        self.block_offsets = block_offsets
+        self.block_last = block_last
+        self.block_max = block_max
+        self.k1, self.b, self.avgdl = k1, b, avgdl
+        self._norm = None
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @property
+    def norm(self):
+        """Per-document BM25 length normalisation, ``k1 * (1 - b + b * dl / avgdl)``."""
+        if self._norm is None:
+            avgdl = self.avgdl or 1.0
+            self._norm = (self.k1 * (1 - self.b + self.b * self.doc_len / avgdl)).astype(np.float32)
+        return self._norm
+
+    def _contributions(self, term, docs, tfs):
+        tfs = tfs.astype(np.float32)
+        return self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.norm[docs])
+
+    def _encode(self, docs, terms):
+        """Delta-encode sorted postings and compute block metadata."""
+        deltas = np.diff(docs, prepend=0)
+        # The first posting of each term is stored absolute.
+        starts = self.offsets[:-1][np.diff(self.offsets) > 0]
+        deltas[starts] = docs[starts]
+        self.deltas = deltas.astype(np.uint32)
+
+        blocks_per_term = -(-np.diff(self.offsets) // BLOCK_SIZE)
+        self.block_offsets = np.zeros(len(blocks_per_term) + 1, dtype=np.int64)
+        np.cumsum(blocks_per_term, out=self.block_offsets[1:])
+        # Posting position where each block starts.
+        block_term = np.repeat(np.arange(len(blocks_per_term)), blocks_per_term)
+        block_rank = np.arange(len(block_term)) - self.block_offsets[block_term]
+        block_start = self.offsets[block_term] + block_rank * BLOCK_SIZE
+        block_end = np.minimum(block_start + BLOCK_SIZE, self.offsets[block_term + 1])
+
+        self.block_last = docs[block_end - 1].astype(np.uint32) if len(block_end) else np.empty(0, dtype=np.uint32)
+        if len(docs):
+            tfs = self.tfs.astype(np.float32)
+            scores = self.idf[terms] * tfs * (self.k1 + 1) / (tfs + self.norm[docs])
+            self.block_max = np.maximum.reduceat(scores, block_start).astype(np.float32)
+        else:
+            self.block_max = np.empty(0, dtype=np.float32)
+
+    def _decode(self, term, first_block, last_block):
+        """Document numbers and tfs of blocks ``first_block..last_block`` (inclusive) of a term."""
+        start = self.offsets[term] + first_block * BLOCK_SIZE
+        end = min(self.offsets[term] + (last_block + 1) * BLOCK_SIZE, self.offsets[term + 1])
+        gaps = self.deltas[start:end].astype(np.int64)
+        if first_block:
+            gaps[0] += int(self.block_last[self.block_offsets[term] + first_block - 1])
+        return np.cumsum(gaps), self.tfs[start:end]
+
+    def query_terms(self, query):
+        """Vocabulary ids of the query's tokens, with their multiplicity."""
+        counts = {}
+        for token in tokenize(query):
+            term = self.vocab.get(token)
+            if term is not None:
+                counts[term] = counts.get(term, 0) + 1
+        return counts
+
+    def search(self, query, k=10, allowed_ids=None, excluded_ids=None, prune=True):
+        """
+        Top-``k`` ``(chunk_ids, scores)`` for a query string.
+
+        ``prune=False`` scores every window in full, which gives the same
+        result and exists to check the pruning.
+        """
+        terms = self.query_terms(query)
+        if not terms or not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if allowed_ids is not None:
+            allowed_ids = np.fromiter(allowed_ids, dtype=np.int64)
+        if excluded_ids:
+            excluded_ids = np.fromiter(excluded_ids, dtype=np.int64)
+
+        n_windows = -(-len(self) // WINDOW_SIZE)
+        window_starts = np.arange(n_windows, dtype=np.int64) * WINDOW_SIZE
+        cursors = []
+        for term, weight in terms.items():
+            n_blocks = self.block_offsets[term + 1] - self.block_offsets[term]
+            cursor_class = _ShortPostings if n_blocks <= SHORT_LIST_BLOCKS else _BlockPostings
+            cursors.append(cursor_class(self, term, weight, window_starts))
+        bounds = np.sum([cursor.window_max for cursor in cursors], axis=0)
+
+        best_docs = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        threshold = 0.0
+        for w in np.argsort(-bounds, kind='stable'):
+            full = len(best_docs) == k
+            if bounds[w] <= 0 or (prune and full and bounds[w] <= threshold):
+                break
+            start = window_starts[w]
+            end = min(start + WINDOW_SIZE, len(self))
+
+            # MaxScore: the weakest terms whose bounds together cannot reach
+            # the threshold are only looked up for documents that the other
+            # ("essential") terms make competitive.
+            window_cursors = sorted((c for c in cursors if c.window_max[w] > 0), key=lambda c: c.window_max[w])
+            rest_bound = 0.0
+            n_optional = 0
+            if prune and full:
+                for cursor in window_cursors:
+                    if rest_bound + cursor.window_max[w] > threshold:
+                        break
+                    rest_bound += cursor.window_max[w]
+                    n_optional += 1
+
+            scores = np.zeros(end - start, dtype=np.float32)
+            for cursor in window_cursors[n_optional:]:
+                docs, contributions = cursor.window(w, start, end)
+                scores[docs - start] += contributions
+            candidates = np.flatnonzero(scores + rest_bound > (threshold if full else 0))
+            if allowed_ids is not None and len(candidates):
+                candidates = candidates[np.isin(self.chunk_ids[start + candidates], allowed_ids)]
+            if excluded_ids is not None and len(excluded_ids) and len(candidates):
+                candidates = candidates[~np.isin(self.chunk_ids[start + candidates], excluded_ids)]
+            if len(candidates) and n_optional:
+                for cursor in window_cursors[:n_optional]:
+                    scores[candidates] += cursor.lookup(start + candidates)
+                candidates = candidates[scores[candidates] > threshold]
+            if not len(candidates):
+                continue
+
+            best_docs = np.concatenate([best_docs, start + candidates])
+            best_scores = np.concatenate([best_scores, scores[candidates]])
+            if len(best_docs) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_docs, best_scores = best_docs[keep], best_scores[keep]
+            if len(best_docs) == k:
+                threshold = float(best_scores.min())
+
+        order = np.lexsort((best_docs, -best_scores))
+        return self.chunk_ids[best_docs[order]], best_scores[order]
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "vocab.json"), 'w') as f:
+            json.dump(self.vocab, f, separators=(',', ':'))
+        with open(os.path.join(path, "meta.json"), 'w') as f:
+            json.dump({'k1': self.k1, 'b': self.b, 'avgdl': self.avgdl, 'block_size': BLOCK_SIZE}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta['block_size'] != BLOCK_SIZE:
+            raise ValueError(f"Index at {path} uses block size {meta['block_size']}; rebuild it.")
+        with open(os.path.join(path, "vocab.json")) as f:
+            vocab = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in cls.ARRAYS}
+        return cls(vocab=vocab, k1=meta['k1'], b=meta['b'], avgdl=meta['avgdl'], **arrays)
+
+
+class _ShortPostings:
+    """
+    A posting list of a few blocks, decoded up front.
+
+    A block of a rare term can stretch over the whole collection, which would
+    make its block bound useless for every window; decoding the few postings
+    gives an exact bound per window instead.
+    """
+
+    def __init__(self, index, term, weight, window_starts):
+        n_blocks = index.block_offsets[term + 1] - index.block_offsets[term]
+        self.docs, tfs = index._decode(term, 0, n_blocks - 1)
+        self.contributions = weight * index._contributions(term, self.docs, tfs)
+        self.window_max = np.zeros(len(window_starts), dtype=np.float32)
+        np.maximum.at(self.window_max, self.docs // WINDOW_SIZE, self.contributions)
+
+    def window(self, w, start, end):
+        lo, hi = np.searchsorted(self.docs, (start, end))
+        return self.docs[lo:hi], self.contributions[lo:hi]
+
+    def lookup(self, docs):
+        positions = np.minimum(np.searchsorted(self.docs, docs), len(self.docs) - 1)
+        return np.where(self.docs[positions] == docs, self.contributions[positions], 0)
+
+
+class _BlockPostings:
+    """A long posting list, bounded per window by its block maxima and decoded lazily."""
+
+    def __init__(self, index, term, weight, window_starts):
+        self.index, self.term, self.weight = index, term, weight
+        lo_block, hi_block = index.block_offsets[term], index.block_offsets[term + 1]
+        self.last = index.block_last[lo_block:hi_block]
+        maxima = index.block_max[lo_block:hi_block]
+        n_blocks = hi_block - lo_block
+        self.first = np.searchsorted(self.last, window_starts, side='left')
+        self.final = np.minimum(np.searchsorted(self.last, window_starts + WINDOW_SIZE - 1, side='left'), n_blocks - 1)
+        self.window_max = np.zeros(len(window_starts), dtype=np.float32)
+        for w in np.flatnonzero(self.first < n_blocks):
+            self.window_max[w] = weight * maxima[self.first[w]:self.final[w] + 1].max()
+
+    def _score(self, docs, tfs):
+        return self.weight * self.index._contributions(self.term, docs, tfs)
+
+    def window(self, w, start, end):
+        docs, tfs = self.index._decode(self.term, self.first[w], self.final[w])
+        lo, hi = np.searchsorted(docs, (start, end))
+        return docs[lo:hi], self._score(docs[lo:hi], tfs[lo:hi])
+
+    def lookup(self, docs):
+        """Contributions for ``docs`` (sorted), decoding only the blocks that span them."""
+        result = np.zeros(len(docs), dtype=np.float32)
+        first, final = np.searchsorted(self.last, (docs[0], docs[-1]))
+        if first == len(self.last):
+            return result
+        block_docs, tfs = self.index._decode(self.term, first, min(final, len(self.last) - 1))
+        positions = np.minimum(np.searchsorted(block_docs, docs), len(block_docs) - 1)
+        hit = block_docs[positions] == docs
+        result[hit] = self._score(block_docs[positions[hit]], tfs[positions[hit]])
+        return result
+
+
+class KeywordIndex:
+    """
+    A published BM25Index plus the changes logged since it was built.
+
+    Ingestion does not rebuild the index: it appends ``add``/``remove``
+    records to ``changes.log`` next to the published files. Every process
+    tails the log before searching; added chunks are scored with the base
+    index's statistics and merged with its results, and removed (or
+    re-added) chunks are excluded from the base. ``process_ingestion`` folds
+    the changes into a fresh base once the log reaches
+    ``RAG_BM25_REBUILD_LOG_BYTES`` (rag_service.jobs.maintain_shard), as
+    does ``build_bm25``.
+    """
+
+    def __init__(self, base, path):
+        self.base = base
+        self.path = path
+        self.log_path = os.path.join(path, "changes.log")
+        self._offset = 0
+        self._added = {}
+        self._hidden = set()
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with self._lock:
+            try:
+                with open(self.log_path, 'rb') as f:
+                    f.seek(self._offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            # Only whole lines; a record being written is read next time.
+            data = data[:data.rfind(b'\n') + 1]
+            self._offset += len(data)
+            for line in data.splitlines():
+                record = json.loads(line)
+                chunk_id = record['id']
+                # Any change supersedes the copy in the base index.
+                self._hidden.add(chunk_id)
+                if record['op'] == 'add':
+                    counts = {}
+                    for token in tokenize(record['text']):
+                        counts[token] = counts.get(token, 0) + 1
+                    self._added[chunk_id] = (counts, sum(counts.values()))
+                else:
+                    self._added.pop(chunk_id, None)
+
+    def __len__(self):
+        self.refresh()
+        with self._lock:
+            hidden = np.fromiter(self._hidden, dtype=np.int64, count=len(self._hidden))
+        return len(self.base) - int(np.isin(hidden, self.base.chunk_ids).sum()) + len(self._added)
+
+    def search(self, query, k=10, allowed_ids=None):
+        self.refresh()
+        with self._lock:
+            hidden = set(self._hidden)
+            added = dict(self._added)
+        if allowed_ids is not None:
+            allowed_ids = set(allowed_ids)
+        ids, scores = self.base.search(query, k, allowed_ids=allowed_ids, excluded_ids=hidden)
+        if not added:
+            return ids, scores
+
+        base = self.base
+        n_docs = len(base) + len(added)
+        avgdl = base.avgdl or max(sum(length for _, length in added.values()) / len(added), 1.0)
+        extra_ids, extra_scores = [], []
+        for token, weight in self._query_counts(query).items():
+            term = base.vocab.get(token)
+            df = int(base.offsets[term + 1] - base.offsets[term]) if term is not None else 0
+            df += sum(1 for counts, _ in added.values() if token in counts)
+            idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+            for chunk_id, (counts, length) in added.items():
+                tf = counts.get(token)
+                if tf and (allowed_ids is None or chunk_id in allowed_ids):
+                    norm = base.k1 * (1 - base.b + base.b * length / avgdl)
+                    extra_ids.append(chunk_id)
+                    extra_scores.append(weight * idf * tf * (base.k1 + 1) / (tf + norm))
+        if not extra_ids:
+            return ids, scores
+
+        # Sum per chunk, then merge with the base results.
+        extra_ids = np.asarray(extra_ids, dtype=np.int64)
+        unique, inverse = np.unique(extra_ids, return_inverse=True)
+        summed = np.bincount(inverse, weights=extra_scores).astype(np.float32)
+        ids = np.concatenate([ids, unique])
+        scores = np.concatenate([scores, summed])
+        order = np.lexsort((ids, -scores))[:k]
+        return ids[order], scores[order]
+
+    def nbytes(self):
+        """Rough memory held: the base index's arrays plus the changes replayed from the log."""
+        with self._lock:
+            terms = sum(len(counts) for counts, _ in self._added.values())
+            # Dict and set entries cost on the order of 100 bytes each.
+            return self.base.nbytes() + 100 * (terms + len(self._added) + len(self._hidden))
+
+    @staticmethod
+    def _query_counts(query):
+        counts = {}
+        for token in tokenize(query):
+            counts[token] = counts.get(token, 0) + 1
+        return counts
+
+
+def index_path(root=None):
+    """The ``bm25`` symlink under ``root`` (default ``RAG_INDEX_ROOT``)."""
+    return os.path.join(root or settings.RAG_INDEX_ROOT, "bm25")
+
+
+@contextmanager
+def _publish_lock(root=None):
+    os.makedirs(root or settings.RAG_INDEX_ROOT, exist_ok=True)
+    with open(f"{index_path(root)}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _current_target(root=None):
+    link = index_path(root)
+    try:
+        return os.path.join(os.path.dirname(link), os.readlink(link))
+    except OSError:
+        return None
+
+
+def change_log_position(root=None):
+    """Where the current change log ends; pass it to ``publish(since=...)``."""
+    target = _current_target(root)
+    if target is None:
+        return None
+    log_path = os.path.join(target, "changes.log")
+    return log_path, os.path.getsize(log_path) if os.path.exists(log_path) else 0
+
+
+def publish(index, since=None, root=None):
+    """
+    Save ``index`` as a new version and point the ``bm25`` symlink at it.
+
+    ``since`` (from ``change_log_position()`` taken before reading the
+    chunks) carries over changes logged while the index was being built;
+    replaying a change the index already contains is harmless. Processes
+    holding the previous version switch on their next ``load_keyword_index()``.
+    """
+    link = index_path(root)
+    target = f"{link}-{time.time_ns()}"
+    index.save(target)
+    with _publish_lock(root):
+        if since is not None and os.path.exists(since[0]):
+            with open(since[0], 'rb') as old, open(os.path.join(target, "changes.log"), 'wb') as new:
+                old.seek(since[1])
+                shutil.copyfileobj(old, new)
+        tmp_link = f"{link}.tmp"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.basename(target), tmp_link)
+        previous = _current_target(root)
+        os.replace(tmp_link, link)
+    if previous and previous != target:
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def _log_changes(records, root=None):
+    with _publish_lock(root):
+        target = _current_target(root)
+        if target is None:
+            target = f"{index_path(root)}-{time.time_ns()}"
+            BM25Builder().build().save(target)
+            os.symlink(os.path.basename(target), index_path(root))
+        with open(os.path.join(target, "changes.log"), 'a') as f:
+            f.writelines(json.dumps(record, separators=(',', ':')) + "\n" for record in records)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def add_chunks(chunks, root=None):
+    """Log ``(chunk_id, text)`` pairs as added to the keyword index."""
+    _log_changes(({'op': 'add', 'id': chunk_id, 'text': text} for chunk_id, text in chunks), root)
+
+
+def remove_chunks(chunk_ids, root=None):
+    _log_changes(({'op': 'remove', 'id': chunk_id} for chunk_id in chunk_ids), root)
+
+
+def load_keyword_index(root=None, current=None):
+    """
+    The KeywordIndex published under ``root``, or None if there is none.
+
+    ``current`` (a previous result) is returned as is while it is still the
+    published version, so callers can check for a new version cheaply.
+    """
+    target = _current_target(root)
+    if target is None:
+        return None
+    if current is not None and current.path == target:
+        return current
+    return KeywordIndex(BM25Index.load(target), target)
@@ -0,0 +1,304 @@
+"""
+Embedding computation for chunks and queries.
+
+``Embedder.embed(texts)`` looks every text up in a two-tier cache keyed by
+a hash of (model, text): an in-process LRU, then a SQLite table shared by
+all processes. Misses from all calling threads are gathered by one
+dispatcher thread into micro-batches of up to ``RAG_EMBEDDING_BATCH_SIZE``
+texts (waiting at most ``RAG_EMBEDDING_MAX_WAIT`` seconds to fill one) and
+run in a process pool. Identical texts requested concurrently are computed
+once. A batch that fails, or whose worker process died, fails the calls
+waiting on it; a broken pool is replaced for the batches after it.
+
+``HashingEmbedder`` is a deterministic stand-in for a real model: it hashes
+words and character trigrams into a fixed number of signed buckets, so
+texts sharing vocabulary get similar vectors. It needs no downloads, which
+keeps ingestion and the benchmarks runnable offline.
+"""
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+import django
+import numpy as np
+from django.conf import settings
+
+from .bm25 import tokenize
+
+
+EMBEDDING_DIM = getattr(settings, 'RAG_EMBEDDING_DIM', 384)
+BATCH_SIZE = getattr(settings, 'RAG_EMBEDDING_BATCH_SIZE', 32)
+MAX_WAIT = getattr(settings, 'RAG_EMBEDDING_MAX_WAIT', 0.005)
+WORKERS = getattr(settings, 'RAG_EMBEDDING_WORKERS', 2)
+MEMORY_CACHE_ENTRIES = getattr(settings, 'RAG_EMBEDDING_CACHE_ENTRIES', 20_000)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and character trigrams, L2-normalised."""
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        words = tokenize(text)
+        yield from words
+        for word in words:
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def embed_one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def __call__(self, texts):
+        return np.stack([self.embed_one(text) for text in texts]) if texts else np.empty((0, self.dim), dtype=np.float32)
+
+
+def _run_model(model, texts):
+    # Runs in a pool process; the model object is pickled with the call.
+    return model(texts)
+
+
+class EmbeddingCache:
+    """In-memory LRU in front of a SQLite table of float32 vectors."""
+
+    def __init__(self, path, max_entries=MEMORY_CACHE_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.memory_hits = self.disk_hits = self.misses = 0
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._connection() as db:
+                db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get_many(self, keys):
+        """``{key: vector}`` for the keys found in either tier."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self.memory_hits += len(found)
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.path:
+            db = self._connection()
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                rows = db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector
+                    self._remember(key, vector)
+            with self._lock:
+                self.disk_hits += len(found) - (len(keys) - len(missing))
+        with self._lock:
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        for key, vector in items:
+            self._remember(key, vector)
+        if self.path and items:
+            with self._connection() as db:
+                db.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+                )
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+            }
+
+
+class Embedder:
+    """Cached, micro-batched access to an embedding model."""
+
+    def __init__(self, model, cache, batch_size=BATCH_SIZE, max_wait=MAX_WAIT, workers=WORKERS):
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self.batches = 0
+        self._pool = None
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._dispatcher = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def dim(self):
+        return self.model.dim
+
+    def key(self, text):
+        return hashlib.blake2b(f"{self.model.name}\0{text}".encode(), digest_size=20).digest()
+
+    def embed(self, texts):
+        """Vectors for ``texts`` as a ``(len(texts), dim)`` float32 array."""
+        texts = list(texts)
+        keys = [self.key(text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        futures = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in futures:
+                futures[key] = self._submit(key, text)
+        for key, future in futures.items():
+            found[key] = future.result()
+
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def embed_query(self, text):
+        return self.embed([text])[0]
+
+    def _submit(self, key, text):
+        with self._pending_lock:
+            future = self._pending.get(key)
+            if future is not None:
+                # Already being computed for another caller.
+                return future
+            future = self._pending[key] = Future()
+        self._ensure_dispatcher()
+        self._queue.put((key, text, future))
+        return future
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None:
+            with self._start_lock:
+                if self._dispatcher is None:
+                    if self.workers:
+                        self._pool = self._new_pool()
+                    self._dispatcher = threading.Thread(target=self._dispatch, name="embedding-dispatcher", daemon=True)
+                    self._dispatcher.start()
+
+    def _new_pool(self):
+        # Spawned rather than forked: this process has threads, database connections and locks.
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'), initializer=django.setup)
+
+    def _replace_pool(self, broken):
+        with self._start_lock:
+            if self._pool is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batches += 1
+            texts = [text for _, text, _ in batch]
+            pool = self._pool
+            future = Future()
+            if pool is not None:
+                try:
+                    pool.submit(_run_model, self.model, texts).add_done_callback(
+                        lambda done, batch=batch, pool=pool: self._finish(batch, done, pool)
+                    )
+                    continue
+                except Exception as e:
+                    # A worker died (BrokenProcessPool) since the last batch.
+                    future.set_exception(e)
+            else:
+                try:
+                    future.set_result(self.model(texts))
+                except Exception as e:
+                    future.set_exception(e)
+            self._finish(batch, future, pool)
+
+    def _finish(self, batch, done, pool=None):
+        error = done.exception()
+        if isinstance(error, BrokenProcessPool) and pool is not None:
+            self._replace_pool(pool)
+        if error is None:
+            vectors = done.result()
+            try:
+                self.cache.put_many([(key, vector) for (key, _, _), vector in zip(batch, vectors)])
+            except Exception:
+                # The vectors are still good; they are computed again next time.
+                pass
+        with self._pending_lock:
+            for key, _, _ in batch:
+                self._pending.pop(key, None)
+        for i, (_, _, future) in enumerate(batch):
+            if error is None:
+                future.set_result(vectors[i])
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {**self.cache.stats(), 'batches': self.batches}
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder(workers=WORKERS):
+    """The process-wide embedder, created on first use with ``workers`` model processes."""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                cache = EmbeddingCache(os.path.join(settings.RAG_INDEX_ROOT, "embeddings.sqlite3"))
+                _embedder = Embedder(HashingEmbedder(EMBEDDING_DIM), cache, workers=workers)
+    return _embedder
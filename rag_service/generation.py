@@ -0,0 +1,59 @@
+"""
+Answer generators for the question-answering endpoint.
+
+A generator is any object with an async ``stream(question, passages)``
+method yielding pieces of answer text as they are produced. The class used
+is set by ``RAG_GENERATOR``; the default ``ExtractiveGenerator`` is a local
+stand-in that needs no model, so streaming can be exercised offline.
+"""
+import asyncio
+import re
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .bm25 import tokenize
+
+
+TOKEN_DELAY = getattr(settings, 'RAG_GENERATOR_TOKEN_DELAY', 0.02)
+MAX_TOKENS = getattr(settings, 'RAG_GENERATOR_MAX_TOKENS', 200)
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+class ExtractiveGenerator:
+    """
+    Answers with the passage sentences that share the most words with the
+    question, emitted one word at a time with a fixed delay to mimic a
+    model's decoding speed.
+    """
+
+    def __init__(self, token_delay=TOKEN_DELAY, max_tokens=MAX_TOKENS):
+        self.token_delay = token_delay
+        self.max_tokens = max_tokens
+
+    def _sentences(self, question, passages):
+        terms = set(tokenize(question))
+        scored = []
+        for rank, passage in enumerate(passages):
+            for position, sentence in enumerate(_SENTENCE_RE.split(passage.text)):
+                overlap = len(terms.intersection(tokenize(sentence)))
+                if overlap:
+                    scored.append((-overlap, rank, position, sentence.strip()))
+        scored.sort()
+        return [sentence for *_, sentence in scored[:3]]
+
+    async def stream(self, question, passages):
+        sentences = self._sentences(question, passages)
+        if not sentences:
+            sentences = ["I could not find an answer to that in your documents."]
+        words = " ".join(sentences).split()[:self.max_tokens]
+        for i, word in enumerate(words):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield word if i == 0 else f" {word}"
+
+
+def get_generator():
+    generator_class = import_string(getattr(settings, 'RAG_GENERATOR', 'rag_service.generation.ExtractiveGenerator'))
+    return generator_class()
@@ -0,0 +1,411 @@
+"""
+DOCX ingestion as a pipeline of generators:
+
+    parse_docx -> normalise -> chunk_blocks -> (spool) -> sync_chunks -> index_chunks
+
+Each stage pulls one item at a time from the previous one, so memory use
+does not grow with the document; chunks wait in a temporary file between
+parsing and the database write. ``word/document.xml`` is read straight out
+of the .docx archive with ``lxml.etree.iterparse``; every top-level
+paragraph or table is cleared once consumed. (``docx.Document()`` would
+build the whole XML tree first, which is what we are avoiding.)
+
+Chunk boundaries are content-defined, so editing one paragraph changes only
+the chunk around it. Each chunk carries a fingerprint of its normalised
+text; re-ingesting a document keeps chunks whose fingerprint is already
+stored and only embeds and indexes the rest.
+
+There is no rolling hash over a byte window: cut points are chosen per
+block (a paragraph or table row) from a BLAKE2b hash of the block's own
+text, and the fingerprint is a BLAKE2b hash of the whole chunk. Blocks are
+the smallest unit an edit touches, so this keeps boundaries as stable as
+a rolling hash would, with one hash per block instead of one per byte.
+"""
+import hashlib
+import pickle
+import re
+import tempfile
+import unicodedata
+import zipfile
+from dataclasses import dataclass
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from docx.oxml.ns import qn
+from lxml import etree
+
+from .answer_cache import answer_cache
+from .embeddings import get_embedder
+from .models import Chunk, Document
+from .shards import get_shards
+
+
+CHUNK_MAX_CHARS = getattr(settings, 'RAG_CHUNK_MAX_CHARS', 1200)
+CHUNK_MIN_CHARS = getattr(settings, 'RAG_CHUNK_MIN_CHARS', 300)
+# On average one block in this many ends a chunk (once it has CHUNK_MIN_CHARS).
+BOUNDARY_MODULUS = 4
+INSERT_BATCH_SIZE = getattr(settings, 'RAG_INSERT_BATCH_SIZE', 500)
+
+W_BODY = qn('w:body')
+W_P = qn('w:p')
+W_TBL = qn('w:tbl')
+W_TR = qn('w:tr')
+W_TC = qn('w:tc')
+W_T = qn('w:t')
+W_TAB = qn('w:tab')
+W_BR = qn('w:br')
+W_TYPE = qn('w:type')
+W_LAST_RENDERED_PAGE_BREAK = qn('w:lastRenderedPageBreak')
+
+_WHITESPACE_RE = re.compile(r'[ \t ]+')
+
+
+class InvalidDocument(Exception):
+    pass
+
+
+@dataclass
+class Block:
+    """A paragraph or table row of source text."""
+    text: str
+    page: int
+
+
+@dataclass
+class TextChunk:
+    ordinal: int
+    text: str
+    page: int
+
+    @property
+    def fingerprint(self):
+        return fingerprint(self.text)
+
+
+@dataclass
+class ChunkDiff:
+    """What ``sync_chunks`` changed: ids of inserted and deleted chunks."""
+    added: list
+    removed: list
+    total: int
+
+
+def fingerprint(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def _ends_chunk(text):
+    """Content-defined cut point: depends only on the block's own text."""
+    digest = hashlib.blake2b(text.encode(), digest_size=4).digest()
+    return int.from_bytes(digest, 'little') % BOUNDARY_MODULUS == 0
+
+
+def _run_text(element):
+    """Text of a paragraph (or table cell), plus the number of page breaks in it."""
+    parts = []
+    breaks = 0
+    for node in element.iter(W_T, W_TAB, W_BR, W_LAST_RENDERED_PAGE_BREAK):
+        if node.tag == W_T:
+            parts.append(node.text or "")
+        elif node.tag == W_TAB:
+            parts.append("\t")
+        elif node.tag == W_BR:
+            if node.get(W_TYPE) == 'page':
+                breaks += 1
+            parts.append("\n")
+        else:
+            breaks += 1
+    return "".join(parts), breaks
+
+
+def iter_document_xml(source):
+    """Yield top-level ``w:p``/``w:tbl`` elements of a .docx, freeing each after use."""
+    try:
+        archive = zipfile.ZipFile(source)
+        stream = archive.open('word/document.xml')
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise InvalidDocument("Not a valid .docx file.") from e
+
+    with archive, stream:
+        try:
+            for _, element in etree.iterparse(stream, events=('end',), tag=(W_P, W_TBL), huge_tree=True):
+                parent = element.getparent()
+                if parent is None or parent.tag != W_BODY:
+                    # Paragraphs inside tables are handled with their table.
+                    continue
+                yield element
+                element.clear()
+                # Drop already-processed siblings so the tree stays small.
+                while element.getprevious() is not None:
+                    del parent[0]
+        except etree.XMLSyntaxError as e:
+            raise InvalidDocument(f"Malformed document.xml: {e}") from e
+
+
+def parse_docx(source, progress=None):
+    """
+    Yield Blocks for every paragraph and table row, in document order.
+
+    Page numbers come from the page breaks Word recorded in the file, so they
+    are only as accurate as the last save in Word.
+    """
+    page = 1
+    for element in iter_document_xml(source):
+        if element.tag == W_P:
+            text, breaks = _run_text(element)
+            yield Block(text, page)
+            page += breaks
+        else:
+            # Direct children only: a nested table's text is part of its cell's.
+            for row in element.iterchildren(W_TR):
+                cells = []
+                for cell in row.iterchildren(W_TC):
+                    text, breaks = _run_text(cell)
+                    cells.append(text)
+                    page += breaks
+                if any(text.strip() for text in cells):
+                    yield Block(" | ".join(cells), page)
+        if progress is not None:
+            progress(page)
+
+
+def normalise(blocks):
+    """Unicode-normalise and collapse whitespace; drop blocks with no text."""
+    for block in blocks:
+        text = unicodedata.normalize('NFKC', block.text)
+        lines = (_WHITESPACE_RE.sub(" ", line).strip() for line in text.splitlines())
+        text = "\n".join(line for line in lines if line)
+        if text:
+            yield Block(text, block.page)
+
+
+def _split_long(text, max_chars):
+    """Split an oversized block on word boundaries."""
+    words = text.split(" ")
+    piece = []
+    size = 0
+    for word in words:
+        if piece and size + len(word) + 1 > max_chars:
+            yield " ".join(piece)
+            piece, size = [], 0
+        piece.append(word)
+        size += len(word) + 1
+    if piece:
+        yield " ".join(piece)
+
+
+def chunk_blocks(blocks, max_chars=CHUNK_MAX_CHARS, min_chars=CHUNK_MIN_CHARS):
+    """
+    Pack consecutive blocks into chunks of at most ``max_chars`` characters.
+
+    A chunk ends after a block whose hash marks it as a boundary (once the
+    chunk holds ``min_chars``), or when the next block would not fit. Since
+    boundaries come from content rather than running offsets, an insertion
+    or edit re-cuts only the chunks around it.
+    """
+    ordinal = 0
+    parts, size, page = [], 0, None
+    for block in blocks:
+        pieces = [block.text] if len(block.text) <= max_chars else _split_long(block.text, max_chars)
+        for piece in pieces:
+            if parts and size + len(piece) + 1 > max_chars:
+                yield TextChunk(ordinal, "\n".join(parts), page)
+                ordinal += 1
+                parts, size = [], 0
+            if not parts:
+                page = block.page
+            parts.append(piece)
+            size += len(piece) + 1
+            if size >= min_chars and _ends_chunk(piece):
+                yield TextChunk(ordinal, "\n".join(parts), page)
+                ordinal += 1
+                parts, size = [], 0
+    if parts:
+        yield TextChunk(ordinal, "\n".join(parts), page)
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _spool(chunks):
+    """
+    Write chunks to a temporary file and return it, rewound.
+
+    Parsing is the slow part of ingestion; doing it before the write
+    transaction keeps that short, so workers ingesting other documents
+    (and progress updates) are not locked out of the database meanwhile.
+    """
+    spool = tempfile.TemporaryFile()
+    for chunk in chunks:
+        pickle.dump(chunk, spool, protocol=pickle.HIGHEST_PROTOCOL)
+    spool.seek(0)
+    return spool
+
+
+def _unspool(spool):
+    while True:
+        try:
+            yield pickle.load(spool)
+        except EOFError:
+            return
+
+
+def sync_chunks(document, chunks, batch_size=INSERT_BATCH_SIZE):
+    """
+    Make the document's stored chunks match ``chunks``.
+
+    Stored chunks with a matching fingerprint are kept and only moved if
+    their position changed; the rest are inserted with bulk_create, and
+    stored chunks that no longer occur are deleted. Only the fingerprints of
+    the stored chunks are held in memory.
+    """
+    stored = {}
+    for row in document.chunks.order_by('-ordinal').values_list('fingerprint', 'id', 'ordinal', 'page').iterator():
+        stored.setdefault(row[0], []).append(row[1:])
+
+    added, to_create, to_move = [], [], []
+    total = 0
+
+    def flush():
+        if to_create:
+            added.extend(chunk.pk for chunk in Chunk.objects.bulk_create(to_create))
+            to_create.clear()
+        if to_move:
+            Chunk.objects.bulk_update(to_move, ['ordinal', 'page'])
+            to_move.clear()
+
+    for chunk in chunks:
+        total += 1
+        digest = chunk.fingerprint
+        matches = stored.get(digest)
+        if matches:
+            # Lists are in reverse order, so pop() takes the earliest copy.
+            chunk_id, ordinal, page = matches.pop()
+            if not matches:
+                del stored[digest]
+            if (ordinal, page) != (chunk.ordinal, chunk.page):
+                to_move.append(Chunk(pk=chunk_id, ordinal=chunk.ordinal, page=chunk.page))
+        else:
+            to_create.append(Chunk(document=document, ordinal=chunk.ordinal, page=chunk.page,
+                                   text=chunk.text, fingerprint=digest))
+        if len(to_create) >= batch_size or len(to_move) >= batch_size:
+            flush()
+    flush()
+
+    removed = [chunk_id for matches in stored.values() for chunk_id, _, _ in matches]
+    for batch in _batched(removed, batch_size):
+        Chunk.objects.filter(pk__in=batch).delete()
+    return ChunkDiff(added, removed, total)
+
+
+def index_chunks(user_id, chunk_ids, batch_size=INSERT_BATCH_SIZE, progress=None):
+    """
+    Embed chunks in bounded batches and add them to the user's shard.
+
+    ``progress`` is called with the number of chunks done after each batch.
+    """
+    embedder, shard = get_embedder(), get_shards().get(user_id, create=True)
+    done = 0
+    for batch_ids in _batched(chunk_ids, batch_size):
+        rows = list(Chunk.objects.filter(pk__in=batch_ids).values_list('id', 'text'))
+        done += len(batch_ids)
+        if rows:
+            shard.add(rows, embedder.embed([text for _, text in rows]))
+        if progress is not None:
+            progress(done)
+
+
+def unindex_chunks(user_id, chunk_ids):
+    """Tombstone chunks in the user's shard."""
+    shard = get_shards().get(user_id) if chunk_ids else None
+    if shard is not None:
+        shard.remove(chunk_ids)
+
+
+def ingest_document(document, progress=None):
+    """
+    Parse and chunk a Document's file and bring its stored chunks in line.
+
+    On re-ingestion only added or changed chunks are embedded and indexed,
+    and removed ones are tombstoned, so the cost follows the size of the
+    edit rather than of the document (apart from reading the file).
+
+    ``progress``, if given, is called with keyword arguments as work is
+    done: ``pages_parsed`` while reading, then ``chunks_total`` (the chunks
+    to embed) and ``chunks_embedded``.
+    """
+    Document.objects.filter(pk=document.pk).update(status=Document.STATUS_PROCESSING, error="")
+    pages = [1]
+
+    def track_page(page):
+        pages[0] = page
+        if progress is not None:
+            progress(pages_parsed=page)
+
+    try:
+        with document.file.open('rb') as source:
+            spool = _spool(chunk_blocks(normalise(parse_docx(source, progress=track_page))))
+    except InvalidDocument as e:
+        document.status = Document.STATUS_FAILED
+        document.error = str(e)
+        document.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+
+    with spool, transaction.atomic():
+        reingest = document.chunks.exists()
+        diff = sync_chunks(document, _unspool(spool))
+
+    if progress is not None:
+        progress(pages_parsed=pages[0], chunks_total=len(diff.added), chunks_embedded=0)
+    on_batch = (lambda done: progress(chunks_embedded=done)) if progress is not None else None
+    try:
+        unindex_chunks(document.owner_id, diff.removed)
+        index_chunks(document.owner_id, diff.added, progress=on_batch)
+    except Exception:
+        # Forget the new chunks, so that a retry inserts and indexes them again.
+        unindex_chunks(document.owner_id, diff.added)
+        Chunk.objects.filter(pk__in=diff.added).delete()
+        raise
+
+    update_fields = ['status', 'chunk_count', 'page_count', 'updated_at']
+    if not reingest:
+        # The new document may answer questions better than cached answers.
+        answer_cache.clear(document.owner_id)
+    elif diff.added or diff.removed:
+        document.version += 1
+        update_fields.append('version')
+        answer_cache.invalidate_document(document.owner_id, document.pk)
+    document.status = Document.STATUS_READY
+    document.chunk_count = diff.total
+    document.page_count = pages[0]
+    document.save(update_fields=update_fields)
+    return diff
+
+
+def delete_document(document):
+    """Delete a document, its stored file and its chunks' index entries."""
+    chunk_ids = list(document.chunks.values_list('id', flat=True))
+    owner_id, document_id = document.owner_id, document.pk
+    document.file.delete(save=False)
+    document.delete()
+    unindex_chunks(owner_id, chunk_ids)
+    answer_cache.invalidate_document(owner_id, document_id)
+
+
+def delete_user_documents(user):
+    """
+    Delete all of a user's documents, with their files, shard and cached answers.
+
+    The shard goes as a whole, so this costs no index writes per chunk.
+    """
+    documents = Document.objects.filter(owner=user)
+    storage = Document._meta.get_field('file').storage
+    for name in documents.values_list('file', flat=True).iterator():
+        storage.delete(name)
+    documents.delete()
+    get_shards().delete(user.pk)
+    answer_cache.clear(user.pk)
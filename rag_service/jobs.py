@@ -0,0 +1,269 @@
+"""
+Background ingestion.
+
+Uploads only store the file and queue an IngestionJob; the
+``process_ingestion`` worker parses, chunks, embeds and indexes documents
+in a pool of processes, so requests return straight away and ingestion
+uses every core.
+
+Jobs are claimed highest priority first, then oldest first, with at most
+``RAG_INGEST_MAX_PER_USER`` running for any one user so a bulk upload
+cannot hold up everyone else, and never two at once for the same document. A claim is a lease: ``next_attempt_at`` is
+pushed ``RAG_INGEST_LEASE`` seconds ahead and renewed whenever the job
+reports progress, so the job of a worker that died is claimed again once
+its lease runs out. Attempts are counted when a job is claimed, which also
+bounds retries of jobs that keep crashing their worker.
+
+After a user's job is done the worker also runs ``maintain_shard()`` for
+them, which compacts the shard's vector append log once it holds
+``RAG_COMPACT_LOG_ROWS`` records and rebuilds its keyword index once the
+change log reaches ``RAG_BM25_REBUILD_LOG_BYTES``, so neither log grows
+without bound between manual runs of ``compact_vectors``/``build_bm25``.
+"""
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThan
+from django.utils import timezone
+
+from .bm25 import BM25Builder, change_log_position, publish
+from .embeddings import get_embedder
+from .ingestion import InvalidDocument, ingest_document
+from .models import Chunk, Document, IngestionJob
+from .shards import get_shards
+
+
+MAX_PER_USER = getattr(settings, 'RAG_INGEST_MAX_PER_USER', 2)
+LEASE_SECONDS = getattr(settings, 'RAG_INGEST_LEASE', 300)
+MAX_ATTEMPTS = getattr(settings, 'RAG_INGEST_MAX_ATTEMPTS', 3)
+COMPACT_LOG_ROWS = getattr(settings, 'RAG_COMPACT_LOG_ROWS', 20_000)
+REBUILD_LOG_BYTES = getattr(settings, 'RAG_BM25_REBUILD_LOG_BYTES', 4 * 1024 * 1024)
+BACKOFF_SECONDS = 30
+# Progress is written to the job row at most this often.
+PROGRESS_INTERVAL = 1.0
+
+_DUE = Q(status=IngestionJob.STATUS_PENDING) | Q(status=IngestionJob.STATUS_PROCESSING)
+
+
+def enqueue_ingestion(document, priority=IngestionJob.PRIORITY_NORMAL, replaced_file=""):
+    """Queue ``document`` for (re-)ingestion and return the job."""
+    Document.objects.filter(pk=document.pk).update(status=Document.STATUS_PENDING, error="")
+    document.status, document.error = Document.STATUS_PENDING, ""
+    return IngestionJob.objects.create(
+        document=document, owner_id=document.owner_id, priority=priority,
+        file=document.file.name, replaced_file=replaced_file,
+    )
+
+
+def claim_jobs(limit, max_per_user=MAX_PER_USER):
+    """
+    Lease up to ``limit`` due jobs, respecting the per-user concurrency limit.
+
+    Jobs still processing under an expired lease are due again: their
+    worker is gone.
+
+    Each job is claimed with its own conditional UPDATE that re-checks the
+    limits in the database, so concurrent claimers cannot exceed them; like
+    rag_user.mail.claim_batch, only rows stamped with this claim's token
+    are returned.
+    """
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    token = uuid.uuid4()
+    leased = IngestionJob.objects.filter(status=IngestionJob.STATUS_PROCESSING, next_attempt_at__gt=now)
+    owner_running = (
+        leased.filter(owner_id=OuterRef('owner_id')).order_by().values('owner_id')
+        .annotate(count=Count('pk')).values('count')
+    )
+    claimable = IngestionJob.objects.filter(_DUE, next_attempt_at__lte=now).filter(
+        LessThan(Coalesce(Subquery(owner_running), 0), max_per_user),
+        # Two jobs for one document would race each other's chunk updates.
+        ~Exists(leased.filter(document_id=OuterRef('document_id'))),
+    )
+
+    # Pick from a snapshot first, so a long queue costs one UPDATE per claim; jobs
+    # claimed by someone else meanwhile fail their UPDATE and are left out.
+    snapshot = list(leased.values_list('owner_id', 'document_id'))
+    running = Counter(owner_id for owner_id, _ in snapshot)
+    busy_documents = {document_id for _, document_id in snapshot}
+    candidates = claimable.order_by('-priority', 'created_at').values_list('id', 'owner_id', 'document_id')
+    picked = []
+    for job_id, owner_id, document_id in candidates.iterator():
+        if running[owner_id] >= max_per_user or document_id in busy_documents:
+            continue
+        running[owner_id] += 1
+        busy_documents.add(document_id)
+        picked.append(job_id)
+        if len(picked) >= limit:
+            break
+    claimed = 0
+    for job_id in picked:
+        claimed += claimable.filter(pk=job_id).update(
+            status=IngestionJob.STATUS_PROCESSING,
+            next_attempt_at=now + timedelta(seconds=LEASE_SECONDS),
+            attempts=F('attempts') + 1,
+            started_at=now,
+            claimed_by=token,
+        )
+    if not claimed:
+        return []
+    return list(IngestionJob.objects.filter(claimed_by=token).order_by('-priority', 'created_at'))
+
+
+def release_jobs(job_ids):
+    """Make jobs whose worker process died claimable again without waiting for the lease."""
+    IngestionJob.objects.filter(id__in=job_ids, status=IngestionJob.STATUS_PROCESSING).update(
+        next_attempt_at=timezone.now(),
+    )
+
+
+class JobProgress:
+    """Progress callback for ingest_document that records progress on the job and renews its lease."""
+
+    def __init__(self, job, interval=PROGRESS_INTERVAL):
+        self.job = job
+        self.interval = interval
+        self.fields = {}
+        self._written = time.monotonic()
+
+    def __call__(self, **counters):
+        self.fields.update(counters)
+        if time.monotonic() - self._written >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.fields:
+            try:
+                _update(self.job, next_attempt_at=timezone.now() + timedelta(seconds=LEASE_SECONDS), **self.fields)
+            except OperationalError:
+                # SQLite is busy with another worker's write; report at the next call instead.
+                pass
+            else:
+                self.fields = {}
+        self._written = time.monotonic()
+
+
+def _update(job, **fields):
+    # The job may have been deleted along with its document meanwhile.
+    IngestionJob.objects.filter(pk=job.pk).update(**fields)
+
+
+def run_job(job_id, embedding_workers=None):
+    """
+    Ingest a claimed job's document. Returns the job's new status.
+
+    ``embedding_workers`` sets the size of this process's embedding pool
+    if it has none yet.
+    """
+    job = IngestionJob.objects.select_related('document').filter(pk=job_id).first()
+    if job is None:
+        return None
+    document = job.document
+    if _superseded(job, document):
+        # Re-uploaded again before this job ran; the newer job ingests the document.
+        _hand_over(job, document)
+        _update(job, status=IngestionJob.STATUS_DONE, error="", finished_at=timezone.now())
+        return IngestionJob.STATUS_DONE
+    if embedding_workers is not None:
+        get_embedder(workers=embedding_workers)
+    if job.attempts > MAX_ATTEMPTS:
+        # Its earlier attempts never finished: they took their worker down with them.
+        _fail(job, document, RuntimeError(f"Gave up after {MAX_ATTEMPTS} attempts."))
+        return IngestionJob.STATUS_FAILED
+    progress = JobProgress(job)
+
+    try:
+        ingest_document(document, progress=progress)
+    except Exception as e:
+        progress.flush()
+        now = timezone.now()
+        if isinstance(e, InvalidDocument) or job.attempts >= MAX_ATTEMPTS:
+            _fail(job, document, e)
+            return IngestionJob.STATUS_FAILED
+        _update(job, status=IngestionJob.STATUS_PENDING, error=str(e),
+                next_attempt_at=now + timedelta(seconds=BACKOFF_SECONDS * job.attempts))
+        Document.objects.filter(pk=document.pk).update(status=Document.STATUS_PENDING)
+        return IngestionJob.STATUS_PENDING
+
+    progress.flush()
+    if job.replaced_file:
+        document.file.storage.delete(job.replaced_file)
+    _update(job, status=IngestionJob.STATUS_DONE, error="", finished_at=timezone.now())
+    return IngestionJob.STATUS_DONE
+
+
+def maintain_shard(user_id, compact_log_rows=COMPACT_LOG_ROWS, rebuild_log_bytes=REBUILD_LOG_BYTES):
+    """
+    Compact the user's vector store once its append log holds
+    ``compact_log_rows`` records (appends and tombstones), and rebuild their
+    keyword index once its change log reaches ``rebuild_log_bytes``.
+    Returns a list of what was done.
+    """
+    shard = get_shards().get(user_id)
+    if shard is None:
+        return []
+    done = []
+    stats = shard.vectors.stats()
+    if stats['log_rows'] + stats['tombstones'] >= compact_log_rows:
+        rows = shard.vectors.compact()
+        done.append(f"vectors compacted ({rows} rows)")
+    position = change_log_position(shard.path)
+    if position is not None and position[1] >= rebuild_log_bytes:
+        index = rebuild_keyword_index(user_id, shard.path)
+        done.append(f"keyword index rebuilt ({len(index)} chunks)")
+    return done
+
+
+def rebuild_keyword_index(user_id, root):
+    """Build the user's BM25 index from their stored chunks and publish it under ``root``; returns it."""
+    builder = BM25Builder()
+    # Changes logged from here on are carried over to the new index.
+    since = change_log_position(root)
+    chunks = Chunk.objects.filter(document__owner_id=user_id).order_by('id').values_list('id', 'text')
+    for chunk_id, text in chunks.iterator(chunk_size=2000):
+        builder.add(chunk_id, text)
+    index = builder.build()
+    publish(index, since=since, root=root)
+    return index
+
+
+def _superseded(job, document):
+    # Jobs queued before ``file`` was recorded have it empty.
+    return bool(job.file) and document.file.name != job.file
+
+
+def _hand_over(job, document):
+    """
+    A newer upload replaced this job's file before it was ingested: the
+    newer job now replaces the file this one did, and this one's file goes.
+    """
+    IngestionJob.objects.filter(document_id=document.pk, replaced_file=job.file).exclude(pk=job.pk).update(
+        replaced_file=job.replaced_file,
+    )
+    document.file.storage.delete(job.file)
+
+
+def _fail(job, document, error):
+    _update(job, status=IngestionJob.STATUS_FAILED, error=str(error), finished_at=timezone.now())
+    if job.replaced_file and isinstance(error, InvalidDocument):
+        # A rejected re-upload: keep serving the previous version, unless a
+        # newer upload has replaced this one too and takes over from here.
+        document.refresh_from_db(fields=['file'])
+        if _superseded(job, document):
+            _hand_over(job, document)
+            Document.objects.filter(pk=document.pk).update(status=Document.STATUS_PENDING, error="")
+            return
+        document.file.delete(save=False)
+        Document.objects.filter(pk=document.pk).update(
+            file=job.replaced_file, status=Document.STATUS_READY, error="",
+        )
+    else:
+        Document.objects.filter(pk=document.pk).update(status=Document.STATUS_FAILED, error=str(error))
+
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from rag_service.bm25 import BM25Builder
+
+
+class Command(BaseCommand):
+    help = (
+        "Build a BM25 index over a synthetic corpus (Zipf-distributed vocabulary) and "
+        "report build time, index size and query latency with and without block-max pruning."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=1_000_000)
+        parser.add_argument('--vocab', type=int, default=200_000)
+        parser.add_argument('--length', type=int, default=60, help="Mean tokens per chunk.")
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        n, vocab_size = options['chunks'], options['vocab']
+
+        start = time.perf_counter()
+        builder = BM25Builder()
+        builder.vocab = {f"t{i}": i for i in range(vocab_size)}
+        batch = 50_000
+        for first in range(0, n, batch):
+            count = min(batch, n - first)
+            lengths = rng.poisson(options['length'], count).clip(1)
+            builder.add_batch(np.arange(first, first + count), self._terms(rng, lengths.sum(), vocab_size), lengths)
+        index = builder.build()
+        self.stdout.write(
+            f"built {n} chunks in {time.perf_counter() - start:.1f}s, "
+            f"{index.nbytes() / 1024 / 1024:.0f} MiB of postings and metadata"
+        )
+
+        # Queries mix common and rare terms, like "torque spec PN-4471".
+        queries = [
+            " ".join(f"t{t}" for t in self._terms(rng, rng.integers(2, 5), vocab_size))
+            for _ in range(options['queries'])
+        ]
+        results = {}
+        for label, prune in (("exhaustive", False), ("block-max", True)):
+            timings = []
+            results[label] = []
+            for query in queries:
+                start = time.perf_counter()
+                ids, _ = index.search(query, 10, prune=prune)
+                timings.append(time.perf_counter() - start)
+                results[label].append(ids)
+            p50, p95 = np.percentile(timings, [50, 95]) * 1000
+            self.stdout.write(f"{label:<11} p50 {p50:7.2f} ms   p95 {p95:7.2f} ms   {len(queries) / sum(timings):7.1f} q/s")
+
+        same = sum(np.array_equal(a, b) for a, b in zip(results["exhaustive"], results["block-max"]))
+        self.stdout.write(f"identical top-10: {same}/{len(queries)}")
+
+    @staticmethod
+    def _terms(rng, count, vocab_size):
+        # Zipf-like: term rank r is drawn with probability ~ 1/r.
+        return np.minimum(np.exp(rng.random(count) * np.log(vocab_size)).astype(np.int64) - 1, vocab_size - 1)
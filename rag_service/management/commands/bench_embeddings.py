@@ -0,0 +1,56 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from rag_service.embeddings import Embedder, EmbeddingCache, HashingEmbedder
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed a synthetic stream of chunks and queries from concurrent callers, "
+        "with and without the cache and micro-batching, using the hashing stand-in model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=4000)
+        parser.add_argument('--distinct', type=int, default=1000, help="Distinct texts the requests are drawn from.")
+        parser.add_argument('--callers', type=int, default=16)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=32)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        words = [f"w{i}" for i in range(5000)]
+        texts = [" ".join(rng.choice(words, 80)) for _ in range(options['distinct'])]
+        # Popular texts repeat, as re-ingested chunks and common questions do.
+        picks = np.minimum(rng.zipf(1.3, options['requests']) - 1, len(texts) - 1)
+        stream = [texts[i] for i in picks]
+        model = HashingEmbedder()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['callers']) as callers:
+            list(callers.map(lambda text: model([text]), stream))
+        baseline = time.perf_counter() - start
+        self.stdout.write(f"uncached, one text per call  {len(stream) / baseline:8.1f} texts/s")
+
+        with tempfile.TemporaryDirectory() as path:
+            cache_path = os.path.join(path, "embeddings.sqlite3")
+            for label in ("cold cache", "warm disk cache"):
+                embedder = Embedder(model, EmbeddingCache(cache_path), batch_size=options['batch_size'],
+                                    workers=options['workers'])
+                start = time.perf_counter()
+                with ThreadPoolExecutor(options['callers']) as callers:
+                    list(callers.map(lambda text: embedder.embed([text]), stream))
+                elapsed = time.perf_counter() - start
+                stats = embedder.stats()
+                embedder.close()
+                computed = stats['misses']
+                self.stdout.write(
+                    f"{label:<28} {len(stream) / elapsed:8.1f} texts/s   hit rate {stats['hit_rate']:.1%} "
+                    f"(memory {stats['memory_hits']}, disk {stats['disk_hits']})   "
+                    f"{computed} computed in {stats['batches']} batches"
+                )
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rag_service.jobs import rebuild_keyword_index
+from rag_service.shards import get_shards, user_ids_with_shards
+
+
+class Command(BaseCommand):
+    help = "Rebuild users' BM25 keyword indexes from their stored chunks, folding in logged changes, and publish them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help="Only rebuild this user's shard (repeatable). Defaults to every shard.")
+
+    def handle(self, *args, **options):
+        for user_id in options['users'] or user_ids_with_shards():
+            start = time.perf_counter()
+            shard = get_shards().get(user_id, create=True)
+            index = rebuild_keyword_index(user_id, shard.path)
+            self.stdout.write(self.style.SUCCESS(
+                f"User {user_id}: indexed {len(index)} chunks, {len(index.vocab)} terms, "
+                f"{index.nbytes() / 1024 / 1024:.1f} MiB in {time.perf_counter() - start:.1f}s"
+            ))
@@ -0,0 +1,49 @@
+import time
+from itertools import islice
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from rag_service.bm25 import BM25Builder, change_log_position, publish
+from rag_service.embeddings import get_embedder
+from rag_service.models import Chunk
+from rag_service.shards import get_shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild users' retrieval shards (vectors and keyword index) from their stored chunks. "
+        "Embeddings come from the embedding cache where possible."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help="Only rebuild this user's shard (repeatable). Defaults to every user with chunks.")
+
+    def handle(self, *args, **options):
+        user_ids = options['users'] or list(
+            Chunk.objects.order_by().values_list('document__owner_id', flat=True).distinct()
+        )
+        embedder = get_embedder()
+        for user_id in user_ids:
+            start = time.perf_counter()
+            shard = get_shards().get(user_id, create=True)
+            # Changes made from here on are carried over to the rebuilt indexes.
+            vectors_since = shard.vectors.log_position()
+            keywords_since = change_log_position(shard.path)
+
+            builder = BM25Builder()
+            ids, vectors = [], []
+            chunks = Chunk.objects.filter(document__owner_id=user_id).order_by('id').values_list('id', 'text').iterator(chunk_size=2000)
+            while rows := list(islice(chunks, 500)):
+                for chunk_id, text in rows:
+                    builder.add(chunk_id, text)
+                ids.extend(chunk_id for chunk_id, _ in rows)
+                vectors.append(embedder.embed([text for _, text in rows]))
+
+            matrix = np.concatenate(vectors) if vectors else np.empty((0, embedder.dim), dtype=np.float32)
+            shard.vectors.replace(ids, matrix, since=vectors_since)
+            publish(builder.build(), since=keywords_since, root=shard.path)
+            self.stdout.write(self.style.SUCCESS(
+                f"User {user_id}: {len(ids)} chunks in {time.perf_counter() - start:.1f}s"
+            ))
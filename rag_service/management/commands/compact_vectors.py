@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from rag_service.shards import get_shards, user_ids_with_shards
+
+
+class Command(BaseCommand):
+    help = "Fold the append logs of users' vector indexes into their memory-mapped matrices."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-log-rows', type=int, default=0,
+                            help="Skip compaction while the append log holds fewer records than this.")
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help="Only compact this user's shard (repeatable). Defaults to every shard.")
+
+    def handle(self, *args, **options):
+        for user_id in options['users'] or user_ids_with_shards():
+            shard = get_shards().get(user_id)
+            if shard is None:
+                continue
+            store = shard.vectors
+            stats = store.stats()
+            pending = stats['log_rows'] + stats['tombstones']
+            if pending == 0 or pending < options['min_log_rows']:
+                self.stdout.write(f"User {user_id}: nothing to do: {stats['rows']} rows, {stats['log_rows']} appended, {stats['tombstones']} removed")
+                continue
+            rows = store.compact()
+            self.stdout.write(self.style.SUCCESS(
+                f"User {user_id}: compacted {stats['log_rows']} appended and {stats['tombstones']} removed rows; "
+                f"generation {stats['generation'] + 1} has {rows} rows"
+            ))
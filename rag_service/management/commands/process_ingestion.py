@@ -0,0 +1,91 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rag_service.jobs import claim_jobs, maintain_shard, release_jobs, run_job
+from rag_service.models import IngestionJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Parse, chunk, embed and index queued documents in a pool of worker processes. "
+        "Users' indexes are compacted in the pool as well once their append logs grow."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'RAG_INGEST_WORKERS', os.cpu_count() or 1))
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of exiting when the queue is empty.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep between polls when idle (with --loop).")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        totals = {}
+
+        while True:
+            # Spawned rather than forked, so workers open their own database connections.
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=django.setup)
+            try:
+                idle = self._drain(pool, workers, options, totals)
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+            if idle:
+                break
+
+        summary = ", ".join(f"{count} {status}" for status, count in sorted(totals.items())) or "nothing to do"
+        self.stdout.write(self.style.SUCCESS(f"Done: {summary}"))
+
+    def _drain(self, pool, workers, options, totals):
+        """Run jobs until the queue is empty (returns True) or the pool breaks (returns False)."""
+        running = {}
+        maintaining = {}  # future -> user id
+        while True:
+            for job in claim_jobs(workers - len(running) - len(maintaining)):
+                # Each job already has a process to itself; embed in it rather than in a pool per job.
+                running[pool.submit(run_job, job.pk, embedding_workers=0)] = job
+
+            if not running and not maintaining:
+                if not options['loop']:
+                    return True
+                time.sleep(options['interval'])
+                continue
+
+            done, _ = wait([*running, *maintaining], timeout=options['interval'], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in maintaining:
+                    user_id = maintaining.pop(future)
+                    try:
+                        actions = future.result()
+                    except BrokenProcessPool:
+                        release_jobs([job.pk for job in running.values()])
+                        self.stderr.write(f"Worker process died maintaining user {user_id}'s shard; restarting the pool.")
+                        return False
+                    except Exception as e:
+                        # Tried again after the user's next job.
+                        self.stderr.write(f"Could not maintain user {user_id}'s shard: {e}")
+                        continue
+                    for action in actions:
+                        self.stdout.write(f"User {user_id}: {action}")
+                    continue
+                job = running.pop(future)
+                try:
+                    status = future.result()
+                except BrokenProcessPool:
+                    # A worker process died; nothing in flight can finish now.
+                    release_jobs([job.pk, *(other.pk for other in running.values())])
+                    self.stderr.write(f"Worker process died while running job {job.pk}; restarting the pool.")
+                    return False
+                except Exception as e:
+                    # Left to its lease: the job is retried once that runs out.
+                    self.stderr.write(f"Job {job.pk} could not be completed: {e}")
+                    continue
+                status = status or "skipped"
+                totals[status] = totals.get(status, 0) + 1
+                self.stdout.write(f"Job {job.pk} (document {job.document_id}): {status}")
+                if status == IngestionJob.STATUS_DONE and job.owner_id not in maintaining.values():
+                    maintaining[pool.submit(maintain_shard, job.owner_id)] = job.owner_id
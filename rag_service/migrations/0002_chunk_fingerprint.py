@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_service', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_service', '0004_ingestionjob_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='claimed_by',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,3 +1,108 @@
 from django.db import models
-
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
 # Create your models here.
+
+
+def document_storage():
+    # Uploaded documents are private, so keep them out of MEDIA_ROOT.
+    return FileSystemStorage(location=settings.RAG_DOCUMENT_ROOT)
+
+
+class Document(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='documents')
+    title = models.CharField(max_length=255)
+    file = models.FileField(upload_to="documents/", storage=document_storage)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True)
+    page_count = models.PositiveIntegerField(default=0)
+    chunk_count = models.PositiveIntegerField(default=0)
+    # Bumped whenever re-ingestion changes the document's chunks.
+    version = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.title
+
+
+class Chunk(models.Model):
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
+    ordinal = models.PositiveIntegerField()
+    page = models.PositiveIntegerField(default=1)
+    text = models.TextField()
+    fingerprint = models.CharField(max_length=32, blank=True)
+
+    class Meta:
+        ordering = ['document', 'ordinal']
+        indexes = [
+            models.Index(fields=['document', 'ordinal'], name='chunk_document_ordinal_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.document_id}#{self.ordinal}"
+
+
+class IngestionJob(models.Model):
+    """A queued parse/chunk/embed run for a Document, executed by `process_ingestion`."""
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    # Higher runs first.
+    PRIORITY_LOW = -10
+    PRIORITY_NORMAL = 0
+    PRIORITY_HIGH = 10
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    priority = models.SmallIntegerField(default=PRIORITY_NORMAL)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Earliest time the job may be claimed; while processing, the end of the worker's lease.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set by the worker that claimed the job, as on rag_user's OutboundEmail.
+    claimed_by = models.UUIDField(null=True, blank=True, editable=False)
+    # The document's file when the job was queued, which is the one it ingests.
+    file = models.CharField(max_length=255, blank=True)
+    # The file a re-upload replaced: deleted once the new one is ingested, put back if it is rejected.
+    replaced_file = models.CharField(max_length=255, blank=True)
+    pages_parsed = models.PositiveIntegerField(default=0)
+    chunks_total = models.PositiveIntegerField(default=0)
+    chunks_embedded = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='ingestion_job_due_idx'),
+            models.Index(fields=['owner', 'status'], name='ingestion_job_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.document_id} ({self.status})"
@@ -0,0 +1,148 @@
+"""
+Question answering: retrieve passages from the user's documents, then
+stream an answer as server-sent events.
+
+The stream starts with a ``sources`` event as soon as retrieval is done,
+followed by ``token`` events while the generator runs and a final ``done``
+(or ``error``) event. Answers found in the semantic answer cache are sent
+as the same events without retrieving or generating anything.
+
+The generator runs as its own task feeding a bounded queue: when the client
+reads slowly the queue fills and generation pauses, and when the client
+disconnects the response is cancelled, which cancels the generator task too.
+"""
+import asyncio
+import json
+import time
+from contextlib import suppress
+from dataclasses import asdict, dataclass
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .embeddings import get_embedder
+from .generation import get_generator
+from .models import Chunk, Document
+from .retrieval import hybrid_search
+
+
+TOP_K = getattr(settings, 'RAG_QA_TOP_K', 5)
+QUEUE_SIZE = getattr(settings, 'RAG_STREAM_QUEUE_SIZE', 64)
+# Tokens already waiting in the queue are sent together, up to this many.
+MAX_TOKENS_PER_EVENT = 16
+
+_DONE = object()
+
+
+@dataclass
+class Passage:
+    chunk_id: int
+    document_id: int
+    document_title: str
+    page: int
+    score: float
+    text: str
+
+
+def retrieve(user, question, k=TOP_K, document_ids=None, query_vector=None):
+    """The user's ``k`` best passages for ``question``, best first."""
+    # The user's shard only holds their own chunks, so ids are only listed
+    # to narrow the search to some documents or to leave out failed ones.
+    # (Documents queued for re-ingestion keep serving their current chunks.)
+    chunks = Chunk.objects.filter(document__owner=user)
+    allowed = None
+    if document_ids:
+        allowed = chunks.filter(document_id__in=document_ids).exclude(document__status=Document.STATUS_FAILED)
+    elif chunks.filter(document__status=Document.STATUS_FAILED).exists():
+        allowed = chunks.exclude(document__status=Document.STATUS_FAILED)
+    if allowed is not None:
+        allowed = list(allowed.values_list('id', flat=True))
+        if not allowed:
+            return []
+
+    if query_vector is None:
+        query_vector = get_embedder().embed_query(question)
+    ranked = hybrid_search(user.pk, question, query_vector, k=k, allowed_ids=allowed)
+    rows = chunks.select_related('document').in_bulk([chunk_id for chunk_id, _ in ranked])
+    return [
+        Passage(chunk.id, chunk.document_id, chunk.document.title, chunk.page, round(score, 6), chunk.text)
+        for chunk_id, score in ranked
+        if (chunk := rows.get(chunk_id)) is not None
+    ]
+
+
+aretrieve = sync_to_async(retrieve, thread_sensitive=False)
+
+
+def embed_query(question):
+    return get_embedder().embed_query(question)
+
+
+aembed_query = sync_to_async(embed_query, thread_sensitive=False)
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def cached_answer_events(entry):
+    """Events for an answer served from the answer cache."""
+    yield sse('sources', entry['sources'])
+    yield sse('token', {'text': entry['answer']})
+    yield sse('done', {'cached': True, 'similarity': round(entry['similarity'], 4)})
+
+
+async def answer_events(question, passages, generator=None, queue_size=QUEUE_SIZE, on_complete=None):
+    """
+    Async iterator of SSE-encoded events for one answer.
+
+    ``on_complete`` is awaited with the full answer text once it has been
+    generated without errors (not when the client disconnected first).
+    """
+    generator = generator or get_generator()
+    started = time.perf_counter()
+    yield sse('sources', [asdict(passage) for passage in passages])
+
+    queue = asyncio.Queue(maxsize=queue_size)
+
+    async def produce():
+        try:
+            async for token in generator.stream(question, passages):
+                # Waits while the queue is full, i.e. while the client lags.
+                await queue.put(token)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(_DONE)
+
+    producer = asyncio.create_task(produce())
+    tokens = 0
+    pending = None
+    answer = []
+    try:
+        while True:
+            item = pending if pending is not None else await queue.get()
+            pending = None
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                yield sse('error', {'detail': "Answer generation failed."})
+                return
+            batch = [item]
+            while len(batch) < MAX_TOKENS_PER_EVENT and not queue.empty():
+                item = queue.get_nowait()
+                if item is _DONE or isinstance(item, Exception):
+                    pending = item
+                    break
+                batch.append(item)
+            tokens += len(batch)
+            answer.extend(batch)
+            yield sse('token', {'text': "".join(batch)})
+        if on_complete is not None:
+            await on_complete("".join(answer))
+        yield sse('done', {'tokens': tokens, 'elapsed_ms': round((time.perf_counter() - started) * 1000)})
+    finally:
+        # Runs on completion and when the client disconnects.
+        producer.cancel()
+        with suppress(asyncio.CancelledError):
+            await producer
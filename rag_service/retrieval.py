@@ -0,0 +1,51 @@
+"""
+Hybrid retrieval: BM25 for exact terms (part numbers, names) and vector
+search for meaning, merged with reciprocal-rank fusion (RRF).
+
+RRF only looks at ranks, so the two score scales never need calibrating:
+a chunk's fused score is ``sum(weight / (RRF_K + rank))`` over the rankings
+it appears in.
+"""
+from django.conf import settings
+
+from .shards import get_shards
+
+
+RRF_K = getattr(settings, 'RAG_RRF_K', 60)
+CANDIDATES = getattr(settings, 'RAG_HYBRID_CANDIDATES', 50)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, weights=None, limit=None):
+    """
+    Fuse ranked lists of ids into one list of ``(id, score)``, best first.
+
+    Ties keep the order in which ids were first seen.
+    """
+    scores = {}
+    for i, ranking in enumerate(rankings):
+        weight = 1.0 if weights is None else weights[i]
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    fused = sorted(scores.items(), key=lambda pair: -pair[1])
+    return fused[:limit] if limit else fused
+
+
+def hybrid_search(user_id, query, query_vector=None, k=10, allowed_ids=None, candidates=CANDIDATES):
+    """
+    Top-``k`` chunk ids for ``query`` in the user's shard, as ``[(chunk_id, score)]``.
+
+    Either side may be missing (no keyword index published yet, or no query
+    vector); the other side's ranking is then used on its own.
+    """
+    shard = get_shards().get(user_id)
+    if shard is None:
+        return []
+    rankings = []
+    keyword_index = shard.keyword_index()
+    if keyword_index is not None:
+        ids, _ = keyword_index.search(query, candidates, allowed_ids=allowed_ids)
+        rankings.append(ids.tolist())
+    if query_vector is not None:
+        ids, _ = shard.vectors.search(query_vector, candidates, allowed_ids=allowed_ids)
+        rankings.append(ids[0].tolist())
+    return reciprocal_rank_fusion(rankings, limit=k)
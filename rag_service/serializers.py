@@ -0,0 +1,53 @@
+import zipfile
+
+from rest_framework import serializers
+from drf_spectacular.utils import extend_schema_field
+from .models import Document, Chunk, IngestionJob
+
+
+class DocumentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Document
+        fields = ['id', 'title', 'file', 'status', 'error', 'page_count', 'chunk_count', 'version', 'created_at', 'updated_at']
+        read_only_fields = ['status', 'error', 'page_count', 'chunk_count', 'version', 'created_at', 'updated_at']
+        # Documents are private: the stored file is never exposed by URL.
+        extra_kwargs = {'title': {'required': False}, 'file': {'write_only': True}}
+
+    def validate_file(self, value):
+        if not value.name.lower().endswith('.docx'):
+            raise serializers.ValidationError("Only .docx files are supported.")
+        # Parsing happens later in a worker; catch files that are not .docx
+        # archives at all now, which only reads the zip directory.
+        try:
+            with zipfile.ZipFile(value) as archive:
+                archive.getinfo('word/document.xml')
+        except (zipfile.BadZipFile, KeyError):
+            raise serializers.ValidationError("Not a valid .docx file.")
+        value.seek(0)
+        return value
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IngestionJob
+        fields = ['id', 'document', 'status', 'priority', 'attempts', 'pages_parsed', 'chunks_total',
+                  'chunks_embedded', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+
+class QueuedDocumentSerializer(DocumentSerializer):
+    """A document as returned on upload, with the job that will ingest it (passed as ``context['job']``)."""
+    job = serializers.SerializerMethodField()
+
+    class Meta(DocumentSerializer.Meta):
+        fields = DocumentSerializer.Meta.fields + ['job']
+
+    @extend_schema_field(IngestionJobSerializer)
+    def get_job(self, document):
+        return IngestionJobSerializer(self.context['job']).data
+
+
+class ChunkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Chunk
+        fields = ['id', 'ordinal', 'page', 'text']
@@ -0,0 +1,145 @@
+"""
+Per-user retrieval shards.
+
+Every user's chunks are indexed in a directory of their own,
+``RAG_INDEX_ROOT/shards/<user_id>/``, holding a VectorStore (``vectors/``)
+and a BM25 keyword index (``bm25`` and its versions) laid out exactly as
+described in rag_service.vectorstore and rag_service.bm25. A query opens
+only the asking user's shard, so its cost follows the size of that user's
+corpus rather than of the whole deployment, and other users' rows never
+need filtering out.
+
+Shards are opened on first use and kept in a per-process LRU. Once the
+open shards add up to more than ``RAG_SHARD_MEMORY_BUDGET`` bytes, the
+least recently used are closed; reopening one is cheap, since its vectors
+are memory-mapped. Deleting a user removes their shard directory in one
+go instead of tombstoning every chunk.
+"""
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import bm25
+from .vectorstore import DEFAULT_DIM, VectorStore
+
+
+MEMORY_BUDGET = getattr(settings, 'RAG_SHARD_MEMORY_BUDGET', 512 * 1024 * 1024)
+
+
+def shard_path(user_id):
+    return os.path.join(settings.RAG_INDEX_ROOT, "shards", str(int(user_id)))
+
+
+class Shard:
+    """One user's vector store and keyword index."""
+
+    def __init__(self, path, dim=DEFAULT_DIM):
+        self.path = path
+        self.vectors = VectorStore(os.path.join(path, "vectors"), dim)
+        self._keyword_index = None
+        self._lock = threading.Lock()
+
+    def keyword_index(self):
+        """The published keyword index, reloaded when a new version is published; None if there is none."""
+        with self._lock:
+            self._keyword_index = bm25.load_keyword_index(self.path, current=self._keyword_index)
+            return self._keyword_index
+
+    def add(self, rows, vectors):
+        """Index ``(chunk_id, text)`` rows with their embeddings."""
+        self.vectors.add([chunk_id for chunk_id, _ in rows], vectors)
+        bm25.add_chunks(rows, root=self.path)
+
+    def remove(self, chunk_ids):
+        if chunk_ids:
+            self.vectors.remove(chunk_ids)
+            bm25.remove_chunks(chunk_ids, root=self.path)
+
+    def nbytes(self):
+        keyword_index = self._keyword_index
+        return self.vectors.nbytes() + (keyword_index.nbytes() if keyword_index is not None else 0)
+
+
+class ShardCache:
+    """Open shards by user id, least recently used first out beyond ``memory_budget`` bytes."""
+
+    def __init__(self, memory_budget=MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = self.evictions = 0
+
+    def get(self, user_id, create=False):
+        """The user's shard; None if it does not exist yet, unless ``create``."""
+        user_id = int(user_id)
+        with self._lock:
+            shard = self._shards.get(user_id)
+            if shard is not None:
+                self._shards.move_to_end(user_id)
+                return shard
+
+        path = shard_path(user_id)
+        if not create and not os.path.isdir(path):
+            return None
+        shard = Shard(path)
+        shard.keyword_index()
+        with self._lock:
+            # Another thread may have opened it meanwhile; keep the first.
+            shard = self._shards.setdefault(user_id, shard)
+            self._shards.move_to_end(user_id)
+            self.loads += 1
+        self.evict()
+        return shard
+
+    def evict(self):
+        """Close least recently used shards until the rest fit the memory budget."""
+        with self._lock:
+            sizes = {user_id: shard.nbytes() for user_id, shard in self._shards.items()}
+            total = sum(sizes.values())
+            # The most recently used shard stays open even if it alone is over budget.
+            while total > self.memory_budget and len(self._shards) > 1:
+                user_id, _ = self._shards.popitem(last=False)
+                total -= sizes[user_id]
+                self.evictions += 1
+
+    def delete(self, user_id):
+        """Forget the user's shard and remove its files."""
+        user_id = int(user_id)
+        with self._lock:
+            self._shards.pop(user_id, None)
+        shutil.rmtree(shard_path(user_id), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open': len(self._shards),
+                'bytes': sum(shard.nbytes() for shard in self._shards.values()),
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+
+_shards = None
+_shards_lock = threading.Lock()
+
+
+def get_shards():
+    """The process-wide ShardCache, created on first use."""
+    global _shards
+    if _shards is None:
+        with _shards_lock:
+            if _shards is None:
+                _shards = ShardCache()
+    return _shards
+
+
+def user_ids_with_shards():
+    """Ids of the users that have a shard directory."""
+    try:
+        names = os.listdir(os.path.join(settings.RAG_INDEX_ROOT, "shards"))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name) for name in names if name.isdigit())
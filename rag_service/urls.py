@@ -0,0 +1,15 @@
+from rest_framework.routers import DefaultRouter
+from django.urls import path, include
+from .views import *
+
+
+
+router = DefaultRouter()
+router.register(r'documents', DocumentViewSet, basename='documents')  # will be /api/documents/
+router.register(r'jobs', IngestionJobViewSet, basename='jobs')  # /api/jobs/
+
+urlpatterns = [
+    path('jobs/<int:pk>/events/', job_events, name='job-events'),  # /api/jobs/<id>/events/ (server-sent events)
+    path('', include(router.urls)),
+    path('ask/', ask, name='ask'),  # /api/ask/ (server-sent events)
+]
@@ -0,0 +1,478 @@
+"""
+Exact vector search over chunk embeddings.
+
+Vectors are L2-normalised on the way in, so cosine similarity is a dot
+product. The index directory holds one generation of files at a time:
+
+    meta.json             {"dim": ..., "rows": ..., "generation": ...}
+    vectors-<gen>.f32     rows x dim float32, C order
+    ids-<gen>.i64         chunk id of each row
+    append-<gen>.log      records appended since the generation was written
+    ivf-<gen>/            IVF index of the matrix (rag_service.ann), for large stores
+
+The main matrix is opened with ``np.memmap`` in read-only mode, so opening
+the store costs a few syscalls and every worker process shares the same
+pages through the OS page cache. New vectors are appended to the log, which
+each reader tails on the next search; ``compact()`` folds the log into a new
+generation and switches ``meta.json`` over atomically. Files of the old
+generation are unlinked, which is safe for processes still mapping them.
+
+``remove()`` appends tombstones to the log: records whose id is
+``-(chunk_id + 1)``. A tombstone hides every earlier row for that id, so an
+id can be removed and added again; compaction drops the dead rows.
+
+Once a generation holds ``RAG_ANN_MIN_ROWS`` rows or more it is written
+with an IVF index, and searches probe that instead of scanning the matrix;
+the append log is still scanned exactly and tombstoned ids are filtered
+out. ``compact()`` brings the previous index up to date with the log's
+inserts and deletes (retraining only once the store has outgrown it), and
+``replace()`` trains a new one. Both do that work outside the write lock,
+so appends carry on meanwhile and are carried over to the new generation's
+log. Smaller stores, and searches restricted with ``allowed_ids``, use
+exact search.
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+
+DEFAULT_DIM = getattr(settings, 'RAG_EMBEDDING_DIM', 384)
+SEARCH_BLOCK_ROWS = getattr(settings, 'RAG_SEARCH_BLOCK_ROWS', 65536)
+ANN_MIN_ROWS = getattr(settings, 'RAG_ANN_MIN_ROWS', 50_000)
+
+
+def normalise_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores, ids, k):
+    """Best ``k`` (ids, scores) per row of ``scores``, sorted by descending score."""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    best = np.take_along_axis(part, order, axis=1)
+    return ids[best], np.take_along_axis(part_scores, order, axis=1)
+
+
+def _merge(best_ids, best_scores, ids, scores, k):
+    """Merge two ``(ids, scores)`` results of the same queries, keeping the best ``k`` per row."""
+    if not best_ids.shape[1]:
+        return ids, scores
+    scores = np.concatenate([best_scores, scores], axis=1)
+    ids = np.concatenate([best_ids, ids], axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+class VectorStore:
+    """
+    Memory-mapped float32 matrix plus an append log.
+
+    Safe to share between threads; several processes may read while one
+    writes, with writes serialised by an ``fcntl`` lock on ``index.lock``.
+    ``ann_min_rows=None`` turns the IVF index off.
+    """
+
+    def __init__(self, path, dim=DEFAULT_DIM, ann_min_rows=ANN_MIN_ROWS):
+        self.path = path
+        self.dim = dim
+        self.ann_min_rows = ann_min_rows
+        self._lock = threading.Lock()
+        self._meta_stat = None
+        self._generation = None
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._log_offset = 0
+        self._log_vectors = []
+        self._log_ids = []
+        self._dead = {}
+        self._dead_arrays = None
+        self._ann = None
+        os.makedirs(path, exist_ok=True)
+        with self._write_lock():
+            if not os.path.exists(self._meta_path):
+                self._write_generation(0, np.empty((0, dim), dtype=np.float32), np.empty(0, dtype=np.int64))
+        self.refresh()
+
+    # -- layout ------------------------------------------------------------
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    def _file(self, kind, generation):
+        suffix = {'vectors': 'f32', 'ids': 'i64', 'append': 'log'}[kind]
+        return os.path.join(self.path, f"{kind}-{generation}.{suffix}")
+
+    def _ann_path(self, generation):
+        return os.path.join(self.path, f"ivf-{generation}")
+
+    @property
+    def _record_dtype(self):
+        return np.dtype([('id', '<i8'), ('vector', '<f4', (self.dim,))])
+
+    @contextmanager
+    def _write_lock(self):
+        with open(os.path.join(self.path, "index.lock"), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        with open(self._meta_path) as f:
+            meta = json.load(f)
+        if meta['dim'] != self.dim:
+            raise ValueError(f"Index at {self.path} has dimension {meta['dim']}, expected {self.dim}.")
+        return meta
+
+    def _write_generation(self, generation, matrix, ids, ann=None):
+        """Write a complete generation (with its IVF index, if any), then point meta.json at it."""
+        if ann is not None:
+            ann.save(self._ann_path(generation))
+        for kind, data in (('vectors', matrix), ('ids', ids)):
+            tmp = self._file(kind, generation) + ".tmp"
+            with open(tmp, 'wb') as f:
+                data.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._file(kind, generation))
+        open(self._file('append', generation), 'wb').close()
+
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'dim': self.dim, 'rows': len(ids), 'generation': generation}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._meta_path)
+
+    # -- reading -----------------------------------------------------------
+
+    def refresh(self):
+        """Pick up a new generation or records appended by other processes."""
+        with self._lock:
+            for attempt in range(3):
+                stat = os.stat(self._meta_path)
+                key = (stat.st_ino, stat.st_mtime_ns)
+                if key == self._meta_stat:
+                    break
+                try:
+                    meta = self._read_meta()
+                    if meta['generation'] != self._generation:
+                        self._open_generation(meta)
+                except FileNotFoundError:
+                    # Compacted away between reading meta.json and opening it.
+                    if attempt == 2:
+                        raise
+                    continue
+                self._meta_stat = key
+                break
+            self._tail_log()
+
+    def _open_generation(self, meta):
+        generation, rows = meta['generation'], meta['rows']
+        if rows:
+            self._matrix = np.memmap(self._file('vectors', generation), dtype=np.float32, mode='r', shape=(rows, self.dim))
+            self._ids = np.memmap(self._file('ids', generation), dtype=np.int64, mode='r', shape=(rows,))
+        else:
+            self._matrix = np.empty((0, self.dim), dtype=np.float32)
+            self._ids = np.empty(0, dtype=np.int64)
+        self._ann = self._load_ann(generation, rows)
+        self._generation = generation
+        self._log_offset = 0
+        self._log_vectors, self._log_ids = [], []
+        self._dead, self._dead_arrays = {}, None
+
+    def _load_ann(self, generation, rows):
+        from .ann import DEFAULT_NPROBE, IVFIndex
+
+        if self.ann_min_rows is None or rows < self.ann_min_rows:
+            return None
+        try:
+            return IVFIndex.load(self._ann_path(generation), nprobe=DEFAULT_NPROBE)
+        except FileNotFoundError:
+            # Written before the store reached ANN_MIN_ROWS; the next compaction adds one.
+            return None
+
+    def _next_ann(self, ids, matrix, previous_generation=None, segments=None, dead=None):
+        """
+        The IVF index for a new generation holding ``ids``/``matrix``: None for
+        a small store, otherwise the previous generation's index updated with
+        the inserts and deletes of its log (``segments``/``dead``, as read for
+        ``ids``/``matrix``), or a newly trained one.
+        """
+        from .ann import RETRAIN_GROWTH, IVFIndex
+
+        if self.ann_min_rows is None or len(ids) < self.ann_min_rows:
+            return None
+        previous = None
+        if previous_generation is not None:
+            try:
+                previous = IVFIndex.load(self._ann_path(previous_generation))
+            except FileNotFoundError:
+                pass
+        if previous is None or len(ids) > RETRAIN_GROWTH * previous.trained_rows:
+            return IVFIndex.build(ids, matrix)
+
+        if dead is not None:
+            previous.remove(dead[0])
+        for log_matrix, log_ids, first in segments[1:]:
+            alive = self._alive(log_ids, first + np.arange(len(log_ids)), dead)
+            previous.add(log_ids[alive], log_matrix[alive])
+        return previous
+
+    def _tail_log(self):
+        log_path = self._file('append', self._generation)
+        try:
+            size = os.path.getsize(log_path)
+        except FileNotFoundError:
+            return
+        record_size = self._record_dtype.itemsize
+        # Ignore a partially written trailing record; it is read next time.
+        complete = self._log_offset + (size - self._log_offset) // record_size * record_size
+        if complete <= self._log_offset:
+            return
+        with open(log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            records = np.frombuffer(f.read(complete - self._log_offset), dtype=self._record_dtype)
+        self._log_offset = complete
+
+        tombstone = records['id'] < 0
+        if tombstone.any():
+            # A tombstone kills rows of its id that come before it.
+            position = len(self._ids) + (len(self._log_ids[0]) if self._log_ids else 0)
+            adds_before = np.cumsum(~tombstone) - ~tombstone
+            for i in np.flatnonzero(tombstone):
+                self._dead[-int(records['id'][i]) - 1] = position + int(adds_before[i])
+            self._dead_arrays = None
+            records = records[~tombstone]
+        self._log_vectors.append(np.array(records['vector']))
+        self._log_ids.append(np.array(records['id']))
+        if len(self._log_vectors) > 1:
+            self._log_vectors = [np.concatenate(self._log_vectors)]
+            self._log_ids = [np.concatenate(self._log_ids)]
+
+    def _segments(self):
+        """``(matrix, ids, first_position)`` per segment, plus the tombstone arrays and IVF index."""
+        with self._lock:
+            segments = [(self._matrix, self._ids, 0)]
+            if self._log_ids:
+                segments.append((self._log_vectors[0], self._log_ids[0], len(self._ids)))
+            if self._dead_arrays is None and self._dead:
+                dead_ids = np.fromiter(self._dead, dtype=np.int64, count=len(self._dead))
+                order = np.argsort(dead_ids)
+                before = np.fromiter(self._dead.values(), dtype=np.int64, count=len(self._dead))
+                self._dead_arrays = (dead_ids[order], before[order])
+            return segments, self._dead_arrays, self._ann
+
+    @staticmethod
+    def _alive(ids, positions, dead):
+        """Mask of rows not hidden by a later tombstone."""
+        if dead is None:
+            return np.ones(len(ids), dtype=bool)
+        dead_ids, dead_before = dead
+        slot = np.minimum(np.searchsorted(dead_ids, ids), len(dead_ids) - 1)
+        return ~((dead_ids[slot] == ids) & (positions < dead_before[slot]))
+
+    def export(self):
+        """All live ``(ids, vectors)``, materialised in memory."""
+        self.refresh()
+        segments, dead, _ = self._segments()
+        return self._live(segments, dead)
+
+    def _live(self, segments, dead):
+        ids = np.concatenate([np.asarray(seg_ids) for _, seg_ids, _ in segments])
+        matrix = np.concatenate([np.asarray(seg_matrix) for seg_matrix, _, _ in segments])
+        alive = self._alive(ids, np.arange(len(ids)), dead)
+        return ids[alive], matrix[alive]
+
+    def __len__(self):
+        segments, dead, _ = self._segments()
+        return sum(int(self._alive(ids, first + np.arange(len(ids)), dead).sum()) for _, ids, first in segments)
+
+    def search(self, queries, k=10, allowed_ids=None):
+        """
+        Top-``k`` chunk ids and cosine scores for each query vector.
+
+        Returns ``(ids, scores)`` arrays of shape ``(n_queries, <=k)``. The
+        main matrix is scanned in blocks of ``RAG_SEARCH_BLOCK_ROWS`` rows so
+        the score matrix stays small however large the index grows, or probed
+        through its IVF index when it has one; rows of queries with fewer
+        results are then padded with id -1. ``allowed_ids`` restricts results
+        to the given chunk ids.
+        """
+        self.refresh()
+        queries = normalise_rows(queries)
+        segments, dead, ann = self._segments()
+        if ann is None or allowed_ids is not None:
+            if allowed_ids is not None:
+                allowed_ids = np.fromiter(allowed_ids, dtype=np.int64)
+            return self._scan(queries, k, segments, dead, allowed_ids)
+
+        # Rows of tombstoned ids may take up places in the index's top k.
+        fetch = k + (len(dead[0]) if dead is not None else 0)
+        best_ids, best_scores = ann.search(queries, fetch)
+        if dead is not None:
+            # Every tombstone comes after the main matrix, so it kills all of that id's rows there.
+            best_scores = np.where(np.isin(best_ids, dead[0]), -np.inf, best_scores)
+        log_ids, log_scores = self._scan(queries, k, segments[1:], dead, None)
+        best_ids, best_scores = _merge(best_ids, best_scores, log_ids, log_scores, k)
+        found = np.isfinite(best_scores)
+        best_ids = np.where(found, best_ids, -1)
+        width = int(found.sum(axis=1).max(initial=0))
+        return best_ids[:, :width], best_scores[:, :width]
+
+    def _scan(self, queries, k, segments, dead, allowed_ids):
+        """Exact search of ``segments``."""
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for matrix, ids, first in segments:
+            for start in range(0, len(ids), SEARCH_BLOCK_ROWS):
+                block = matrix[start:start + SEARCH_BLOCK_ROWS]
+                block_ids = ids[start:start + SEARCH_BLOCK_ROWS]
+                mask = None
+                if allowed_ids is not None:
+                    mask = np.isin(block_ids, allowed_ids)
+                if dead is not None:
+                    alive = self._alive(block_ids, first + start + np.arange(len(block_ids)), dead)
+                    mask = alive if mask is None else mask & alive
+                if mask is not None:
+                    if not mask.any():
+                        continue
+                    block, block_ids = block[mask], block_ids[mask]
+                scores = queries @ np.asarray(block).T
+                block_best, block_scores = top_k(scores, block_ids, k)
+                # Merge with the best rows of earlier blocks.
+                best_ids, best_scores = _merge(best_ids, best_scores, block_best, block_scores, k)
+        return best_ids, best_scores
+
+    # -- writing -----------------------------------------------------------
+
+    def add(self, ids, vectors):
+        """Append vectors for the given chunk ids to the log."""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = normalise_rows(vectors)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dim}, got {vectors.shape}.")
+        records = np.empty(len(ids), dtype=self._record_dtype)
+        records['id'] = ids
+        records['vector'] = vectors
+        self._append(records)
+
+    def remove(self, ids):
+        """Append tombstones for the given chunk ids."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        records = np.zeros(len(ids), dtype=self._record_dtype)
+        records['id'] = -ids - 1
+        self._append(records)
+
+    def _append(self, records):
+        with self._write_lock():
+            generation = self._read_meta()['generation']
+            with open(self._file('append', generation), 'ab') as f:
+                f.write(records.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.refresh()
+
+    def compact(self):
+        """
+        Fold the append log into a new generation; returns the row count.
+
+        Only reading the log takes the write lock; the IVF index is updated
+        without it, like in ``replace()``.
+        """
+        with self._write_lock():
+            self.refresh()
+            segments, dead, _ = self._segments()
+            with self._lock:
+                since = (self._generation, self._log_offset)
+        ids, matrix = self._live(segments, dead)
+        ann = self._next_ann(ids, matrix, since[0], segments, dead)
+        return self._install(ids, matrix, ann, since)
+
+    def log_position(self):
+        """``(generation, offset)`` of the end of the append log; pass it to ``replace(since=...)``."""
+        with self._write_lock():
+            generation = self._read_meta()['generation']
+            log_path = self._file('append', generation)
+            return generation, os.path.getsize(log_path) if os.path.exists(log_path) else 0
+
+    def replace(self, ids, vectors, since=None):
+        """
+        Make ``ids``/``vectors`` the whole contents of the store, as a new generation.
+
+        Records appended after ``since`` (taken with ``log_position()``
+        before reading the data to store) are carried over to the new log.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        matrix = normalise_rows(vectors) if len(ids) else np.empty((0, self.dim), dtype=np.float32)
+        if matrix.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dim}, got {matrix.shape}.")
+        # Trained before taking the lock, so appends are not held up meanwhile.
+        return self._install(ids, matrix, self._next_ann(ids, matrix), since)
+
+    def _install(self, ids, matrix, ann, since):
+        """Write ``ids``/``matrix`` as the next generation, carrying over the log from ``since``."""
+        with self._write_lock():
+            old_generation = self._read_meta()['generation']
+            carried = b""
+            if since is not None:
+                if since[0] != old_generation:
+                    raise RuntimeError("The store was compacted meanwhile; take a new log position and retry.")
+                with open(self._file('append', old_generation), 'rb') as f:
+                    f.seek(since[1])
+                    carried = f.read()
+            self._write_generation(old_generation + 1, matrix, ids, ann)
+            if carried:
+                with open(self._file('append', old_generation + 1), 'ab') as f:
+                    f.write(carried)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._remove_generation(old_generation)
+        self.refresh()
+        return len(ids)
+
+    def _remove_generation(self, generation):
+        for kind in ('vectors', 'ids', 'append'):
+            try:
+                os.remove(self._file(kind, generation))
+            except FileNotFoundError:
+                pass
+        shutil.rmtree(self._ann_path(generation), ignore_errors=True)
+
+    def nbytes(self):
+        """Bytes of vectors this store searches: the mapped matrix plus the log rows held in memory."""
+        with self._lock:
+            return self._matrix.nbytes + sum(vectors.nbytes for vectors in self._log_vectors)
+
+    def stats(self):
+        self.refresh()
+        with self._lock:
+            return {
+                'generation': self._generation,
+                'dim': self.dim,
+                'rows': len(self._ids),
+                'log_rows': len(self._log_ids[0]) if self._log_ids else 0,
+                'tombstones': len(self._dead),
+                'ann_lists': self._ann.nlist if self._ann is not None else 0,
+            }
+
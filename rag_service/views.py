@@ -1,3 +1,244 @@
-from django.shortcuts import render
+import asyncio
+import json
+import time
+from dataclasses import asdict
 
-# Create your views here.
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import viewsets, mixins, status
+from rest_framework.exceptions import APIException
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.response import Response
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
+
+from rag_user.authentication import CachedJWTAuthentication
+
+from django.conf import settings
+
+from .answer_cache import answer_cache
+from .models import Document, IngestionJob
+from . import qa
+from .serializers import DocumentSerializer, ChunkSerializer, IngestionJobSerializer, QueuedDocumentSerializer
+from .ingestion import delete_document
+from .jobs import enqueue_ingestion
+
+
+class DocumentViewSet(mixins.CreateModelMixin,
+                      mixins.ListModelMixin,
+                      mixins.RetrieveModelMixin,
+                      mixins.DestroyModelMixin,
+                      viewsets.GenericViewSet):
+    serializer_class = DocumentSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def get_queryset(self):
+        # Users only ever see their own documents.
+        return Document.objects.filter(owner=self.request.user)
+
+    @extend_schema(
+        summary="Upload a document",
+        description="""
+        Upload a `.docx` document for ingestion.
+
+        **Process:**
+        1. The file is stored and a document record is created
+        2. An ingestion job is queued; a worker streams paragraphs and table
+           rows out of the file, packs them into chunks and indexes them
+        3. Follow the job at `/api/jobs/{id}/` or `/api/jobs/{id}/events/`
+
+        **Request (multipart/form-data):**
+        ```
+        file: [report.docx]
+        title: Quarterly report   (optional, defaults to the file name)
+        ```
+
+        **Response:**
+        - 202: The pending document, with its ingestion job
+        - 400: Not a `.docx` file
+        """,
+        request=DocumentSerializer,
+        responses={
+            202: QueuedDocumentSerializer,
+            400: OpenApiTypes.OBJECT,
+        }
+    )
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data['file']
+        document = serializer.save(owner=request.user, title=serializer.validated_data.get('title') or upload.name)
+        job = enqueue_ingestion(document)
+        return Response(QueuedDocumentSerializer(document, context={'job': job}).data, status=status.HTTP_202_ACCEPTED)
+
+    @extend_schema(
+        summary="Replace a document's file",
+        description="""
+        Upload a new version of a `.docx` document. Re-ingestion is queued
+        ahead of new uploads; the current version stays searchable meanwhile.
+
+        Only chunks whose text changed are re-embedded and re-indexed; chunks
+        that disappeared are removed from search. The document's `version`
+        goes up when its chunks change. If the new file cannot be parsed, the
+        job fails and the previous version is kept.
+
+        **Response:**
+        - 202: The pending document, with its ingestion job
+        - 400: Not a `.docx` file
+        """,
+        request=DocumentSerializer,
+        responses={
+            202: QueuedDocumentSerializer,
+            400: OpenApiTypes.OBJECT,
+        }
+    )
+    def update(self, request, *args, **kwargs):
+        document = self.get_object()
+        previous_file = document.file.name
+        serializer = self.get_serializer(document, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        document = serializer.save()
+        job = enqueue_ingestion(document, priority=IngestionJob.PRIORITY_HIGH, replaced_file=previous_file)
+        return Response(QueuedDocumentSerializer(document, context={'job': job}).data, status=status.HTTP_202_ACCEPTED)
+
+    def perform_destroy(self, instance):
+        delete_document(instance)
+
+    @extend_schema(summary="List a document's chunks", responses=ChunkSerializer(many=True))
+    @action(detail=True, methods=['get'])
+    def chunks(self, request, pk=None):
+        document = self.get_object()
+        chunks = document.chunks.all()
+        page = self.paginate_queryset(chunks)
+        if page is not None:
+            return self.get_paginated_response(ChunkSerializer(page, many=True).data)
+        return Response(ChunkSerializer(chunks, many=True).data)
+
+
+class IngestionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Ingestion jobs for the user's documents; poll one for progress."""
+    serializer_class = IngestionJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        jobs = IngestionJob.objects.filter(owner=self.request.user)
+        document = self.request.query_params.get('document')
+        if document and document.isdigit():
+            jobs = jobs.filter(document_id=document)
+        return jobs
+
+
+async def _authenticate(request):
+    """``(user, None)`` for a request with a valid access token, else ``(None, error_response)``."""
+    try:
+        result = await CachedJWTAuthentication().aauthenticate(request)
+    except APIException as e:
+        return None, JsonResponse({'detail': e.detail}, status=e.status_code)
+    if result is None:
+        return None, JsonResponse({'detail': "Authentication credentials were not provided."}, status=401)
+    return result[0], None
+
+
+def _event_stream(response):
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def ask(request):
+    """
+    Answer a question from the user's documents as a server-sent event stream.
+
+    Body: ``{"question": "...", "k": 5, "documents": [1, 2]}`` (``k`` and
+    ``documents`` optional). Events: ``sources`` (retrieved passages),
+    ``token`` (answer text as it is generated), then ``done`` or ``error``.
+    Near-duplicates of recently answered questions are served from the
+    answer cache. Serve through askrag.asgi: under WSGI the stream is buffered.
+    """
+    user, error = await _authenticate(request)
+    if error is not None:
+        return error
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'detail': "Invalid JSON body."}, status=400)
+    question = data.get('question')
+    if not isinstance(question, str) or not question.strip():
+        return JsonResponse({'question': ["This field is required."]}, status=400)
+    if len(question) > 2000:
+        return JsonResponse({'question': ["Ensure this field has no more than 2000 characters."]}, status=400)
+    k = data.get('k', qa.TOP_K)
+    if not isinstance(k, int) or not 1 <= k <= 20:
+        return JsonResponse({'k': ["Must be an integer between 1 and 20."]}, status=400)
+    documents = data.get('documents')
+    if documents is not None and not (isinstance(documents, list) and all(isinstance(d, int) for d in documents)):
+        return JsonResponse({'documents': ["Must be a list of document ids."]}, status=400)
+
+    question = question.strip()
+    vector = await qa.aembed_query(question)
+    cached = await answer_cache.alookup(user.pk, vector, k, documents)
+    if cached is not None:
+        events = qa.cached_answer_events(cached)
+    else:
+        passages = await qa.aretrieve(user, question, k, documents, query_vector=vector)
+        sources = [asdict(passage) for passage in passages]
+
+        async def remember(answer):
+            if passages:
+                await answer_cache.astore(user.pk, vector, k, documents, question, answer, sources)
+
+        events = qa.answer_events(question, passages, on_complete=remember)
+
+    return _event_stream(StreamingHttpResponse(events, content_type='text/event-stream'))
+
+
+JOB_EVENTS_INTERVAL = getattr(settings, 'RAG_JOB_EVENTS_INTERVAL', 0.5)
+# A comment line this often keeps proxies from closing a quiet stream.
+KEEPALIVE_SECONDS = 15
+_JOB_FINISHED = (IngestionJob.STATUS_DONE, IngestionJob.STATUS_FAILED)
+
+
+async def _job_events(job_id, interval=JOB_EVENTS_INTERVAL):
+    last, last_sent = None, time.monotonic()
+    while True:
+        job = await IngestionJob.objects.filter(pk=job_id).afirst()
+        if job is None:
+            # Deleted along with its document.
+            yield qa.sse('error', {'detail': "Not found."})
+            return
+        data = IngestionJobSerializer(job).data
+        if data != last:
+            last, last_sent = data, time.monotonic()
+            yield qa.sse('progress', data)
+        elif time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+            last_sent = time.monotonic()
+            yield ": keepalive\n\n"
+        if job.status in _JOB_FINISHED:
+            yield qa.sse(job.status, data)
+            return
+        await asyncio.sleep(interval)
+
+
+@require_GET
+async def job_events(request, pk):
+    """
+    Stream an ingestion job's progress as server-sent events.
+
+    A ``progress`` event carries the job (as returned by ``/api/jobs/{id}/``)
+    each time it changes; the stream ends with a ``done`` or ``failed``
+    event. Serve through askrag.asgi, as for ``ask``.
+    """
+    user, error = await _authenticate(request)
+    if error is not None:
+        return error
+    if not await IngestionJob.objects.filter(pk=pk, owner=user).aexists():
+        return JsonResponse({'detail': "Not found."}, status=404)
+    return _event_stream(StreamingHttpResponse(_job_events(pk), content_type='text/event-stream'))
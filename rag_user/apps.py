@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class RagUserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rag_user'
+
+    def ready(self):
+        from . import schemas, signals  # noqa: F401
+        from .mail import warm_email_templates
+        warm_email_templates()
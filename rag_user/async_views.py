@@ -0,0 +1,164 @@
+"""
+Async (ASGI-native) versions of the registration, activation, profile and
+password-change endpoints.
+
+These are plain Django async views rather than DRF viewsets, which cannot
+run as coroutines. Database access uses the async ORM, email goes through
+the async outbox insert, and password hashing is awaited from
+rag_user.hashing's process pool. Served under /user/async/ next to the sync API.
+"""
+import json
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.db import IntegrityError
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from django.conf import settings
+from rest_framework.exceptions import APIException
+
+from . import profile_claims
+from .authentication import CachedJWTAuthentication
+from .hashing import HashingBusy
+from .mail import aenqueue_email, render_email
+from .revocation import arevoke_user_tokens
+from .serializers import (
+    EMAIL_TAKEN,
+    USERNAME_TAKEN,
+    PasswordChangeSerializer,
+    RegistrationSerializer,
+    UserSerializer,
+    registration_clashes,
+    uniqueness_errors,
+)
+
+User = get_user_model()
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+
+
+def _busy(exc):
+    return JsonResponse({'detail': exc.detail}, status=exc.status_code, headers={'Retry-After': str(exc.wait)})
+
+
+async def _authenticate(request):
+    """Return ``(user, token)`` or a 401 JsonResponse."""
+    try:
+        result = await CachedJWTAuthentication().aauthenticate(request)
+    except APIException as e:
+        return JsonResponse({'detail': e.detail}, status=e.status_code)
+    if result is None:
+        return JsonResponse({'detail': "Authentication credentials were not provided."}, status=401)
+    return result
+
+
+@csrf_exempt
+@require_POST
+async def register(request):
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'detail': "Invalid JSON body."}, status=400)
+
+    serializer = RegistrationSerializer(data=data, context={'check_uniqueness': False})
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    validated = dict(serializer.validated_data)
+
+    clashes = [row async for row in registration_clashes(validated['email'], validated['username'])]
+    errors = uniqueness_errors(validated['email'], validated['username'], clashes)
+    if errors:
+        return JsonResponse({field: [message] for field, message in errors.items()}, status=400)
+
+    validated.pop('confirm_password')
+    password = validated.pop('password')
+    user = User(**validated)
+    user.is_active = False
+    try:
+        await user.aset_password(password)
+    except HashingBusy as e:
+        return _busy(e)
+    try:
+        await user.asave()
+    except IntegrityError as e:
+        field, message = ('email', EMAIL_TAKEN) if 'email' in str(e) else ('username', USERNAME_TAKEN)
+        return JsonResponse({field: [message]}, status=400)
+
+    token = default_token_generator.make_token(user)
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    confirm_link = f"https://my-django-template.onrender.com/user/account/active/{uid}/{token}"
+    text_body, html_body = render_email('confirm_account_email.html', {'confirm_link': confirm_link})
+    await aenqueue_email("Confirm Your Email", [user.email], body=text_body, html_body=html_body)
+
+    return JsonResponse({"message": "Check Your Mail for Confirmation"}, status=201)
+
+
+@require_GET
+async def activate(request, uid64, token):
+    try:
+        uid = urlsafe_base64_decode(uid64).decode()
+        user = await User._default_manager.aget(pk=uid)
+    except (User.DoesNotExist, ValueError):
+        user = None
+
+    if user is not None and default_token_generator.check_token(user, token):
+        user.is_active = True
+        await user.asave(update_fields=['is_active'])
+        return HttpResponse("Account activated successfully! You can now log in.")
+    return HttpResponse("Activation link is invalid or expired.")
+
+
+@require_GET
+async def profile(request):
+    result = await _authenticate(request)
+    if isinstance(result, JsonResponse):
+        return result
+    user, token = result
+
+    if profile_claims.ENABLED:
+        data = await profile_claims.aprofile_from_token(request, token)
+        if data is not None:
+            return JsonResponse([data], safe=False)
+        await profile_claims.aremember_profile_version(user)
+
+    # The authenticated user row is the profile; no second query needed.
+    data = UserSerializer(user, context={'request': request}).data
+    return JsonResponse([data], safe=False)
+
+
+@csrf_exempt
+@require_POST
+async def change_password(request, pk):
+    result = await _authenticate(request)
+    if isinstance(result, JsonResponse):
+        return result
+    user, _ = result
+    if user.pk != pk:
+        return JsonResponse({'detail': "You do not have permission to perform this action."}, status=403)
+
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'detail': "Invalid JSON body."}, status=400)
+    serializer = PasswordChangeSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    try:
+        await user.aset_password(serializer.validated_data['new_password'])
+    except HashingBusy as e:
+        return _busy(e)
+    await user.asave(update_fields=['password'])
+    await arevoke_user_tokens(user.pk)
+
+    text_body, html_body = render_email('pass_change_email.html', {'time': timezone.now(), 'user_name': user.username, 'support_email': settings.EMAIL_HOST_USER})
+    await aenqueue_email("Password Changed Mail", [user.email], body=text_body, html_body=html_body)
+
+    return JsonResponse({"detail": "Password changed successfully."}, status=200)
@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from askrag.replicas import REPLICAS, pin_to_primary, primary_reads, replica_reads
+
+from . import profile_claims
+from .revocation import revocations
+
+
+class UserSnapshotCache:
+    """
+    Thread-safe LRU of user row snapshots with a per-entry TTL.
+
+    Entries are keyed by ``(user_id, jti)`` and indexed by user id so every
+    token of a user can be dropped at once when the row changes.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, snapshot):
+        user_id = key[0]
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in self._keys_by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+
+user_cache = UserSnapshotCache(
+    max_entries=getattr(settings, 'AUTH_USER_CACHE_MAX_ENTRIES', 10000),
+    ttl=getattr(settings, 'AUTH_USER_CACHE_TTL', 60),
+)
+
+
+def _revoked():
+    return AuthenticationFailed(_("Token has been revoked."), code="token_revoked")
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that serves the user from ``user_cache`` when it can.
+
+    The cache holds the concrete column values of the user row, so a hit
+    rebuilds an ordinary model instance without a query. Signals on the user
+    model invalidate a user's entries on save (including password changes)
+    and delete; the TTL bounds staleness across processes. Revoked tokens
+    (rag_user.revocation) are refused before the cache is consulted. On a
+    miss the row may be read from a replica (askrag.replicas).
+    """
+
+    def get_user(self, validated_token):
+        if revocations.is_revoked(validated_token):
+            raise _revoked()
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        key = (str(user_id), validated_token.get(api_settings.JTI_CLAIM))
+        snapshot = user_cache.get(key)
+        if snapshot is None:
+            try:
+                with replica_reads(user_id=user_id):
+                    user = super().get_user(validated_token)
+            except AuthenticationFailed as e:
+                if not REPLICAS or e.detail.get('code') != 'user_not_found':
+                    raise
+                # A replica may not have a new user yet; read them from the primary for a while.
+                with primary_reads():
+                    user = super().get_user(validated_token)
+                pin_to_primary(user.pk)
+            user_cache.set(key, self._snapshot(user))
+            return user
+
+        user = self._restore(snapshot)
+        self._check_user(user, validated_token)
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of ``authenticate()`` for plain Django async views.
+
+        Token parsing and signature checks are CPU-only; the user row, when
+        not cached, is loaded with the async ORM.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if await revocations.ais_revoked(validated_token):
+            raise _revoked()
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        key = (str(user_id), validated_token.get(api_settings.JTI_CLAIM))
+        snapshot = user_cache.get(key)
+        if snapshot is not None:
+            user = self._restore(snapshot)
+        else:
+            lookup = {api_settings.USER_ID_FIELD: user_id}
+            try:
+                with replica_reads(user_id=user_id):
+                    user = await self.user_model.objects.filter(**lookup).afirst()
+                if user is None:
+                    if not REPLICAS:
+                        raise self.user_model.DoesNotExist
+                    # A replica may not have a new user yet; read them from the primary for a while.
+                    with primary_reads():
+                        user = await self.user_model.objects.aget(**lookup)
+                    await sync_to_async(pin_to_primary)(user.pk)
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            user_cache.set(key, self._snapshot(user))
+
+        self._check_user(user, validated_token)
+        return user
+
+    def _check_user(self, user, validated_token):
+        # Same checks JWTAuthentication.get_user() applies to a fresh row.
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+    def _snapshot(self, user):
+        fields = [f.attname for f in self.user_model._meta.concrete_fields]
+        return user._state.db or DEFAULT_DB_ALIAS, fields, tuple(getattr(user, f) for f in fields)
+
+    def _restore(self, snapshot):
+        db, fields, values = snapshot
+        return self.user_model.from_db(db, fields, values)
+
+
+class ProfileClaimAuthentication(CachedJWTAuthentication):
+    """
+    For reads answered from the token's profile claim (rag_user.profile_claims).
+
+    While the claim is current the user is a ``TokenUser`` built from the
+    token, with no row lookup: the claim version covers the password hash and
+    ``is_active``, so it goes stale on a password change or deactivation, and
+    then the token gets the full checks of CachedJWTAuthentication. Revoked
+    tokens are refused either way.
+    """
+
+    def get_user(self, validated_token):
+        if profile_claims.current_claim(validated_token) is None:
+            return super().get_user(validated_token)
+        if revocations.is_revoked(validated_token):
+            raise _revoked()
+        return api_settings.TOKEN_USER_CLASS(validated_token)
@@ -0,0 +1,155 @@
+"""
+Password hashing off the request thread.
+
+PBKDF2 and friends are deliberately slow, and a burst of logins would
+otherwise pin every web worker on CPU. ``PasswordHashPool`` runs hashing
+and verification in a pool of ``PASSWORD_HASH_WORKERS`` processes; request
+threads (or coroutines, through the ``a*`` methods) just wait for the
+result. At most ``PASSWORD_HASH_MAX_PENDING`` operations may be queued or
+running: past that, new ones are refused with ``HashingBusy`` (a 503 with
+``Retry-After``) instead of piling up behind requests that have probably
+timed out already.
+
+The pool belongs to the process: every web worker process starts its own
+``PASSWORD_HASH_WORKERS`` hashing processes (``os.cpu_count()`` by
+default) on its first hash, so with several web workers per machine set it
+lower.
+
+Verification also reports whether the stored hash should be upgraded to the
+preferred hasher (the first of ``PASSWORD_HASHERS``, or a stronger work
+factor) and computes the new hash in the same round trip; CustomUser saves
+it on a successful login. With ``PASSWORD_HASH_WORKERS = 0`` everything runs
+inline, as Django does by default.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+WORKERS = getattr(settings, 'PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+MAX_PENDING = getattr(settings, 'PASSWORD_HASH_MAX_PENDING', 64)
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The server is busy; try again shortly."
+    default_code = 'hashing_busy'
+    # Sent as Retry-After by DRF's exception handler.
+    wait = 1
+
+
+def _hash(raw_password):
+    return make_password(raw_password)
+
+
+def _verify(raw_password, encoded):
+    """``(is_correct, upgraded_hash_or_None)``; runs in a pool process."""
+    is_correct, must_update = verify_password(raw_password, encoded)
+    return is_correct, make_password(raw_password) if is_correct and must_update else None
+
+
+class PasswordHashPool:
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+        self.completed = self.rejected = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # Spawned rather than forked: the server has threads and open connections.
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=get_context('spawn'), initializer=django.setup,
+                    )
+        return self._pool
+
+    def _submit(self, fn, *args):
+        """A concurrent.futures.Future for ``fn(*args)`` in the pool, or HashingBusy."""
+        # configure() may swap the semaphore and pool; a future settles with the ones it used.
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy()
+        try:
+            pool = self._get_pool()
+            future = pool.submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda future: self._done(future, slots, pool))
+        return future
+
+    def _done(self, future, slots, pool):
+        slots.release()
+        with self._lock:
+            self.completed += 1
+            if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool) and self._pool is pool:
+                # A worker died; start a fresh pool on the next call rather than failing every one.
+                self._pool = None
+
+    def hash(self, raw_password):
+        if not self.workers:
+            return _hash(raw_password)
+        return self._submit(_hash, raw_password).result()
+
+    def verify(self, raw_password, encoded):
+        """``(is_correct, upgraded_hash_or_None)`` for a stored hash."""
+        if not self.workers:
+            return _verify(raw_password, encoded)
+        return self._submit(_verify, raw_password, encoded).result()
+
+    async def ahash(self, raw_password):
+        if not self.workers:
+            return _hash(raw_password)
+        return await asyncio.wrap_future(self._submit(_hash, raw_password))
+
+    async def averify(self, raw_password, encoded):
+        if not self.workers:
+            return _verify(raw_password, encoded)
+        return await asyncio.wrap_future(self._submit(_verify, raw_password, encoded))
+
+    def warm_up(self):
+        """Start every worker process now rather than on the first logins."""
+        if self.workers:
+            for future in [self._get_pool().submit(_hash, None) for _ in range(self.workers)]:
+                future.result()
+
+    def configure(self, workers=None, max_pending=None):
+        """
+        Change the pool size or queue limit; the pool restarts on next use.
+        Operations already admitted finish against the old limit.
+        """
+        self.close()
+        if workers is not None:
+            self.workers = workers
+        if max_pending is not None:
+            self.max_pending = max_pending
+            self._slots = threading.BoundedSemaphore(max_pending)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'max_pending': self.max_pending,
+                    'completed': self.completed, 'rejected': self.rejected}
+
+
+password_hasher = PasswordHashPool()
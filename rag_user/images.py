@@ -0,0 +1,189 @@
+"""
+Profile image pipeline.
+
+Requests only stage the uploaded file and record an ImageUpload; the
+``process_images`` worker decodes it, strips metadata, renders fixed-size
+WebP thumbnails and swaps them onto the user in one transaction.
+"""
+import io
+import os
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import CustomUser, ImageUpload
+
+
+IMAGE_SIZES = getattr(settings, 'PROFILE_IMAGE_SIZES', (64, 256, 1024))
+MAX_UPLOAD_BYTES = getattr(settings, 'PROFILE_IMAGE_MAX_BYTES', 5 * 1024 * 1024)
+MAX_PIXELS = getattr(settings, 'PROFILE_IMAGE_MAX_PIXELS', 40_000_000)
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+UPLOAD_DIR = "users/user_img/"
+STAGING_DIR = getattr(settings, 'PROFILE_IMAGE_STAGING_DIR', os.path.join(settings.BASE_DIR, "tmp", "image_uploads"))
+WEBP_QUALITY = 82
+
+MAX_ATTEMPTS = 3
+CLAIM_TIMEOUT = 300
+
+
+class ImageRejected(Exception):
+    """The staged file is not an acceptable image; retrying will not help."""
+
+
+def stage_upload(user, upload):
+    """
+    Move an uploaded file to the staging directory and queue it for processing.
+
+    Large uploads already sit in a temporary file, which is renamed rather
+    than copied; small in-memory uploads are written out chunk by chunk.
+    """
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    staged_path = os.path.join(STAGING_DIR, uuid.uuid4().hex)
+
+    if hasattr(upload, 'temporary_file_path'):
+        shutil.move(upload.temporary_file_path(), staged_path)
+    else:
+        with open(staged_path, 'wb') as out:
+            for chunk in upload.chunks():
+                out.write(chunk)
+
+    return ImageUpload.objects.create(user=user, staged_path=staged_path, original_name=upload.name[:255])
+
+
+def render_variants(path):
+    """Decode the staged image and return ``{size: webp_bytes}``."""
+    try:
+        with Image.open(path) as probe:
+            if probe.format not in ALLOWED_FORMATS:
+                raise ImageRejected(f"Unsupported image format: {probe.format}")
+            if probe.width * probe.height > MAX_PIXELS:
+                raise ImageRejected("Image dimensions are too large.")
+            probe.verify()
+
+        # verify() leaves the image unusable, so decode from a fresh handle.
+        with Image.open(path) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ImageRejected(f"Invalid image: {e}") from e
+
+    variants = {}
+    for size in sorted(IMAGE_SIZES, reverse=True):
+        # Work down from the largest rendition; each is a cheap downscale.
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        # No exif/icc arguments: the saved WebP carries no metadata.
+        image.save(buffer, format='WEBP', quality=WEBP_QUALITY, method=4)
+        variants[size] = buffer.getvalue()
+    return variants
+
+
+def process_upload(job):
+    variants = render_variants(job.staged_path)
+
+    # The storage names each rendition by its content hash.
+    names = {
+        str(size): image_storage().save(f"{UPLOAD_DIR}{size}.webp", ContentFile(data))
+        for size, data in variants.items()
+    }
+
+    with transaction.atomic():
+        user = CustomUser.objects.select_for_update().get(pk=job.user_id)
+        superseded = ImageUpload.objects.filter(
+            user_id=job.user_id, id__gt=job.id, status=ImageUpload.STATUS_DONE
+        ).exists()
+        if superseded:
+            # A newer upload already finished; keep it and drop ours.
+            stale = list(names.values())
+        else:
+            stale = stored_image_names(user)
+            user.image.name = names[str(max(IMAGE_SIZES))]
+            user.image_variants = names
+            user.save(update_fields=['image', 'image_variants'])
+        job.status = ImageUpload.STATUS_DONE
+        job.processed_at = timezone.now()
+        job.error = ""
+        job.save(update_fields=['status', 'processed_at', 'error'])
+        transaction.on_commit(lambda: _delete_files(stale))
+
+    discard_staged(job)
+
+
+def stored_image_names(user):
+    """Every storage reference held by the user, one entry per reference."""
+    names = list(user.image_variants.values())
+    if user.image and user.image.name not in names:
+        names.append(user.image.name)
+    return names
+
+
+def delete_user_images(user):
+    _delete_files(stored_image_names(user))
+
+
+def image_storage():
+    return CustomUser._meta.get_field('image').storage
+
+
+def _delete_files(names):
+    # Drops a reference per name; gc_media removes unreferenced blobs.
+    storage = image_storage()
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            pass
+
+
+def discard_staged(job):
+    """Remove the job's staged file, if it is still there."""
+    try:
+        os.remove(job.staged_path)
+    except FileNotFoundError:
+        pass
+
+
+def claim_jobs(batch_size):
+    # Like rag_user.mail.claim_batch: only rows stamped with this claim's token are ours.
+    now = timezone.now()
+    token = uuid.uuid4()
+    due = Q(status=ImageUpload.STATUS_PENDING) | Q(status=ImageUpload.STATUS_PROCESSING)
+    with transaction.atomic():
+        ids = list(ImageUpload.objects.filter(due, next_attempt_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return []
+        ImageUpload.objects.filter(due, id__in=ids, next_attempt_at__lte=now).update(
+            status=ImageUpload.STATUS_PROCESSING,
+            next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT),
+            claimed_by=token,
+        )
+    return list(ImageUpload.objects.filter(id__in=ids, claimed_by=token))
+
+
+def process_batch(batch_size=10):
+    """Process one batch of queued uploads; returns ``(done, failed)``."""
+    done = failed = 0
+    for job in claim_jobs(batch_size):
+        try:
+            process_upload(job)
+        except Exception as e:
+            failed += 1
+            job.attempts += 1
+            job.error = str(e)
+            if isinstance(e, ImageRejected) or job.attempts >= MAX_ATTEMPTS:
+                job.status = ImageUpload.STATUS_FAILED
+                discard_staged(job)
+            else:
+                job.status = ImageUpload.STATUS_PENDING
+                job.next_attempt_at = timezone.now() + timedelta(seconds=30 * job.attempts)
+            job.save(update_fields=['status', 'attempts', 'error', 'next_attempt_at'])
+        else:
+            done += 1
+    return done, failed
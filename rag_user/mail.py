@@ -0,0 +1,248 @@
+import html
+import re
+import uuid
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template import Context, engines
+from django.template.base import TextNode, VariableNode
+from django.template.loader import get_template
+from django.utils.formats import localize
+from django.utils.html import conditional_escape, strip_tags
+from django.utils import timezone
+from django.utils.timezone import template_localtime
+
+from .models import OutboundEmail
+
+
+# Outbox tuning, overridable from settings.
+MAX_ATTEMPTS = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+BACKOFF_BASE = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_SECONDS', 30)
+BACKOFF_MAX = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_MAX_SECONDS', 3600)
+# A claimed row that is still "sending" after this long belongs to a dead worker.
+CLAIM_TIMEOUT = getattr(settings, 'EMAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS', 300)
+
+
+# Templates compiled once per process and reused for every message.
+EMAIL_TEMPLATES = (
+    'confirm_account_email.html',
+    'pass_change_email.html',
+)
+
+_LINK_RE = re.compile(r'<a\s[^>]*href="([^"]*)"[^>]*>(.*?)</a>', re.IGNORECASE | re.DOTALL)
+_BREAK_RE = re.compile(r'<br\s*/?>|</(?:p|div|h[1-6]|li|tr)>', re.IGNORECASE)
+_BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+
+def html_to_text(html_body):
+    """Plain-text version of an HTML email (or HTML template source)."""
+    def link(match):
+        href, label = match.group(1), strip_tags(match.group(2)).strip()
+        return label if label == href or not label else f"{label} ({href})"
+
+    text = _LINK_RE.sub(link, html_body)
+    text = _BREAK_RE.sub("\n", text)
+    text = html.unescape(strip_tags(text))
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip() + "\n"
+
+
+class EmailTemplate:
+    """
+    An email template compiled once into static text and variable slots.
+
+    Our mail templates are plain markup with ``{{ variable }}`` substitutions,
+    so rendering is a join of precompiled strings. Each variable is resolved
+    and localised once per message and written into both the HTML body and
+    a plain-text twin derived from the template source. Templates that use
+    block tags fall back to two ordinary renders.
+    """
+
+    def __init__(self, template_name):
+        self.template = get_template(template_name)
+        source = self.template.template.source
+        self.text_template = engines['django'].from_string(
+            "{% autoescape off %}" + html_to_text(source) + "{% endautoescape %}"
+        )
+        self._html = self._segments(self.template.template.nodelist)
+        text_nodes = self.text_template.template.nodelist[0].nodelist
+        self._text = self._segments(text_nodes)
+        if self._html is not None and self._text is not None:
+            expressions = {}
+            for segment in self._html + self._text:
+                if not isinstance(segment, str):
+                    expressions.setdefault(segment.token, segment)
+            self._expressions = list(expressions.values())
+
+    @staticmethod
+    def _segments(nodelist):
+        segments = []
+        for node in nodelist:
+            if isinstance(node, TextNode):
+                segments.append(node.s)
+            elif isinstance(node, VariableNode):
+                segments.append(node.filter_expression)
+            else:
+                return None
+        return segments
+
+    def render(self, context):
+        """Return ``(text_body, html_body)`` for the given context dict."""
+        if self._html is None or self._text is None:
+            return self.text_template.render(context), self.template.render(context)
+
+        ctx = Context(context, autoescape=False)
+        text_values, html_values = {}, {}
+        for expression in self._expressions:
+            value = expression.resolve(ctx)
+            value = localize(template_localtime(value, use_tz=ctx.use_tz), use_l10n=ctx.use_l10n)
+            text_values[expression.token] = str(value)
+            html_values[expression.token] = conditional_escape(value if isinstance(value, str) else str(value))
+
+        text_body = "".join(s if isinstance(s, str) else text_values[s.token] for s in self._text)
+        html_body = "".join(s if isinstance(s, str) else html_values[s.token] for s in self._html)
+        return text_body, html_body
+
+
+_compiled_template = lru_cache(maxsize=None)(EmailTemplate)
+
+
+def get_email_template(template_name):
+    # Skip the memo in development so template edits show up without a restart.
+    if settings.DEBUG:
+        return EmailTemplate(template_name)
+    return _compiled_template(template_name)
+
+
+def warm_email_templates():
+    for template_name in EMAIL_TEMPLATES:
+        get_email_template(template_name)
+
+
+def render_email(template_name, context):
+    """Render an email template, returning ``(text_body, html_body)``."""
+    return get_email_template(template_name).render(context)
+
+
+def enqueue_email(subject, to, body="", html_body="", from_email=None):
+    """Store a message in the outbox; the send_queued_mail worker delivers it."""
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+        to=list(to),
+    )
+
+
+async def aenqueue_email(subject, to, body="", html_body="", from_email=None):
+    """Async variant of enqueue_email for ASGI views."""
+    return await OutboundEmail.objects.acreate(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+        to=list(to),
+    )
+
+
+def backoff_delay(attempts):
+    """Exponential backoff in seconds for the given number of failed attempts."""
+    return min(BACKOFF_BASE * (2 ** max(attempts - 1, 0)), BACKOFF_MAX)
+
+
+def claim_batch(batch_size):
+    """
+    Mark up to ``batch_size`` due messages as "sending" and return them.
+
+    The claim is a conditional UPDATE that stamps the rows with a fresh
+    ``claimed_by`` token, and only rows carrying that token are returned, so
+    two workers never pick the same row, even on SQLite where
+    SELECT ... FOR UPDATE is unavailable.
+    """
+    now = timezone.now()
+    token = uuid.uuid4()
+    due = Q(status=OutboundEmail.STATUS_PENDING) | Q(status=OutboundEmail.STATUS_SENDING)
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.filter(due, next_attempt_at__lte=now)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        OutboundEmail.objects.filter(due, id__in=ids, next_attempt_at__lte=now).update(
+            status=OutboundEmail.STATUS_SENDING,
+            next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT),
+            claimed_by=token,
+        )
+    return list(OutboundEmail.objects.filter(id__in=ids, claimed_by=token))
+
+
+def build_message(outbound, connection=None):
+    email = EmailMultiAlternatives(
+        outbound.subject,
+        outbound.body,
+        from_email=outbound.from_email,
+        to=outbound.to,
+        connection=connection,
+    )
+    if outbound.html_body:
+        email.attach_alternative(outbound.html_body, "text/html")
+    return email
+
+
+def deliver_batch(batch_size=50, connection=None):
+    """
+    Send one batch of due messages over a single SMTP connection.
+
+    Returns a ``(sent, failed)`` tuple. Failed messages are rescheduled with
+    exponential backoff until ``MAX_ATTEMPTS`` is reached.
+    """
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+        for outbound in batch:
+            try:
+                build_message(outbound, connection=connection).send()
+            except Exception as e:
+                failed += 1
+                _mark_failed(outbound, e)
+                # The connection may be unusable after an SMTP error.
+                connection.close()
+                connection.open()
+            else:
+                sent += 1
+                outbound.status = OutboundEmail.STATUS_SENT
+                outbound.attempts += 1
+                outbound.sent_at = timezone.now()
+                outbound.last_error = ""
+                outbound.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+    except Exception as e:
+        # Could not (re)connect: release everything not yet handled.
+        for outbound in batch:
+            if outbound.status == OutboundEmail.STATUS_SENDING:
+                failed += 1
+                _mark_failed(outbound, e)
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def _mark_failed(outbound, error):
+    outbound.attempts += 1
+    outbound.last_error = str(error)
+    if outbound.attempts >= MAX_ATTEMPTS:
+        outbound.status = OutboundEmail.STATUS_FAILED
+    else:
+        outbound.status = OutboundEmail.STATUS_PENDING
+        outbound.next_attempt_at = timezone.now() + timedelta(seconds=backoff_delay(outbound.attempts))
+    outbound.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
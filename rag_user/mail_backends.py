@@ -0,0 +1,228 @@
+import smtplib
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+
+
+class SMTPConnectionPool:
+    """
+    Idle, already-authenticated SMTP connections for one server/account.
+
+    Connections idle for longer than ``idle_timeout`` are closed instead of
+    reused, and every checkout is health-checked with NOOP so a connection the
+    server dropped is never handed out.
+    """
+
+    def __init__(self, size, idle_timeout):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, released_at = self._idle.pop()
+            if time.monotonic() - released_at > self.idle_timeout:
+                self._quit(connection)
+                continue
+            if self._is_healthy(connection):
+                self.reused += 1
+                return connection
+            self._quit(connection)
+
+    def release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        self._quit(connection)
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for connection, _ in idle:
+            self._quit(connection)
+
+    @staticmethod
+    def _is_healthy(connection):
+        try:
+            return connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _quit(connection):
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+
+class _Pending:
+    def __init__(self, message):
+        self.message = message
+        self.sent = False
+        self.error = None
+
+
+class MessageCoalescer:
+    """
+    Group messages sent by concurrent callers into one ``send_messages`` call.
+
+    The first caller to arrive becomes the leader: it waits up to ``window``
+    seconds (or until ``max_batch`` messages are queued), then sends
+    everything queued so far over a single connection. Other callers block
+    until their own messages have been handled, and each one sees the errors
+    of its own messages as if it had sent them itself.
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self._cond = threading.Condition()
+        self._queue = []
+        self._leader_active = False
+        self.batches = 0
+
+    def submit(self, backend, email_messages):
+        entries = [_Pending(message) for message in email_messages]
+        done = threading.Event()
+
+        with self._cond:
+            self._queue.append((entries, done))
+            self._cond.notify_all()
+            is_leader = not self._leader_active
+            if is_leader:
+                self._leader_active = True
+                self._cond.wait_for(
+                    lambda: sum(len(e) for e, _ in self._queue) >= self.max_batch,
+                    timeout=self.window,
+                )
+                batch, self._queue = self._queue, []
+                self._leader_active = False
+
+        if is_leader:
+            try:
+                self._flush(backend, [entry for group, _ in batch for entry in group])
+            finally:
+                for _, event in batch:
+                    event.set()
+        else:
+            done.wait()
+
+        for entry in entries:
+            if entry.error is not None and not backend.fail_silently:
+                raise entry.error
+        return sum(entry.sent for entry in entries)
+
+    def _flush(self, backend, entries):
+        self.batches += 1
+        try:
+            with backend._lock:
+                new_conn_created = backend.open()
+                if not backend.connection or new_conn_created is None:
+                    return
+                try:
+                    for entry in entries:
+                        try:
+                            entry.sent = backend._send(entry.message)
+                        except Exception as e:
+                            entry.error = e
+                finally:
+                    if new_conn_created:
+                        backend.close()
+        except Exception as e:
+            # Could not connect (or close): every caller in the batch failed, not just the leader.
+            for entry in entries:
+                if not entry.sent and entry.error is None:
+                    entry.error = e
+
+
+_pools = {}
+_coalescers = {}
+_registry_lock = threading.Lock()
+
+
+class PooledSMTPBackend(EmailBackend):
+    """
+    SMTP backend that reuses authenticated connections across messages.
+
+    ``close()`` returns the connection to a process-wide pool instead of
+    quitting, so back-to-back sends skip the TCP/TLS handshake and login.
+    When ``EMAIL_COALESCE_WINDOW`` is set, messages sent without an explicitly
+    opened connection are batched with those of concurrent callers.
+
+    Settings:
+        EMAIL_POOL_SIZE: idle connections kept per server (default 4)
+        EMAIL_POOL_IDLE_TIMEOUT: seconds before an idle connection is dropped (default 60)
+        EMAIL_COALESCE_WINDOW: seconds to wait for more messages, 0 disables (default 0)
+        EMAIL_COALESCE_MAX_BATCH: flush early once this many are queued (default 100)
+    """
+
+    def __init__(self, pool_size=None, idle_timeout=None, coalesce_window=None, coalesce_max_batch=None, **kwargs):
+        super().__init__(**kwargs)
+        pool_size = getattr(settings, 'EMAIL_POOL_SIZE', 4) if pool_size is None else pool_size
+        idle_timeout = getattr(settings, 'EMAIL_POOL_IDLE_TIMEOUT', 60) if idle_timeout is None else idle_timeout
+        window = getattr(settings, 'EMAIL_COALESCE_WINDOW', 0) if coalesce_window is None else coalesce_window
+        max_batch = getattr(settings, 'EMAIL_COALESCE_MAX_BATCH', 100) if coalesce_max_batch is None else coalesce_max_batch
+
+        key = (self.host, self.port, self.username, self.use_tls, self.use_ssl)
+        with _registry_lock:
+            self.pool = _pools.get(key)
+            if self.pool is None:
+                self.pool = _pools[key] = SMTPConnectionPool(pool_size, idle_timeout)
+            self.coalescer = None
+            if window:
+                self.coalescer = _coalescers.get(key)
+                if self.coalescer is None:
+                    self.coalescer = _coalescers[key] = MessageCoalescer(window, max_batch)
+        self._broken = False
+
+    def open(self):
+        if self.connection:
+            return False
+        connection = self.pool.acquire()
+        if connection is not None:
+            self.connection = connection
+            self._broken = False
+            return True
+        opened = super().open()
+        if opened:
+            self.pool.created += 1
+            self._broken = False
+        return opened
+
+    def close(self):
+        if self._partial_connection is not None:
+            super().close()
+            return
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        if self._broken:
+            self._close_connection(connection)
+        else:
+            self.pool.release(connection)
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        # A caller that opened the connection itself is already batching.
+        if self.coalescer is not None and self.connection is None:
+            return self.coalescer.submit(self, email_messages)
+        return super().send_messages(email_messages)
+
+    def _send(self, email_message):
+        try:
+            return super()._send(email_message)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self._broken = True
+            raise
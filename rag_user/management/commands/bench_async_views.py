@@ -0,0 +1,64 @@
+import asyncio
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare profile reads through the sync DRF view (test Client, thread per request) "
+        "with the async view (AsyncClient, one event loop). Runs in-process through Django's "
+        "test clients, so it compares the views, not WSGI and ASGI server throughput. A "
+        "temporary user is created and removed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def handle(self, *args, **options):
+        n, concurrency = options['requests'], options['concurrency']
+        user = User.objects.create_user(f"bench_{uuid.uuid4().hex[:12]}", f"{uuid.uuid4().hex[:12]}@bench.invalid", None)
+        auth = f"Bearer {AccessToken.for_user(user)}"
+        try:
+            elapsed = self._sync(n, concurrency, auth)
+            self.stdout.write(f"sync   /user/profile/        {n / elapsed:8.1f} req/s  ({concurrency} threads)")
+            elapsed = asyncio.run(self._async(n, concurrency, auth))
+            self.stdout.write(f"async  /user/async/profile/  {n / elapsed:8.1f} req/s  ({concurrency} in flight)")
+        finally:
+            user.delete()
+
+    def _sync(self, n, concurrency, auth):
+        def worker(count):
+            client = Client(HTTP_AUTHORIZATION=auth)
+            for _ in range(count):
+                assert client.get('/user/profile/').status_code == 200
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, self._split(n, concurrency)))
+        return time.perf_counter() - start
+
+    async def _async(self, n, concurrency, auth):
+        client = AsyncClient()
+        headers = {'Authorization': auth}
+
+        async def worker(count):
+            for _ in range(count):
+                response = await client.get('/user/async/profile/', headers=headers)
+                assert response.status_code == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(count) for count in self._split(n, concurrency)))
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _split(n, parts):
+        return [n // parts + (1 if i < n % parts else 0) for i in range(parts)]
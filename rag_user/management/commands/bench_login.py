@@ -0,0 +1,98 @@
+import logging
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIClient
+
+from rag_user.hashing import password_hasher
+
+User = get_user_model()
+
+PASSWORD = "Bench-Pass-123"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure POST /user/login/ throughput with password hashing inline and in the "
+        "process pool. Creates bench_login_* users and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent clients, like web worker threads.")
+        parser.add_argument('--workers', type=int, default=password_hasher.workers or os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count() or 1
+        encoded = make_password(PASSWORD)
+        users = User.objects.bulk_create(
+            User(username=f"bench_login_{i}", email=f"bench_login_{i}@example.com", password=encoded)
+            for i in range(options['users'])
+        )
+        saved = (password_hasher.workers, password_hasher.max_pending)
+        # Rejected logins would each log a 503.
+        request_logger = logging.getLogger('django.request')
+        saved_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        self.stdout.write(f"{cores} core(s), {options['threads']} client threads, {options['logins']} logins")
+        try:
+            password_hasher.configure(workers=0)
+            self._run("inline", users, options, cores)
+            password_hasher.configure(workers=options['workers'])
+            password_hasher.warm_up()
+            self._run(f"pool ({options['workers']} workers)", users, options, cores)
+            # Admission control: more clients than the queue admits.
+            password_hasher.configure(workers=options['workers'], max_pending=max(1, options['threads'] // 2))
+            password_hasher.warm_up()
+            self._run(f"pool, max_pending={password_hasher.max_pending}", users, options, cores)
+        finally:
+            password_hasher.configure(*saved)
+            request_logger.setLevel(saved_level)
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def _run(self, label, users, options, cores):
+        latencies, statuses = [], {}
+        lock = threading.Lock()
+        counter = iter(range(options['logins']))
+
+        def client_loop():
+            client = APIClient()
+            try:
+                while True:
+                    with lock:
+                        i = next(counter, None)
+                    if i is None:
+                        return
+                    user = users[i % len(users)]
+                    start = time.perf_counter()
+                    response = client.post('/user/login/', {'username': user.username, 'password': PASSWORD},
+                                           format='json')
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as executor:
+            for future in [executor.submit(client_loop) for _ in range(options['threads'])]:
+                future.result()
+        wall = time.perf_counter() - start
+
+        ok = statuses.get(200, 0)
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        self.stdout.write(
+            f"{label:<28} {ok / wall:7.1f} logins/s  {ok / wall / cores:7.1f} /s/core  "
+            f"p50 {statistics.median(latencies) * 1000:6.1f} ms  p95 {p95 * 1000:6.1f} ms  "
+            f"statuses {dict(sorted(statuses.items()))}"
+        )
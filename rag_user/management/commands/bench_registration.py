@@ -0,0 +1,80 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from rag_user.serializers import RegistrationSerializer
+
+User = get_user_model()
+
+
+class LegacyRegistrationSerializer(RegistrationSerializer):
+    """The previous validation: an email exists() plus a UniqueValidator per field."""
+
+    class Meta(RegistrationSerializer.Meta):
+        extra_kwargs = {}
+
+    def validate_email(self, value):
+        value = value.lower()
+        if User.objects.filter(email=value).exists():
+            raise serializers.ValidationError("A user with that email already exists.")
+        return value
+
+    def validate(self, data):
+        if data.get('password') != data.get('confirm_password'):
+            raise serializers.ValidationError({'confirm_password': "Passwords don't match."})
+        return data
+
+
+class Command(BaseCommand):
+    help = "Count queries and time per signup. Everything runs in a rolled-back transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--signups', type=int, default=50)
+
+    def handle(self, *args, **options):
+        n = options['signups']
+        with transaction.atomic():
+            self._validation(LegacyRegistrationSerializer, "legacy validation", n, 'legacy')
+            self._validation(RegistrationSerializer, "single-query validation", n, 'new')
+            self._endpoint(n)
+            transaction.set_rollback(True)
+
+    def _payload(self, prefix, i):
+        return {
+            'username': f"bench_{prefix}_{i}",
+            'first_name': "Bench",
+            'last_name': "User",
+            'email': f"Bench_{prefix}_{i}@Example.com",
+            'password': "Bench-Pass-123",
+            'confirm_password': "Bench-Pass-123",
+        }
+
+    def _validation(self, serializer_class, label, n, prefix):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for i in range(n):
+                serializer = serializer_class(data=self._payload(prefix, i))
+                serializer.is_valid(raise_exception=True)
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{label:<26} {len(queries) / n:5.2f} queries/signup  {elapsed / n * 1000:7.3f} ms/signup"
+        )
+
+    def _endpoint(self, n):
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for i in range(n):
+                response = client.post('/user/register/', self._payload('http', i), format='json')
+                assert response.status_code == 201, response.data
+            elapsed = time.perf_counter() - start
+        selects = sum(1 for q in queries if q['sql'].startswith('SELECT'))
+        self.stdout.write(
+            f"{'POST /user/register/':<26} {len(queries) / n:5.2f} queries/signup "
+            f"({selects / n:.2f} SELECT)  {elapsed / n * 1000:7.3f} ms/signup"
+        )
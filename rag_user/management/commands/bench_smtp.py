@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import EmailMessage
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.management.base import BaseCommand
+
+from rag_user.mail_backends import PooledSMTPBackend, _coalescers, _pools
+from rag_user.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = "Benchmark the default SMTP backend against the pooled backend using a local SMTP sink."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--connect-delay', type=float, default=0.05,
+                            help="Seconds the sink waits before greeting, to model a TLS handshake.")
+        parser.add_argument('--window', type=float, default=0.02, help="Coalescing window for the batched run.")
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(connect_delay=options['connect_delay']).start()
+        try:
+            common = dict(host='127.0.0.1', port=sink.port, username='', password='',
+                          use_tls=False, use_ssl=False, timeout=10)
+            runs = [
+                ("django smtp", lambda: EmailBackend(**common)),
+                ("pooled", lambda: PooledSMTPBackend(coalesce_window=0, **common)),
+                ("pooled+coalesce", lambda: PooledSMTPBackend(coalesce_window=options['window'], **common)),
+            ]
+            for label, factory in runs:
+                _pools.clear()
+                _coalescers.clear()
+                sink.reset_counters()
+                elapsed = self._run(factory, options['messages'], options['concurrency'])
+                self.stdout.write(
+                    f"{label:<16} {options['messages'] / elapsed:8.1f} msg/s  "
+                    f"{sink.connections:4d} connections  {sink.messages:4d} delivered"
+                )
+        finally:
+            for pool in _pools.values():
+                pool.clear()
+            sink.stop()
+
+    def _run(self, factory, count, concurrency):
+        def send_one(i):
+            message = EmailMessage(f"Benchmark {i}", "body", "bench@example.com", [f"user{i}@example.com"])
+            return factory().send_messages([message])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            sent = sum(executor.map(send_one, range(count)))
+        elapsed = time.perf_counter() - start
+        assert sent == count, f"only {sent}/{count} messages sent"
+        return elapsed
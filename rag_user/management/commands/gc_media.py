@@ -0,0 +1,99 @@
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from rag_user.images import stored_image_names
+from rag_user.models import StoredBlob
+from rag_user.storage import HASHED_NAME_RE
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Delete content-addressed profile images that nothing references."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help="Only remove blobs unreferenced (or files untracked) for at least this long.")
+        parser.add_argument('--recount', action='store_true',
+                            help="Rebuild reference counts from the user table before collecting.")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = User._meta.get_field('image').storage
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        dry_run = options['dry_run']
+
+        if options['recount']:
+            self._recount(dry_run)
+
+        removed = freed = 0
+        for blob in StoredBlob.objects.filter(refcount=0, updated_at__lt=cutoff).iterator():
+            if dry_run:
+                removed += 1
+                freed += blob.size
+                continue
+            # Conditional delete: a concurrent save may have revived the blob. The file
+            # goes before the row is committed, so a save that recreates the row
+            # after us also writes the file again (ContentAddressedStorage._save).
+            with transaction.atomic():
+                deleted, _ = StoredBlob.objects.filter(pk=blob.pk, refcount=0).delete()
+                if deleted:
+                    self._remove_file(storage.path(blob.name))
+            if deleted:
+                removed += 1
+                freed += blob.size
+
+        untracked = self._collect_untracked(storage, cutoff, dry_run)
+
+        prefix = "Would remove" if dry_run else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {removed} unreferenced blobs ({freed / 1024:.1f} KiB) and {untracked} untracked files"
+        ))
+
+    def _recount(self, dry_run):
+        counts = Counter()
+        for user in User.objects.exclude(image="").exclude(image=None).only('image', 'image_variants').iterator():
+            counts.update(stored_image_names(user))
+        changed = 0
+        for blob in StoredBlob.objects.iterator():
+            actual = counts.get(blob.name, 0)
+            if blob.refcount != actual:
+                changed += 1
+                if not dry_run:
+                    StoredBlob.objects.filter(pk=blob.pk).update(refcount=actual, updated_at=timezone.now())
+        self.stdout.write(f"Reference counts corrected: {changed}")
+
+    def _collect_untracked(self, storage, cutoff, dry_run):
+        """Hashed files with no StoredBlob row, e.g. left by a crash mid-save."""
+        root = storage.path(storage.prefix)
+        if not os.path.isdir(root):
+            return 0
+        tracked = set(StoredBlob.objects.values_list('name', flat=True))
+        cutoff_ts = cutoff.timestamp()
+        removed = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                in_tmp = f"{storage.prefix}.tmp/" in name
+                if not in_tmp and (not HASHED_NAME_RE.search(name) or name in tracked):
+                    continue
+                if os.path.getmtime(path) > cutoff_ts:
+                    continue
+                removed += 1
+                if not dry_run:
+                    self._remove_file(path)
+        return removed
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
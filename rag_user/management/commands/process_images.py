@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rag_user.images import process_batch
+
+
+class Command(BaseCommand):
+    help = "Validate, strip and resize queued profile image uploads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of exiting when the queue is empty.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep between polls when idle (with --loop).")
+
+    def handle(self, *args, **options):
+        total_done = total_failed = 0
+
+        while True:
+            done, failed = process_batch(batch_size=options['batch_size'])
+            total_done += done
+            total_failed += failed
+            if done or failed:
+                self.stdout.write(f"Processed {done}, failed {failed}")
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {total_done} processed, {total_failed} failed"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rag_user.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = "Delete token revocations whose tokens have all expired."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        expired = RevokedToken.objects.filter(expires_at__lte=timezone.now())
+        if options['dry_run']:
+            self.stdout.write(f"Would delete {expired.count()} expired revocation(s).")
+            return
+        deleted, _ = expired.delete()
+        self.stdout.write(f"Deleted {deleted} expired revocation(s).")
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rag_user.mail import deliver_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver messages from the outbound email queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Messages sent per SMTP connection.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling the queue instead of exiting when it is empty.")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep between polls when idle (with --loop).")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total_sent = total_failed = 0
+
+        while True:
+            sent, failed = deliver_batch(batch_size=batch_size)
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"Sent {sent}, failed {failed}")
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {total_sent} sent, {total_failed} failed"))
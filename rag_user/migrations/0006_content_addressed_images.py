@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:58
+
+import rag_user.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_user', '0005_image_upload_pipeline'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=rag_user.storage.profile_image_storage, upload_to='users/user_img/'),
+        ),
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('digest', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='blob_orphan_idx')],
+            },
+        ),
+    ]
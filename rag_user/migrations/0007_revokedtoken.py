@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_user', '0006_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('revoked_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='revoked_token_expiry_idx'), models.Index(fields=['revoked_at'], name='revoked_token_revoked_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_user', '0007_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='claimed_by',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_user', '0008_outboundemail_claimed_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='claimed_by',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
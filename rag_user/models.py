@@ -1,6 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .hashing import password_hasher
+from .storage import profile_image_storage
 # Create your models here.
 
 
@@ -11,13 +16,161 @@ USER_GENDER_CHOICES = (
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
-    image = models.ImageField(upload_to="users/user_img/", null=True, blank=True)
+    image = models.ImageField(upload_to="users/user_img/", storage=profile_image_storage, null=True, blank=True)
     birth_date = models.DateField(null=True, blank=True)
     gender = models.CharField(max_length=10, choices=USER_GENDER_CHOICES, null=True, blank=True)
     is_verified = models.BooleanField(default=False)
+    # Processed WebP renditions of `image`, keyed by size: {"64": "<storage name>", ...}
+    image_variants = models.JSONField(default=dict, blank=True)
 
+    class Meta(AbstractUser.Meta):
+        # Case-insensitive uniqueness; registration looks users up by these
+        # same expressions so the checks are index-backed.
+        constraints = [
+            models.UniqueConstraint(Lower('email'), name='user_email_ci_unique'),
+            models.UniqueConstraint(Lower('username'), name='user_username_ci_unique'),
+        ]
 
     def __str__(self):
         return self.username
 
+    # Hashing and verification run in rag_user.hashing's process pool, so
+    # every caller (login through ModelBackend, registration, password
+    # change, account deletion) keeps PBKDF2 off the request thread.
+
+    def set_password(self, raw_password):
+        self.password = password_hasher.hash(raw_password)
+        self._password = raw_password
+
+    async def aset_password(self, raw_password):
+        self.password = await password_hasher.ahash(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        is_correct, upgraded = password_hasher.verify(raw_password, self.password)
+        if upgraded:
+            # Stored with an older hasher or fewer iterations than configured.
+            self.password, self._password = upgraded, None
+            self.save(update_fields=['password'])
+        return is_correct
+
+    async def acheck_password(self, raw_password):
+        is_correct, upgraded = await password_hasher.averify(raw_password, self.password)
+        if upgraded:
+            self.password, self._password = upgraded, None
+            await self.asave(update_fields=['password'])
+        return is_correct
+
+
+class OutboundEmail(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254, null=True, blank=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set by the worker that claimed the row for sending, so it can select exactly its own claims.
+    claimed_by = models.UUIDField(null=True, blank=True, editable=False)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)}"
+
+
+class ImageUpload(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='image_uploads')
+    staged_path = models.CharField(max_length=500)
+    original_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set by the worker that claimed the upload, as on OutboundEmail.
+    claimed_by = models.UUIDField(null=True, blank=True, editable=False)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='image_upload_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.original_name} ({self.status})"
+
+
+class StoredBlob(models.Model):
+    """A file kept by ContentAddressedStorage and how many fields reference it."""
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'], name='blob_orphan_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked JWT, or every token of a user issued before ``revoked_at``.
+
+    ``key`` is the token's jti, or ``user:<id>`` for a user-wide revocation
+    (password change, account deletion). Rows are useless once the tokens
+    they cover have expired, and ``prune_revoked_tokens`` deletes them.
+    """
+    USER_KEY_PREFIX = 'user:'
+
+    key = models.CharField(max_length=255, unique=True)
+    # Not a foreign key: a deleted account's revocation must outlive its row.
+    user_id = models.BigIntegerField(null=True, blank=True)
+    revoked_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='revoked_token_expiry_idx'),
+            models.Index(fields=['revoked_at'], name='revoked_token_revoked_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} (until {self.expires_at})"
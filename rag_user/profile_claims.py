@@ -0,0 +1,110 @@
+"""
+Profile data embedded in JWTs so /user/profile/ can answer without the DB.
+
+A token carries the serialised profile plus a version (a digest of that
+data). The current version of each user is kept in Django's cache and
+refreshed whenever the user row is saved, so a token whose version no
+longer matches is treated as stale and the view falls back to the database.
+The version also covers the password hash and ``is_active``, so a password
+change or deactivation makes every earlier claim stale.
+Use a shared cache backend in multi-process deployments: with the default
+per-process LocMemCache other workers only notice a change after
+``JWT_PROFILE_VERSION_TTL`` seconds.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+PROFILE_CLAIM = 'profile'
+DELETED = 'deleted'
+
+ENABLED = getattr(settings, 'JWT_PROFILE_CLAIMS', False)
+VERSION_TTL = getattr(settings, 'JWT_PROFILE_VERSION_TTL', 300)
+
+
+def _version_key(user_id):
+    return f"rag_user:profile_version:{user_id}"
+
+
+def serialize_profile(user):
+    from .serializers import UserSerializer
+    # No request in the context, so image is the relative media URL.
+    return dict(UserSerializer(user).data)
+
+
+def profile_version(user, data):
+    payload = json.dumps(
+        [data, user.password, user.is_active], sort_keys=True, separators=(',', ':'), default=str,
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+def build_profile_claim(user):
+    data = serialize_profile(user)
+    version = profile_version(user, data)
+    cache.set(_version_key(user.pk), version, VERSION_TTL)
+    return {'v': version, 'user': data}
+
+
+def remember_profile_version(user):
+    cache.set(_version_key(user.pk), profile_version(user, serialize_profile(user)), VERSION_TTL)
+
+
+async def aremember_profile_version(user):
+    await cache.aset(_version_key(user.pk), profile_version(user, serialize_profile(user)), VERSION_TTL)
+
+
+def forget_profile_version(user_id):
+    cache.set(_version_key(user_id), DELETED, VERSION_TTL)
+
+
+def _claim(token):
+    claim = token.get(PROFILE_CLAIM) if token is not None else None
+    return claim or None
+
+
+def current_claim(token):
+    """The token's profile claim if its version is current, otherwise None."""
+    claim = _claim(token)
+    if claim is None or cache.get(_version_key(claim['user']['id'])) != claim['v']:
+        return None
+    return claim
+
+
+async def acurrent_claim(token):
+    claim = _claim(token)
+    if claim is None or await cache.aget(_version_key(claim['user']['id'])) != claim['v']:
+        return None
+    return claim
+
+
+def profile_from_token(request, token=None):
+    """
+    Return the profile carried by the request's access token if its version
+    is current, otherwise None (the caller should read the database).
+    """
+    if token is None:
+        token = getattr(request, 'auth', None)
+    claim = current_claim(token)
+    if claim is None:
+        return None
+    return _profile_data(request, claim)
+
+
+async def aprofile_from_token(request, token):
+    claim = await acurrent_claim(token)
+    if claim is None:
+        return None
+    return _profile_data(request, claim)
+
+
+def _profile_data(request, claim):
+    data = dict(claim['user'])
+    if data.get('image'):
+        data['image'] = request.build_absolute_uri(data['image'])
+    data['image_variants'] = {
+        size: request.build_absolute_uri(url) for size, url in data.get('image_variants', {}).items()
+    }
+    return data
@@ -0,0 +1,262 @@
+"""
+JWT revocation.
+
+Revocations are rows of RevokedToken: a single token by its ``jti`` (a
+refresh token rotated out under ``BLACKLIST_AFTER_ROTATION``), or all of a
+user's tokens issued before a point in time (password change, account
+deletion). Both refresh and ordinary authenticated requests check them.
+
+Revocations are rare, so checking a token usually needs no query. Every
+process keeps a Bloom filter of the revoked jtis, and only asks the
+database when a token's jti is (probably) in it. It also keeps a map of
+user id to revocation time for the users revoked within the last
+``ACCESS_TOKEN_LIFETIME``, against which a token's ``iat`` is compared
+directly. Older user revocations only matter to tokens issued before them
+that are still valid, which means refresh tokens older than the access
+token lifetime; those are checked against the database.
+
+A background thread picks up revocations made by other processes every
+``TOKEN_REVOCATION_SYNC_INTERVAL`` seconds, by reading the rows revoked
+since the previous sync, and rebuilds the filter and map from the
+unexpired rows every ``TOKEN_REVOCATION_REBUILD_INTERVAL`` seconds or when
+the filter fills up, so pruned entries stop causing lookups. Revocations
+made by a process apply to it straight away.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+
+SYNC_INTERVAL = getattr(settings, 'TOKEN_REVOCATION_SYNC_INTERVAL', 5)
+REBUILD_INTERVAL = getattr(settings, 'TOKEN_REVOCATION_REBUILD_INTERVAL', 3600)
+ERROR_RATE = 0.001
+MIN_CAPACITY = 1024
+# Rows are read back from a little before the previous sync, so a revocation
+# whose transaction committed late is not skipped.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter of strings for up to ``capacity`` keys at ``error_rate`` false positives."""
+
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def nbytes(self):
+        return len(self.bits)
+
+
+def user_key(user_id):
+    return f"{RevokedToken.USER_KEY_PREFIX}{user_id}"
+
+
+class RevocationList:
+
+    def __init__(self, sync_interval=SYNC_INTERVAL, rebuild_interval=REBUILD_INTERVAL, error_rate=ERROR_RATE):
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.error_rate = error_rate
+        self._filter = None
+        self._users = {}
+        self._built_at = -math.inf
+        self._since = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self.lookups = self.false_positives = 0
+
+    @property
+    def user_window(self):
+        """How long user revocations are kept in memory: no access token outlives this."""
+        return api_settings.ACCESS_TOKEN_LIFETIME
+
+    def _started(self):
+        return self._filter is not None and self._pid == os.getpid()
+
+    def _start(self):
+        """Build the filter, then keep it in sync from a background thread (again after a fork)."""
+        with self._start_lock:
+            if self._started():
+                return
+            self.sync()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="token-revocation-sync", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sync_interval)
+            close_old_connections()
+            try:
+                self.sync()
+            except Exception:
+                # Keep checking against what we have; the next sync catches up.
+                pass
+
+    def sync(self):
+        """Add revocations recorded by any process since the last sync; rebuild when due."""
+        started, now = time.monotonic(), timezone.now()
+        bloom = self._filter
+        rows = RevokedToken.objects.filter(expires_at__gt=now)
+        rebuild = bloom is None or started - self._built_at >= self.rebuild_interval or bloom.count >= bloom.capacity
+        if not rebuild:
+            rows = rows.filter(revoked_at__gte=self._since - SYNC_OVERLAP)
+        rows = list(rows.values_list('key', 'revoked_at'))
+        jtis = [key for key, _ in rows if not key.startswith(RevokedToken.USER_KEY_PREFIX)]
+        cutoff = now - self.user_window
+
+        if rebuild:
+            bloom = BloomFilter(max(MIN_CAPACITY, 2 * len(jtis)), self.error_rate)
+            for key in jtis:
+                bloom.add(key)
+            users = {}
+        with self._lock:
+            if rebuild:
+                self._filter, self._built_at = bloom, started
+            else:
+                users = self._users
+                for key in jtis:
+                    if key not in bloom:
+                        bloom.add(key)
+            for key, revoked_at in rows:
+                if key.startswith(RevokedToken.USER_KEY_PREFIX) and revoked_at > cutoff:
+                    self._remember_user(users, key[len(RevokedToken.USER_KEY_PREFIX):], revoked_at)
+            # Past the access token lifetime, a user revocation only matters to old refresh tokens.
+            oldest = int(cutoff.timestamp())
+            self._users = {user_id: before for user_id, before in users.items() if before > oldest}
+        self._since = now
+
+    @staticmethod
+    def _remember_user(users, user_id, revoked_at):
+        # iat has whole seconds: tokens issued in the second of the revocation stay valid,
+        # so logging in again straight after a password change works.
+        before = int(revoked_at.timestamp())
+        users[str(user_id)] = max(users.get(str(user_id), before), before)
+
+    def _add(self, key):
+        with self._lock:
+            if self._filter is not None and key not in self._filter:
+                self._filter.add(key)
+
+    def _add_user(self, user_id, revoked_at):
+        with self._lock:
+            self._remember_user(self._users, user_id, revoked_at)
+
+    def _check(self, token):
+        """
+        Check the token against memory: ``(True, [])`` if it is revoked,
+        otherwise ``(False, keys)`` with the keys the database still has to
+        rule out, usually none.
+        """
+        user_id = token.get(api_settings.USER_ID_CLAIM)
+        issued_at = token.get('iat')
+        keys = []
+        if user_id is not None:
+            before = self._users.get(str(user_id))
+            if before is not None and (issued_at is None or issued_at < before):
+                return True, []
+            if issued_at is None or time.time() - issued_at >= self.user_window.total_seconds():
+                # Issued before the user revocations held in memory.
+                keys.append(user_key(user_id))
+        jti = token.get(api_settings.JTI_CLAIM)
+        if jti and jti in self._filter:
+            keys.append(jti)
+        return False, keys
+
+    def _lookup(self, token, keys):
+        rows = RevokedToken.objects.filter(key__in=keys, expires_at__gt=timezone.now()).values_list('key', 'revoked_at')
+        self.lookups += 1
+        issued_at = token.get('iat')
+        for key, revoked_at in rows:
+            if not key.startswith(RevokedToken.USER_KEY_PREFIX):
+                return True
+            if issued_at is None or issued_at < int(revoked_at.timestamp()):
+                return True
+        self.false_positives += 1
+        return False
+
+    def is_revoked(self, token):
+        if not self._started():
+            self._start()
+        revoked, keys = self._check(token)
+        if revoked or not keys:
+            return revoked
+        return self._lookup(token, keys)
+
+    async def ais_revoked(self, token):
+        if not self._started():
+            await sync_to_async(self._start)()
+        revoked, keys = self._check(token)
+        if revoked or not keys:
+            return revoked
+        return await sync_to_async(self._lookup)(token, keys)
+
+    def stats(self):
+        bloom = self._filter
+        return {
+            'keys': bloom.count if bloom else 0,
+            'users': len(self._users),
+            'filter_bytes': bloom.nbytes() if bloom else 0,
+            'lookups': self.lookups,
+            'false_positives': self.false_positives,
+        }
+
+
+revocations = RevocationList()
+
+
+def revoke_token(token):
+    """Revoke one token (by jti) until it expires."""
+    key = token[api_settings.JTI_CLAIM]
+    RevokedToken.objects.get_or_create(key=key, defaults={
+        'user_id': token.get(api_settings.USER_ID_CLAIM),
+        'expires_at': datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc),
+    })
+    revocations._add(key)
+
+
+def _user_revocation(user_id):
+    now = timezone.now()
+    # After the longest token lifetime, every token this covers has expired anyway.
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    return user_key(user_id), {'user_id': user_id, 'revoked_at': now, 'expires_at': now + lifetime}
+
+
+def revoke_user_tokens(user_id):
+    """Revoke every token issued to the user so far."""
+    key, defaults = _user_revocation(user_id)
+    RevokedToken.objects.update_or_create(key=key, defaults=defaults)
+    revocations._add_user(user_id, defaults['revoked_at'])
+
+
+async def arevoke_user_tokens(user_id):
+    key, defaults = _user_revocation(user_id)
+    await RevokedToken.objects.aupdate_or_create(key=key, defaults=defaults)
+    revocations._add_user(user_id, defaults['revoked_at'])
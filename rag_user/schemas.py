@@ -1,8 +1,20 @@
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiParameter,extend_schema
 
 from .serializers import UserSerializer
 
+
+# Extensions match the exact authenticator class, so simplejwt's jwtAuth
+# scheme has to be registered again for ours (imported in apps.ready()).
+class CachedJWTScheme(SimpleJWTScheme):
+    target_class = 'rag_user.authentication.CachedJWTAuthentication'
+
+
+class ProfileClaimScheme(SimpleJWTScheme):
+    target_class = 'rag_user.authentication.ProfileClaimAuthentication'
+
+
 user_list_docs = extend_schema(
     responses=UserSerializer(),
     parameters=[
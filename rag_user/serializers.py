@@ -1,13 +1,61 @@
 from rest_framework import serializers
 from .models import CustomUser
 from django.contrib.auth import get_user_model
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from . import profile_claims
+from .revocation import revocations, revoke_token
 
 User = get_user_model()
 
+EMAIL_TAKEN = "A user with that email already exists."
+USERNAME_TAKEN = "A user with that username already exists."
+
 class UserSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'image','gender','birth_date','is_verified']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'image','image_variants','gender','birth_date','is_verified']
+
+    def get_image_variants(self, obj) -> dict:
+        request = self.context.get('request')
+        storage = obj.image.storage
+        urls = {}
+        for size, name in obj.image_variants.items():
+            url = storage.url(name)
+            urls[size] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+def registration_clashes(email, username):
+    """
+    Existing (email, username) pairs clashing with a signup, lower-cased.
+
+    One round trip for both constraints, using the Lower() unique indexes.
+    """
+    return (
+        User.objects
+        .annotate(email_ci=Lower('email'), username_ci=Lower('username'))
+        .filter(Q(email_ci=email.lower()) | Q(username_ci=username.lower()))
+        .values_list('email_ci', 'username_ci')[:2]
+    )
+
+
+def uniqueness_errors(email, username, clashes):
+    errors = {}
+    for existing_email, existing_username in clashes:
+        if existing_email == email.lower():
+            errors['email'] = EMAIL_TAKEN
+        if existing_username == username.lower():
+            errors['username'] = USERNAME_TAKEN
+    return errors
 
 
 class RegistrationSerializer(serializers.ModelSerializer):
@@ -18,20 +66,29 @@ class RegistrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["username","first_name","last_name","email","password","confirm_password"]
-    
+        # Uniqueness of both fields is checked together in validate(), so drop
+        # the per-field UniqueValidators (one query each).
+        extra_kwargs = {
+            'username': {'validators': [UnicodeUsernameValidator()]},
+            'email': {'validators': []},
+        }
+
     def validate_email(self, value):
-        value = value.lower()
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("A user with that email already exists.")
-        return value
-    
+        return value.lower()
+
     def validate(self, data):
         password = data.get('password')
         confirm_password = data.get('confirm_password')
         
         if password != confirm_password:
             raise serializers.ValidationError({'confirm_password': "Passwords don't match."})
-        
+
+        # Async callers run the uniqueness query themselves with the async ORM.
+        if self.context.get('check_uniqueness', True):
+            errors = uniqueness_errors(data['email'], data['username'], registration_clashes(data['email'], data['username']))
+            if errors:
+                raise serializers.ValidationError(errors)
+
         return data
     
     def create(self, validated_data):
@@ -41,7 +98,14 @@ class RegistrationSerializer(serializers.ModelSerializer):
         user = User(**validated_data)
         user.set_password(password)
         user.is_active = False
-        user.save()
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError as e:
+            # Lost a race with a concurrent signup between validate() and here.
+            if 'email' in str(e):
+                raise serializers.ValidationError({'email': [EMAIL_TAKEN]})
+            raise serializers.ValidationError({'username': [USERNAME_TAKEN]})
         return user
 
 
@@ -73,4 +137,28 @@ class ProfileDeleteSerializer(serializers.Serializer):
 
         if not user.check_password(value):
             raise serializers.ValidationError("Incorrect password.")
-        return value
\ No newline at end of file
+        return value
+
+
+class ProfileTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds the versioned profile claim to issued tokens when JWT_PROFILE_CLAIMS is on."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        if profile_claims.ENABLED:
+            token[profile_claims.PROFILE_CLAIM] = profile_claims.build_profile_claim(user)
+        return token
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses revoked refresh tokens, and revokes rotated ones when BLACKLIST_AFTER_ROTATION is on."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if revocations.is_revoked(refresh):
+            raise InvalidToken("Token has been revoked.")
+        data = super().validate(attrs)
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            revoke_token(refresh)
+        return data
@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from askrag.replicas import pin_saved_user
+
+from . import profile_claims
+from .authentication import user_cache
+from .images import discard_staged
+from .models import ImageUpload
+from .revocation import revoke_user_tokens
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Any save, including set_password() + save() on password change, makes
+    # the cached snapshots of this user stale.
+    user_cache.invalidate_user(str(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def pin_reads_to_primary(sender, instance, **kwargs):
+    # Replicas may not have this save yet (askrag.replicas).
+    pin_saved_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def refresh_profile_version(sender, instance, **kwargs):
+    if profile_claims.ENABLED:
+        profile_claims.remember_profile_version(instance)
+
+
+@receiver(post_delete, sender=User)
+def drop_profile_version(sender, instance, **kwargs):
+    if profile_claims.ENABLED:
+        profile_claims.forget_profile_version(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=ImageUpload)
+def discard_staged_upload(sender, instance, **kwargs):
+    # Uploads cascade away with their user; don't leave the staged file behind.
+    transaction.on_commit(lambda: discard_staged(instance))
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+
+HASHED_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{2}/([0-9a-f]{64})(\.[A-Za-z0-9]+)?$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that names every file after the SHA-256 of its content.
+
+    Content is hashed while it is streamed to a temporary file, which is then
+    renamed to ``<prefix><aa>/<digest><ext>``. Saving content that is already
+    stored only bumps the blob's reference count, so identical files are kept
+    once. ``delete()`` drops a reference; blobs nobody references are removed
+    by the ``gc_media`` command. Because a name always maps to the same bytes,
+    URLs can be cached forever.
+
+    The reference is taken before the file is put in place, and the file is
+    written whenever the row is new or the file is gone: ``gc_media`` deletes
+    a row and its file in one transaction, so a save racing it either revives
+    the row before the delete or recreates both after it.
+    """
+
+    def __init__(self, prefix="users/user_img/", **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix
+
+    @property
+    def blobs(self):
+        return apps.get_model('rag_user', 'StoredBlob').objects
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is chosen from the content in _save().
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        tmp_dir = self.path(f"{self.prefix}.tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+
+            hexdigest = digest.hexdigest()
+            final_name = f"{self.prefix}{hexdigest[:2]}/{hexdigest}{ext}"
+            final_path = self.path(final_name)
+            created = self._add_reference(final_name, hexdigest, size)
+            if not created and os.path.exists(final_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return final_name
+
+    def _add_reference(self, name, digest, size):
+        """Count one more reference to ``name``; True if its row was created."""
+        now = timezone.now()
+        if self.blobs.filter(name=name).update(refcount=F('refcount') + 1, updated_at=now):
+            return False
+        try:
+            with transaction.atomic():
+                self.blobs.create(name=name, digest=digest, size=size, refcount=1)
+            return True
+        except IntegrityError:
+            # Created concurrently by another request.
+            self.blobs.filter(name=name).update(refcount=F('refcount') + 1, updated_at=now)
+            return False
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        if not HASHED_NAME_RE.search(name):
+            # Files stored before this storage was introduced.
+            super().delete(name)
+            return
+        self.blobs.filter(name=name, refcount__gt=0).update(refcount=F('refcount') - 1, updated_at=timezone.now())
+
+
+def profile_image_storage():
+    return ContentAddressedStorage(
+        prefix=getattr(settings, 'PROFILE_IMAGE_PREFIX', "users/user_img/"),
+    )
@@ -2,6 +2,7 @@ from rest_framework.routers import DefaultRouter
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import *
+from . import async_views
 
 
 
@@ -23,5 +24,11 @@ urlpatterns = [
 
 
     path('account/active/<uid64>/<token>/', activate, name='activate'),
+
+    # ASGI-native versions of the endpoints above
+    path('async/register/', async_views.register, name='async-user-register'),
+    path('async/account/active/<uid64>/<token>/', async_views.activate, name='async-activate'),
+    path('async/profile/', async_views.profile, name='async-user-profile'),
+    path('async/change-password/<int:pk>/', async_views.change_password, name='async-change-password'),
     
 ]
\ No newline at end of file
@@ -3,14 +3,20 @@ from django.shortcuts import render
 from django.contrib.auth import get_user_model
 from .serializers import UserSerializer,RegistrationSerializer,UserUpdateSerializer,PasswordChangeSerializer,ProfileDeleteSerializer
 from rest_framework import viewsets,mixins
-from rest_framework.permissions import AllowAny,IsAuthenticated
+from rest_framework.permissions import AllowAny,IsAuthenticated,SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import PermissionDenied
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode,urlsafe_base64_decode
 from django.utils.encoding import force_bytes
-from django.template.loader import render_to_string
-from django.core.mail import EmailMultiAlternatives
+from .mail import enqueue_email, render_email
+from . import profile_claims
+from .images import MAX_UPLOAD_BYTES, delete_user_images, stage_upload
+from .revocation import revoke_user_tokens
+from rag_service.ingestion import delete_user_documents
+from askrag.replicas import ReplicaReadsMixin
+from .authentication import ProfileClaimAuthentication
 from django.shortcuts import redirect
 from django.conf import settings
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
@@ -23,7 +29,7 @@ from rest_framework.decorators import action
 User = get_user_model()
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     parser_classes = [MultiPartParser, FormParser, JSONParser] 
@@ -96,17 +102,11 @@ class RegistrationViewSet(mixins.CreateModelMixin,viewsets.GenericViewSet):
             confirm_link = f"https://my-django-template.onrender.com/user/account/active/{uid}/{token}"
 
             email_subject = "Confirm Your Email"
-            email_body = render_to_string('confirm_account_email.html',{'confirm_link':confirm_link})
-
-            email = EmailMultiAlternatives(email_subject,"",from_email=settings.EMAIL_HOST_USER,to=[user.email])
-            email.attach_alternative(email_body,"text/html")
-            try:
-                email.send()
-                print(f"Email sent successfully to {user.email}")
-                return Response({"message": "Check Your Mail for Confirmation"}, status=status.HTTP_201_CREATED)
-            except Exception as e:
-                print(f"Email Error: {str(e)}")
-                return Response({"message": "User created but email failed to send", "error": str(e)}, status=status.HTTP_201_CREATED)
+            text_body, html_body = render_email('confirm_account_email.html',{'confirm_link':confirm_link})
+
+            # Delivery happens in the send_queued_mail worker, not on the request.
+            enqueue_email(email_subject, [user.email], body=text_body, html_body=html_body)
+            return Response({"message": "Check Your Mail for Confirmation"}, status=status.HTTP_201_CREATED)
         
         # Log validation errors for debugging
         print(f"Registration validation errors: {serializer.errors}")
@@ -130,9 +130,29 @@ def activate(request,uid64,token):
     #     return redirect("http://127.0.0.1:8000/login")
     # return redirect("http://127.0.0.1:8000/register")
 
-class ProfileViewSet(viewsets.ModelViewSet):
+class ProfileViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [AllowAny] 
+
+    def get_authenticators(self):
+        # The token's profile claim answers most reads, so skip the user lookup;
+        # writes always authenticate against the user row.
+        if profile_claims.ENABLED and self.request.method in SAFE_METHODS:
+            return [ProfileClaimAuthentication()]
+        return super().get_authenticators()
+
+    def list(self, request, *args, **kwargs):
+        if profile_claims.ENABLED:
+            profile = profile_claims.profile_from_token(request)
+            if profile is not None:
+                return Response([profile])
+            # Stale or missing claim: read the row and re-publish its version.
+            user = self.get_queryset().first()
+            if user is None:
+                return Response([])
+            profile_claims.remember_profile_version(user)
+            return Response([self.get_serializer(user).data])
+        return super().list(request, *args, **kwargs)
     
     def get_queryset(self):
         # Return only the logged-in user's profile
@@ -159,8 +179,10 @@ class UserUpdateViewSet(viewsets.ModelViewSet):
         
         **Features:**
         - Update first name, last name, email, and profile image
-        - Automatically deletes old profile image when uploading new one
-        - Supports partial updates (PATCH) or full updates (PUT)
+        - Images are processed in the background: the response is `202 Accepted`
+          with `image_status` and `image_upload_id`; 64/256/1024px WebP versions
+          (metadata stripped) replace the old image once processing finishes
+        - Supports partial updates (PATCH)
         
         **Important:**
         - Use `multipart/form-data` content type for image uploads
@@ -191,6 +213,7 @@ class UserUpdateViewSet(viewsets.ModelViewSet):
         request=UserUpdateSerializer,
         responses={
             200: UserUpdateSerializer,
+            202: OpenApiTypes.OBJECT,
             400: OpenApiTypes.OBJECT,
             404: OpenApiTypes.OBJECT,
         },
@@ -209,40 +232,43 @@ class UserUpdateViewSet(viewsets.ModelViewSet):
     )
     
     def partial_update(self, request, *args, **kwargs):
+        kwargs['partial'] = True
+        return self.update(request, *args, **kwargs)
 
-        
-
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
         instance = self.get_object()
-        old_image = instance.image  
-        
-        # Validate first
-        serializer = self.get_serializer(instance, data=request.data, partial=kwargs.get('partial', False))
+        upload = request.FILES.get('image')
+
+        # The image is processed by the process_images worker, for PUT as for
+        # PATCH; everything else is validated and saved here.
+        data = {key: value for key, value in request.data.items() if key != 'image'}
+        serializer = self.get_serializer(instance, data=data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        
-        
+
+        if upload is not None and upload.size > MAX_UPLOAD_BYTES:
+            return Response({"image": [f"Image must be at most {MAX_UPLOAD_BYTES // (1024 * 1024)}MB."]}, status=status.HTTP_400_BAD_REQUEST)
+
         serializer.save()
-        
-        # Delete old image AFTER saving new one
-        if 'image' in request.data and old_image:
-            if os.path.isfile(old_image.path):
-                try:
-                    os.remove(old_image.path)
-                except:
-                    pass  
-        
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+        if upload is None:
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+        job = stage_upload(instance, upload)
+        return Response({**serializer.data, "image_status": job.status, "image_upload_id": job.id}, status=status.HTTP_202_ACCEPTED)
     
 
 class PasswordChangeViewSet(viewsets.GenericViewSet):
     queryset = User.objects.all()
     serializer_class = PasswordChangeSerializer
-    permission_classes = [AllowAny] 
+    permission_classes = [IsAuthenticated] 
 
 
     @extend_schema(
         summary="Change user password",
         description="""
-        Change the password for a user account.
+        Change the password for a user account. Only the account owner may
+        change it, with a valid access token.
         
         **Process:**
         1. User provides new password and confirmation
@@ -267,36 +293,35 @@ class PasswordChangeViewSet(viewsets.GenericViewSet):
         
         **Common Errors:**
         - Passwords don't match
+        - 403 when the account is not the caller's own
         """,
         request=PasswordChangeSerializer,
         responses={
             200: OpenApiTypes.OBJECT,
             400: OpenApiTypes.OBJECT,
+            401: OpenApiTypes.OBJECT,
+            403: OpenApiTypes.OBJECT,
             404: OpenApiTypes.OBJECT,
         }
     )
 
     def create(self, request, *args, **kwargs):
+        # Only the account owner may change the password (as on /user/async/).
+        if request.user.pk != kwargs.get('pk'):
+            raise PermissionDenied()
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = self.get_object()
         user.set_password(serializer.validated_data['new_password'])
         user.save()
+        revoke_user_tokens(user.pk)
 
         # Sending Mail Notification
 
         email_subject = "Password Changed Mail"
-        email_body = render_to_string('pass_change_email.html',{'time': timezone.now(),'user_name':user.username,'support_email':settings.EMAIL_HOST_USER})
-
-        email = EmailMultiAlternatives(email_subject,"",from_email=settings.EMAIL_HOST_USER,to=[user.email])
-        email.attach_alternative(email_body,"text/html")
-        try:
-            email.send()
-            print(f"Email sent successfully to {user.email}")  # Check console
-            # return Response({"message": "Check Your Mail for Confirmation"}, status=status.HTTP_201_CREATED)
-        except Exception as e:
-            print(f"Email Error: {str(e)}")  # Check console
-            # return Response({"message": "User created but email failed to send", "error": str(e)}, status=status.HTTP_201_CREATED)
+        text_body, html_body = render_email('pass_change_email.html',{'time': timezone.now(),'user_name':user.username,'support_email':settings.EMAIL_HOST_USER})
+
+        enqueue_email(email_subject, [user.email], body=text_body, html_body=html_body)
         return Response({"detail": "Password changed successfully."}, status=status.HTTP_200_OK)
     
 
@@ -315,7 +340,7 @@ class ProfileDeleteViewSet(viewsets.GenericViewSet):
         1. User submits their current password
         2. Password is verified
         3. If correct, user account is permanently deleted
-        4. All associated data (profile image, etc.) is removed
+        4. All associated data (profile image, documents and their search index, etc.) is removed
         
         **Required Fields:**
         - password: User's current password for verification
@@ -351,12 +376,8 @@ class ProfileDeleteViewSet(viewsets.GenericViewSet):
 
         user = request.user
 
-        if user.image:
-            if os.path.isfile(user.image.path):
-                try:
-                    os.remove(user.image.path)
-                except:
-                    pass
+        delete_user_images(user)
+        delete_user_documents(user)
 
         user.delete()
 